@@ -1,8 +1,16 @@
-import shlex
 import regexeze_states
+import regexeze_errors
+import regexeze_cache
+import regexeze_lexer
+import regexeze_ast
 import sys
+import os
 import re
-import regexeze_argparser
+from collections import namedtuple
+from itertools import izip
+
+#an expression put aside while the nested expression it contains is parsed (see RegexezeObject.open_nested_expression)
+NestingFrame = namedtuple('NestingFrame', ['alternatives', 'group_name', 'after_or', 'n_expressions', 'nested_level'])
 
 class RegexezeObject(object):
   '''
@@ -11,18 +19,24 @@ class RegexezeObject(object):
   @type state: regexeze_states.RegexState
   @param arg_string: the input to the regex parser - should be in proper syntax
   @type arg_string: string
-  @param current_fragment: the current expr fragment being created
-  @type current_fragment: string
-  @param current_modifier: the current modifier being added to the expr
-  @type current_modifier: string
-  @param current_modifier_fragment: for multipart modifiers, the current piece of modifier being stored
-  @type current_modifier_fragment: string
-  @param ret_val: the full regex to be returned
+  @param source_segments: the pieces of input read so far, joined into arg_string when it is needed (for error reporting)
+  @type source_segments: list of string
+  @param current_node: the node of the expression being parsed (a group, or a flags or group reference node), or None
+  @type current_node: regexeze_ast.Node
+  @param current_class: the character class being parsed
+  @type current_class: regexeze_ast.CharacterClass
+  @param current_repeat: the repetition of the expression being parsed, completed with the expression when it ends, or None
+  @type current_repeat: regexeze_ast.Repeat
+  @param group_name: the name of the expression being parsed, or None
+  @type group_name: string
+  @param alternatives: the nodes of the expressions completed so far, one list per alternative (see or)
+  @type alternatives: list of list of regexeze_ast.Node
+  @param ret_val: the full regex to be returned, emitted from tree
   @type ret_val: string
-  @param approximate_location: the approximate position through the arg_string (simply for error reporting, showing where in the string the error is)
-  @type approximate_location: int
-  @param child: the child machine used to parse nested expressions
-  @type child: RegexezeObject
+  @param tree: the tree of everything parsed so far
+  @type tree: regexeze_ast.Node
+  @param token_index: the number of tokens of the input before the current token (for error reporting, see regexeze_errors.Error)
+  @type token_index: int
   @param after_or: whether the parser has hit an or (in which case it should proceed to another expression after semicolon, because that would be confusing)
   @type after_or: bool
   @param current_start_range: for character ranges, must know the start range in order to determine the order
@@ -33,29 +47,84 @@ class RegexezeObject(object):
   @type m_repetitions: int
   @param namespace: the official namespace of groups defined
   @type namespace: dict string -> string
+  @param recursive_stack: the expressions put aside while the nested expressions they contain are parsed, innermost last
+  @type recursive_stack: list of NestingFrame
+  @param nested_level: while in a nested expression, the number of square brackets opened minus the number closed (see close_nested_expression)
+  @type nested_level: int
+  @param nested_tree: the tree of the nested expression that has just ended
+  @type nested_tree: regexeze_ast.Node
+  @param max_nesting_depth: the number of levels expressions can be nested, or None for no limit (see set_max_nesting_depth)
+  @type max_nesting_depth: int
+  @param lexer: the name of the lexer used to split the input into tokens (see regexeze_lexer.LEXERS)
+  @type lexer: string
+  @param capture: whether expressions become capturing groups; if not, only named expressions capture
+  @type capture: bool
   '''
+  #one machine is made per parse, so its attributes are slots; __dict__ is only there for the class settings (CHUNK_SIZE,
+  #max_nesting_depth) overridden on a single machine, and is not allocated unless one is
+  __slots__ = ('state', 'source_segments', 'current_token', 'current_node', 'current_class', 'current_repeat', 'group_name',
+               'alternatives', 'token_index', 'after_or', 'current_start_range', 'n_expressions', 'm_repetitions',
+               'namespace', 'recursive_stack', 'nested_level', 'nested_tree', 'tokenizer', 'lexer', 'capture', '__dict__')
+
   END_OF_INPUT = 'end_of_input'
-  OPEN_PARENTHESIS = '('
-  CLOSE_PARENTHESIS = ')'
-  OR_SYMBOL = '|'
-  CLOSE_CLASS_SYMBOL = ']'
+  NESTED_OPEN_TOKEN = '['
+  NESTED_CLOSE_TOKEN = ']'
+  #tokens looked at by the machine itself while in a nested expression
+  NESTING_TOKENS = frozenset([NESTED_OPEN_TOKEN, NESTED_CLOSE_TOKEN, END_OF_INPUT])
+  #size of the pieces of input handed to the lexer when reading from a file or stdin
+  CHUNK_SIZE = 1 << 18
+  DEFAULT_MAX_NESTING_DEPTH = 1000
+  max_nesting_depth = DEFAULT_MAX_NESTING_DEPTH
 
-  def __init__(self, arg_string=""):
-    self.state = regexeze_states.NewExpression()
+  def __init__(self, arg_string="", lexer=regexeze_lexer.DEFAULT_LEXER, capture=True):
+    self.lexer = lexer
+    self.capture = capture
+    self.reset(arg_string)
+
+  def reset(self, arg_string=""):
+    '''
+    Return the machine to its initial state, ready to parse a new input
+    @param arg_string: the new input to the regex parser
+    @type arg_string: string
+    '''
+    self.state = regexeze_states.RegexStateFactory.STATE_DICTIONARY[regexeze_states.RegexState.NEW_EXPRESSION]
     self.arg_string = arg_string
-    self.current_fragment = ""
-    self.current_modifier = ""
-    self.current_modifier_fragment = ""
-    self.ret_val = ""
-    self.approximate_location = 0
+    self.current_node = None
+    self.current_class = None
+    self.current_repeat = None
+    self.group_name = None
+    #a fresh list, as the tree of the previous input may still be in use
+    self.alternatives = [[]]
+    self.token_index = 0
     self.recursive_stack = []
     self.tokenize(self.arg_string)
-    self.child = None
     self.after_or = False
     self.n_expressions = 0
     self.current_start_range = ""
     self.m_repetitions = 0
     self.namespace = {}
+    self.nested_level = 0
+    self.nested_tree = None
+
+  @property
+  def arg_string(self):
+    if len(self.source_segments) > 1:
+      self.source_segments = [''.join(self.source_segments)]
+    return self.source_segments[0]
+
+  @arg_string.setter
+  def arg_string(self, arg_string):
+    self.source_segments = [arg_string]
+
+  @property
+  def tree(self):
+    if len(self.alternatives) == 1:
+      return regexeze_ast.Sequence(self.alternatives[0])
+    return regexeze_ast.Alternation([regexeze_ast.Sequence(alternative) for alternative in self.alternatives])
+
+  @property
+  def ret_val(self):
+    return regexeze_ast.emit(self.tree)
 
   def parse(self, source=""):
    '''
@@ -65,83 +134,829 @@ class RegexezeObject(object):
    '''
    #stdin
    if source == sys.stdin:
-     for line in sys.stdin:
-       self.arg_string += line
-       self.tokenize(line)
-       for token in self.tokenizer:
-         self.process_token(token)
-     self.end()
+     self.parse_lines(sys.stdin)
    #file
    elif source != "":
      with open(source) as input_file:
-       for line in input_file:
-         self.arg_string += line
-         self.tokenize(line)
-         for token in self.tokenizer:
-           self.process_token(token)
-     self.end()
+       self.parse_lines(input_file)
    #arg string
    else:
-     for token in self.tokenizer:
-       self.process_token(token)
+     self.process_tokens(self.tokenizer)
      self.end()
 
+  def parse_lines(self, lines):
+    '''
+    Parses input read line by line (tokens do not span lines), as from stdin or a file
+    Lines are gathered into chunks of about CHUNK_SIZE, each split into tokens in one go, so that input of any size is parsed in linear time
+    @param lines: the lines of input, with their line endings
+    @type lines: iterable of string
+    '''
+    line_lexer = regexeze_lexer.LINE_LEXERS[self.lexer]
+    chunk = []
+    chunk_size = 0
+    for line in lines:
+      chunk.append(line)
+      chunk_size += len(line)
+      if chunk_size >= self.CHUNK_SIZE:
+        self.process_chunk(''.join(chunk), line_lexer)
+        chunk = []
+        chunk_size = 0
+    if chunk:
+      self.process_chunk(''.join(chunk), line_lexer)
+    self.end()
+
+  def process_chunk(self, chunk, line_lexer):
+    '''
+    Runs the machine over a chunk of lines of input
+    @param chunk: whole lines of input
+    @type chunk: string
+    @param line_lexer: the lexer class splitting the chunk into tokens
+    @type line_lexer: type
+    '''
+    self.source_segments.append(chunk)
+    self.tokenizer = line_lexer(chunk)
+    self.process_tokens(self.tokenizer)
+
   def tokenize(self, input):
-    self.tokenizer = shlex.shlex(input, posix=True)
+    self.tokenizer = regexeze_lexer.LEXERS[self.lexer](input)
 
   def process_token(self, token):
-    self.current_token = token
-    self.state = regexeze_states.RegexStateFactory.get_next_state(self.state, token)
-    self.state.do_action(self)
-    if token != self.END_OF_INPUT:
-      self.approximate_location += len(token)
+    self.process_tokens((token,))
+
+  def process_tokens(self, tokens):
+    '''
+    Runs the machine over a sequence of tokens
+    Each token is a lookup in the transition table (see regexeze_states.TransitionTable.get_next_state) followed by the
+    action of the next state
+    @param tokens: the tokens to be processed
+    @type tokens: iterable of str
+    '''
+    table = regexeze_states.TRANSITION_TABLE
+    #bound once, not looked up for every token
+    get_next_state = table.get_next_state
+    actions = table.actions
+    nesting_tokens = self.NESTING_TOKENS
+    recursive_stack = self.recursive_stack
+    state = self.state
+    try:
+      for token in tokens:
+        self.current_token = token
+        if recursive_stack and token in nesting_tokens:
+          #brackets are counted to find the one closing the innermost nested expression
+          if token == self.NESTED_OPEN_TOKEN:
+            self.nested_level += 1
+          elif token == self.END_OF_INPUT:
+            self.state = regexeze_states.RegexStateFactory.STATE_DICTIONARY[regexeze_states.RegexState.UNCLOSED_BRACKET_ERROR_STATE]
+            self.state.do_action(self)
+          elif self.nested_level > recursive_stack[-1].nested_level:
+            self.nested_level -= 1
+          else:
+            self.close_nested_expression()
+            state = self.state
+            self.token_index += 1
+            continue
+        self.state = state = get_next_state(state, token, self)
+        action = actions[state.state_id]
+        if action is not None:
+          action(self)
+        self.token_index += 1
+    except regexeze_lexer.LexerError as error:
+      #a quote left open is a syntax error of the pattern, reported as the others are
+      raise regexeze_errors.QuotationError(self, error)
 
   def end(self):
     self.process_token(self.END_OF_INPUT)
 
-  def add_current_fragment(self):
-    self.ret_val += self.current_fragment + self.CLOSE_PARENTHESIS + self.current_modifier
-    self.current_fragment = ''
-    self.current_modifier = ''
-    self.OPEN_PARENTHESIS = '('
+  def open_nested_expression(self):
+    '''
+    Put the expression being parsed aside on the stack, to parse the expressions of the nested expression it contains
+    The machine then carries on as at the start of a pattern, so each token is processed once however deep the nesting
+    '''
+    self.recursive_stack.append(NestingFrame(self.alternatives, self.group_name, self.after_or, self.n_expressions, self.nested_level))
+    self.alternatives = [[]]
+    self.group_name = None
+    self.after_or = False
+    self.n_expressions = 0
+
+  def close_nested_expression(self):
+    '''
+    End the innermost nested expression at its closing bracket, and carry on with the expression put aside for it
+    The expressions inside the brackets must be complete, as at the end of the input
+    '''
+    self.state = regexeze_states.TRANSITION_TABLE.get_next_state(self.state, self.END_OF_INPUT, self)
+    self.state.do_action(self)
+    self.nested_tree = self.tree
+    frame = self.recursive_stack.pop()
+    self.alternatives = frame.alternatives
+    self.group_name = frame.group_name
+    self.after_or = frame.after_or
+    self.n_expressions = frame.n_expressions
+    self.current_repeat = None
+    #the closing bracket matches the opening one, which the enclosing nested expression (if any) counted
+    self.nested_level -= 1
+    self.state = regexeze_states.RegexStateFactory.STATE_DICTIONARY[regexeze_states.RegexState.END_NESTED_EXPRESSION]
+    self.state.do_action(self)
+
+  def add_current_expression(self):
+    '''
+    Adds the expression being parsed, with its repetition if any, to the current alternative
+    '''
+    node = self.current_node
+    if self.current_repeat is not None:
+      self.current_repeat.node = node
+      node = self.current_repeat
+    self.alternatives[-1].append(node)
+    self.current_node = None
+    self.current_repeat = None
+    self.group_name = None
 
   def add_or(self):
-    self.ret_val += self.OR_SYMBOL
+    self.alternatives.append([])
+
+  def set_group(self, body):
+    '''
+    Makes the current expression a group around body, named if a name was given, capturing if the machine captures
+    @param body: the content of the group
+    @type body: regexeze_ast.Node
+    '''
+    self.current_node = regexeze_ast.Group(body, self.group_name, self.capture)
 
   def process_current_token_as_plain_text(self):
     '''
-    Sets the current fragment to an open parenthesis followed by the current token
+    Makes the current expression a group around the current token as text
     '''
-    self.current_fragment = self.OPEN_PARENTHESIS + re.escape(self.current_token)
+    self.set_group(regexeze_ast.Literal(self.current_token))
+
+class RegexezePattern(object):
+  '''
+  A compiled regexeze pattern, mirroring the compiled pattern objects of the re module
+  Only the translation is kept, not the parser that produced it. The regular expression is only compiled by the re module
+  the first time the pattern is used (see regex), so patterns which are never used cost little more than their translation
+  @param pattern: the translated pattern, in standard Python regex syntax
+  @type pattern: str
+  @param flags: flags from the re module the pattern is compiled with
+  @type flags: int
+  @param namespace: the group names defined by the pattern
+  @type namespace: dict string -> string
+  @param compiled_regex: the compiled regular expression, or None until the pattern is first used
+  @type compiled_regex: re.RegexObject
+  @param fullmatch_regex: the pattern anchored at the end, compiled the first time fullmatch is called
+  @type fullmatch_regex: re.RegexObject
+  @param required_literals: text every match contains (see regexeze_ast.required_literals): strings lacking any of it
+  are rejected with str.find, without running the regex
+  @type required_literals: tuple of str
+  '''
+  __slots__ = ('pattern', 'flags', 'namespace', 'compiled_regex', 'fullmatch_regex', 'required_literals')
+
+  FULLMATCH_FORMAT = '(?:{0})\\Z'
+
+  def __init__(self, pattern="", namespace=None, flags=0, required_literals=()):
+    self.pattern = pattern
+    self.flags = flags
+    self.namespace = dict(namespace or {})
+    self.compiled_regex = None
+    self.fullmatch_regex = None
+    #literals ignoring case match other text than their own
+    self.required_literals = () if flags & re.IGNORECASE else tuple(required_literals)
+    _usage.add_created()
+
+  def __repr__(self):
+    return 'regexeze.RegexezePattern({0!r})'.format(self.pattern)
+
+  @property
+  def regex(self):
+    '''
+    The compiled regular expression, compiled when it is first needed
+    Regular expressions are shared through the pattern cache, so that patterns with the same translation and flags are compiled once
+    @rtype: re.RegexObject
+    '''
+    regex = self.compiled_regex
+    if regex is None:
+      key = ('regex', self.pattern, self.flags)
+      regex = _cache.get(key)
+      if regex is None:
+        regex = re.compile(self.pattern, self.flags)
+        _cache.put(key, regex)
+      self.compiled_regex = regex
+      _usage.add_compiled()
+    return regex
+
+  @property
+  def groups(self):
+    return self.regex.groups
+
+  @property
+  def groupindex(self):
+    return self.regex.groupindex
+
+  def rejects(self, string, pos=0, endpos=None):
+    '''
+    Tell whether string (between pos and endpos, as in re) lacks text every match contains, so that the pattern can not match in it
+    Strings which can not be looked through for the text (unicode strings, with text which is not ASCII) are never rejected
+    @rtype: bool
+    '''
+    try:
+      endpos = len(string) if endpos is None else max(endpos, 0)
+      return regexeze_ast.missing_literal(string, self.required_literals, max(pos, 0), endpos)
+    except (AttributeError, TypeError, UnicodeError):
+      return False
+
+  def match(self, string, *args):
+    '''
+    Match the pattern at the start of string (optionally between pos and endpos, as in re)
+    @rtype: re.MatchObject
+    '''
+    if self.required_literals and self.rejects(string, *args):
+      return None
+    return self.regex.match(string, *args)
+
+  def search(self, string, *args):
+    '''
+    Search string for the first location the pattern matches
+    @rtype: re.MatchObject
+    '''
+    if self.required_literals and self.rejects(string, *args):
+      return None
+    return self.regex.search(string, *args)
+
+  def fullmatch(self, string, *args):
+    '''
+    Match the pattern against the whole of string
+    @rtype: re.MatchObject
+    '''
+    if self.required_literals and self.rejects(string, *args):
+      return None
+    if self.fullmatch_regex is None:
+      self.fullmatch_regex = re.compile(self.FULLMATCH_FORMAT.format(self.pattern), self.flags)
+    return self.fullmatch_regex.match(string, *args)
+
+  def finditer(self, string, *args):
+    '''
+    @return: an iterator over all non-overlapping matches in string
+    @rtype: iterator of re.MatchObject
+    '''
+    if self.required_literals and self.rejects(string, *args):
+      return iter(())
+    return self.regex.finditer(string, *args)
+
+  def findall(self, string, *args):
+    '''
+    @return: all non-overlapping matches in string, as re.findall
+    @rtype: list
+    '''
+    if self.required_literals and self.rejects(string, *args):
+      return []
+    return self.regex.findall(string, *args)
+
+  def sub(self, repl, string, count=0):
+    '''
+    @return: string with the matches of the pattern replaced by repl
+    @rtype: str
+    '''
+    return self.regex.sub(repl, string, count)
+
+  def split(self, string, maxsplit=0):
+    '''
+    @return: string split by the matches of the pattern
+    @rtype: list
+    '''
+    if self.required_literals and self.rejects(string):
+      return [string]
+    return self.regex.split(string, maxsplit)
+
+#rules of a RuleSet merged into regexes: one finding the places where any of them matches, one telling which of them match there
+#(by the names of the groups it sets), and the index of each rule
+Shard = namedtuple('Shard', ['regex', 'lookaheads', 'indices'])
+
+class RuleSet(object):
+  '''
+  Many patterns (rules) searched for together, telling which of them fire on each string
+  Rules are translated once, without capturing unnamed expressions. A rule whose matches all contain a literal of GRAM_SIZE
+  characters or more (see regexeze_ast.required_literals) is only searched for in strings containing one of its grams (a substring of
+  that many characters of the literal), looked up from the grams of the string, so most strings are rejected without running its regex. The other rules are merged into
+  shards of up to shard_size rules, each searched for with a single regex of the rules as alternatives. Where it matches, a second regex of
+  the shard, made of one optional lookahead per rule, tells every rule matching there by the names of the groups it set; the first regex
+  then looks for the next place a rule matches. So every rule of the shard that fires is found, rules matching at the same place or with
+  overlapping matches included, at the cost of trying every rule of the shard at each place one of them matches
+  Rules with flags or named groups of their own can not be merged, and are always searched for on their own
+  @param rule_ids: the id of each rule, in order
+  @type rule_ids: list
+  @param rules: the compiled pattern of each rule, whose regex is only compiled when the rule is searched for on its own
+  @type rules: list of RegexezePattern
+  @param gram_index: the rules to search for when a string contains a gram, by gram
+  @type gram_index: dict str -> list of int
+  @param shards: the merged regexes
+  @type shards: list of Shard
+  @param unmerged: the rules which are always searched for on their own
+  @type unmerged: list of int
+  '''
+  GRAM_SIZE = 4
+  #Python 2 regexes can not hold more than 99 groups
+  MAX_SHARD_SIZE = 99
+  #each alternative ends with an empty group naming its rule: alternatives starting with a character or a class
+  #are then skipped by the regex engine without entering them
+  SHARD_ALTERNATIVE_FORMAT = '(?:{1})(?P<_rule{0}>)'
+  #each lookahead sets the group naming its rule if the rule matches where the regex is matched, and is skipped otherwise
+  SHARD_LOOKAHEAD_FORMAT = '(?:(?=(?:{1})(?P<_rule{0}>)))?'
+  SHARD_GROUP_PREFIX_SIZE = len('_rule')
+  #inline flags, which would apply to the whole of a shard: rules whose translation holds them are checked by compiling them
+  INLINE_FLAGS_REGEX = re.compile(r'\(\?[iLmsux]+\)')
+
+  def __init__(self, rules, flags=0, shard_size=MAX_SHARD_SIZE, workers=None, optimize=False):
+    '''
+    @param rules: the rules, in regexeze syntax, by id (in order, given as a sequence of pairs)
+    @type rules: dict or iterable of tuple (rule id, str)
+    @param flags: flags from the re module to compile the rules with
+    @type flags: int
+    @param shard_size: the greatest number of rules merged into one regex (at most MAX_SHARD_SIZE)
+    @type shard_size: int
+    @param workers: the number of worker processes to translate the rules with, or None to translate them in this process
+    @type workers: int
+    @param optimize: whether to simplify the translated rules, and the regexes searching for the rules of each shard
+    (see regexeze_optimizer.optimize)
+    @type optimize: bool
+    @raise regexeze_errors.Error: the error raised by the first rule with invalid syntax, with the index of the rule in its index attribute
+    '''
+    if isinstance(rules, dict):
+      rules = rules.items()
+    self.rule_ids = []
+    patterns = []
+    for rule_id, pattern in rules:
+      self.rule_ids.append(rule_id)
+      patterns.append(pattern)
+    self.rules = []
+    for result in _parse_batch(patterns, workers, capture=False, optimize=optimize):
+      if isinstance(result, regexeze_errors.Error):
+        raise result
+      self.rules.append(RegexezePattern(result[0], result[1], flags, result[2]))
+    self.gram_index = {}
+    self.shards = []
+    self.unmerged = []
+    mergeable = []
+    rule_grams = [self.literal_grams(rule.required_literals) for rule in self.rules]
+    gram_counts = {}
+    for grams in rule_grams:
+      for gram in grams:
+        gram_counts[gram] = gram_counts.get(gram, 0) + 1
+    for index, grams in enumerate(rule_grams):
+      if grams:
+        #the gram the fewest rules share
+        gram = min(grams, key=gram_counts.get)
+        self.gram_index.setdefault(gram, []).append(index)
+      elif self.rules[index].namespace or self.sets_flags(self.rules[index]):
+        #unnamed expressions do not capture, so only named ones make groups
+        self.unmerged.append(index)
+      else:
+        mergeable.append(index)
+    shard_size = max(1, min(shard_size, self.MAX_SHARD_SIZE))
+    #rules alike end up in the same shards, where the optimizer (if asked) matches what they start with once for all of them
+    mergeable.sort(key=lambda index: self.rules[index].pattern)
+    for start in xrange(0, len(mergeable), shard_size):
+      indices = mergeable[start:start + shard_size]
+      merged = '|'.join(self.SHARD_ALTERNATIVE_FORMAT.format(index, self.rules[index].pattern) for index in indices)
+      lookaheads = ''.join(self.SHARD_LOOKAHEAD_FORMAT.format(index, self.rules[index].pattern) for index in indices)
+      self.shards.append(Shard(re.compile(_optimize(merged) if optimize else merged, flags), re.compile(lookaheads, flags), indices))
+
+  def __len__(self):
+    return len(self.rule_ids)
+
+  def sets_flags(self, rule):
+    '''
+    @return: whether a rule sets flags of its own
+    @rtype: bool
+    '''
+    return self.INLINE_FLAGS_REGEX.search(rule.pattern) is not None and rule.regex.flags & ~rule.flags != 0
+
+  def literal_grams(self, literals):
+    '''
+    @return: the grams of the literals a rule requires, any of which a string must contain for the rule to fire
+    @rtype: set of str
+    '''
+    grams = set()
+    for literal in literals:
+      grams |= self.grams(literal)
+    return grams
+
+  def grams(self, text):
+    '''
+    @return: the substrings of GRAM_SIZE characters of text
+    @rtype: set of str
+    '''
+    size = self.GRAM_SIZE
+    return set(text[start:start + size] for start in xrange(len(text) - size + 1))
+
+  def search_indices(self, string):
+    '''
+    @return: the index of every rule that fires on string, in order
+    @rtype: list of int
+    '''
+    fired = []
+    rules = self.rules
+    if self.gram_index:
+      gram_index = self.gram_index
+      for gram in self.grams(string):
+        indices = gram_index.get(gram)
+        if indices is not None:
+          for index in indices:
+            if rules[index].search(string):
+              fired.append(index)
+    prefix_size = self.SHARD_GROUP_PREFIX_SIZE
+    for shard in self.shards:
+      search = shard.regex.search
+      match = search(string)
+      if match is None:
+        continue
+      fired_names = set()
+      n_rules = len(shard.indices)
+      while match is not None:
+        #no rule matches between the places the first regex matches at
+        position = match.start()
+        for name, value in shard.lookaheads.match(string, position).groupdict().iteritems():
+          if value is not None:
+            fired_names.add(name)
+        if len(fired_names) == n_rules or position >= len(string):
+          break
+        match = search(string, position + 1)
+      fired.extend(int(name[prefix_size:]) for name in fired_names)
+    for index in self.unmerged:
+      if rules[index].search(string):
+        fired.append(index)
+    fired.sort()
+    return fired
+
+  def search(self, string):
+    '''
+    Tell which rules fire on a string, that is which of them regexeze.search would find in it
+    @param string: the string to be searched
+    @type string: str
+    @return: the id of every rule that fires, in the order of the rules
+    @rtype: list
+    '''
+    rule_ids = self.rule_ids
+    return [rule_ids[index] for index in self.search_indices(string)]
+
+class RulePack(object):
+  '''
+  The rules of a pack written by build_pack, looked up by id
+  The pack holds everything needed to compile the rules, so loading it parses nothing; the pattern of a rule is made the first time
+  it is looked up, and its regex compiled by the re module the first time it is used, so processes only compile the rules they use
+  @param rule_ids: the id of each rule, in order
+  @type rule_ids: list of str
+  @param patterns: the translation of each rule
+  @type patterns: list of str
+  @param flags: the flags from the re module each rule is compiled with
+  @type flags: list of int
+  @param namespaces: the group names each rule defines, or None if it defines none
+  @type namespaces: list of dict string -> string
+  @param required_literals: the text every match of each rule contains
+  @type required_literals: list of tuple of str
+  @param sources: the pattern file each rule was translated from
+  @type sources: list of str
+  @param version: the version of the translator that built the pack
+  @type version: str
+  @param indices: the index of each rule, by id
+  @type indices: dict str -> int
+  @param compiled: the rules compiled so far, by index
+  @type compiled: dict int -> RegexezePattern
+  '''
+  def __init__(self, rule_ids, patterns, flags, namespaces, required_literals, sources, version=None):
+    self.rule_ids = rule_ids
+    self.patterns = patterns
+    self.flags = flags
+    self.namespaces = namespaces
+    self.required_literals = required_literals
+    self.sources = sources
+    self.version = version
+    self.indices = dict(izip(rule_ids, xrange(len(rule_ids))))
+    self.compiled = {}
+
+  def __len__(self):
+    return len(self.rule_ids)
+
+  def __iter__(self):
+    return iter(self.rule_ids)
+
+  def __contains__(self, rule_id):
+    return rule_id in self.indices
+
+  def __getitem__(self, rule_id):
+    '''
+    @return: the compiled pattern of a rule
+    @rtype: RegexezePattern
+    @raise KeyError: no rule has that id
+    '''
+    return self.pattern(self.indices[rule_id])
+
+  def pattern(self, index):
+    '''
+    @return: the compiled pattern of the rule at index, made the first time it is asked for
+    @rtype: RegexezePattern
+    '''
+    compiled = self.compiled.get(index)
+    if compiled is None:
+      compiled = RegexezePattern(self.patterns[index], self.namespaces[index], self.flags[index], self.required_literals[index])
+      self.compiled[index] = compiled
+    return compiled
+
+  def source(self, rule_id):
+    '''
+    @return: the pattern file a rule was translated from
+    @rtype: str
+    '''
+    return self.sources[self.indices[rule_id]]
+
+  def unused(self):
+    '''
+    @return: the number of rules never used, whose regex was never compiled
+    @rtype: int
+    '''
+    return len(self.rule_ids) - sum(1 for compiled in self.compiled.itervalues() if compiled.compiled_regex is not None)
+
+#the version of the translator, which invalidates the disk cache when it changes
+__version__ = '0.3.0'
+
+#cache shared by the wrapper methods below, keyed on pattern text (and flags, for compiled patterns)
+_cache = regexeze_cache.PatternCache()
+
+#how many compiled patterns were created, and how many of them were used (see pattern_info)
+_usage = regexeze_cache.PatternUsage()
+
+#optional persistent cache for patterns read from files, keyed on file content (see set_disk_cache)
+_disk_cache = None
+DISK_CACHE_VARIABLE = 'REGEXEZE_CACHE_DIR'
+
+def _optimize(translation):
+  '''
+  @return: a translated pattern, simplified (see regexeze_optimizer.optimize)
+  @rtype: str
+  '''
+  #imported here, only optimized patterns need it
+  import regexeze_optimizer
+  return regexeze_optimizer.optimize(translation)
+
+def _result(regexezeObject, optimize=False, literals=True):
+  '''
+  @param literals: whether to look for the text every match contains, which takes about as long as writing out the translation
+  @type literals: bool
+  @return: the translation of a parser machine that has reached the end of its input (optimized if asked), the group names it defines,
+  and the text every match contains (see regexeze_ast.required_literals), or nothing if not asked for
+  @rtype: tuple (str, dict string -> string, tuple of str)
+  '''
+  #the tree is made anew each time it is asked for
+  tree = regexezeObject.tree
+  translation = regexeze_ast.emit(tree)
+  if optimize:
+    translation = _optimize(translation)
+  return translation, regexezeObject.namespace, regexeze_ast.required_literals(tree) if literals else ()
+
+def _file_translation(filename, capture=True, optimize=False):
+  '''
+  Parse a pattern file, through the disk cache if there is one
+  @rtype: tuple (str, dict string -> string, tuple of str)
+  '''
+  regexezeObject = RegexezeObject(capture=capture)
+  if _disk_cache is None:
+    regexezeObject.parse(filename)
+    return _result(regexezeObject, optimize)
+  with open(filename) as input_file:
+    content = input_file.read()
+  key = _disk_cache.key(content, capture, optimize)
+  translation = _disk_cache.get(key)
+  if translation is None:
+    regexezeObject.parse_lines(content.splitlines(True))
+    translation = _result(regexezeObject, optimize)
+    _disk_cache.put(key, translation)
+  return translation
+
+def _translation(pattern="", source="", capture=True, optimize=False):
+  '''
+  Parse a pattern, returning its translation, the group names it defines and the text every match contains
+  Patterns given as strings are cached in memory, patterns read from a file only in the disk cache (if enabled),
+  and patterns read from stdin are always parsed
+  @rtype: tuple (str, dict string -> string, tuple of str)
+  '''
+  if source == sys.stdin:
+    regexezeObject = RegexezeObject(pattern, capture=capture)
+    regexezeObject.parse(source)
+    return _result(regexezeObject, optimize)
+  if source != "":
+    return _file_translation(source, capture, optimize)
+  key = ('translate', pattern, capture, optimize)
+  translation = _cache.get(key)
+  if translation is None:
+    regexezeObject = RegexezeObject(pattern, capture=capture)
+    regexezeObject.parse()
+    translation = _result(regexezeObject, optimize)
+    _cache.put(key, translation)
+  return translation
 
 #wrapper methods that produce same functionality as python re module, only with regexeze syntax
-def compile(pattern="", source=""):
+def compile(pattern="", source="", flags=0, capture=True, optimize=False):
   '''
-  Compile a regexeze expression into a regexeze object
+  Compile a regexeze expression into a regexeze pattern
   @param pattern: the pattern, in regexeze syntax, to be compiled
   @type pattern: str
-  @return: the compiled regexeze object
-  @rtype: RegexezeObject
   @param source: the source of the pattern - filename, stdin, or blank meaning the pattern string
   @type source: str
+  @param flags: flags from the re module to compile the translated pattern with
+  @type flags: int
+  @param capture: whether every expression is a capturing group; if False, only named expressions are (which makes matching faster)
+  @type capture: bool
+  @param optimize: whether to simplify the translated pattern before compiling it (see regexeze_optimizer.optimize)
+  @type optimize: bool
+  @return: the compiled regexeze pattern
+  @rtype: RegexezePattern
+  '''
+  if source != "":
+    translation, namespace, required_literals = _translation(pattern, source, capture, optimize)
+    return RegexezePattern(translation, namespace, flags, required_literals)
+  key = ('compile', pattern, flags, capture, optimize)
+  compiled = _cache.get(key)
+  if compiled is None:
+    translation, namespace, required_literals = _translation(pattern, capture=capture, optimize=optimize)
+    compiled = RegexezePattern(translation, namespace, flags, required_literals)
+    _cache.put(key, compiled)
+  return compiled
+
+def _parse_many(patterns, start=0, capture=True, optimize=False, literals=True):
+  '''
+  Parse many patterns with a single parser machine, which is reset between patterns instead of being rebuilt
+  Errors are given the index of the pattern that raised them (counting from start)
+  @rtype: iterator of tuple (str, dict string -> string, tuple of str), or regexeze_errors.Error for the patterns that failed
+  '''
+  regexezeObject = RegexezeObject(capture=capture)
+  for index, pattern in enumerate(patterns, start):
+    regexezeObject.reset(pattern)
+    try:
+      regexezeObject.parse()
+    except regexeze_errors.Error as error:
+      error.index = index
+      yield error
+    else:
+      yield _result(regexezeObject, optimize, literals)
+
+def _parse_chunk(chunk):
+  '''
+  Parse a chunk of patterns in a worker process
+  @param chunk: the index of the first pattern of the chunk, the patterns, whether expressions capture, whether to optimize,
+  and whether to look for required literals
+  @type chunk: tuple (int, list of str, bool, bool, bool)
+  @rtype: list
+  '''
+  start, patterns, capture, optimize, literals = chunk
+  return list(_parse_many(patterns, start, capture, optimize, literals))
+
+#chunks per worker when the chunk size is not given: large enough to amortize sending them to the workers,
+#small enough to balance the load between workers
+CHUNKS_PER_WORKER = 4
+
+def _parse_parallel(patterns, workers, chunksize=None, capture=True, optimize=False, literals=True):
+  '''
+  Parse many patterns, in chunks, across a pool of worker processes
+  @rtype: iterator of the results of _parse_many, in the order of the patterns
+  '''
+  patterns = list(patterns)
+  if chunksize is None:
+    chunksize = max(1, -(-len(patterns) // (workers * CHUNKS_PER_WORKER)))
+  chunks = [(start, patterns[start:start + chunksize], capture, optimize, literals) for start in xrange(0, len(patterns), chunksize)]
+  #imported here, only parsing across processes needs it
+  import multiprocessing
+  pool = multiprocessing.Pool(workers)
+  try:
+    for results in pool.imap(_parse_chunk, chunks):
+      for result in results:
+        yield result
+  finally:
+    pool.terminate()
+    pool.join()
+
+def _parse_batch(patterns, workers=None, chunksize=None, capture=True, optimize=False, literals=True):
+  '''
+  Parse many patterns, in this process or across worker processes
+  @rtype: iterator of the results of _parse_many, in the order of the patterns
+  '''
+  if workers is None:
+    return _parse_many(patterns, capture=capture, optimize=optimize, literals=literals)
+  return _parse_parallel(patterns, workers, chunksize, capture, optimize, literals)
+
+def translate_many(patterns, workers=None, chunksize=None, capture=True, optimize=False):
   '''
-  regexezeObject = RegexezeObject(pattern)
-  regexezeObject.parse(source)
-  return regexezeObject
+  Translate many patterns in one call, about 1.5 times as fast as calling translate for each of them: the machine is reused, the cache
+  skipped, and no required literals are looked for, but every pattern is still parsed (see workers, and build_pack for cold starts)
+  Errors do not stop the batch: the error raised by a pattern takes the place of its translation, with the index of the pattern in its index attribute
+  The pattern cache is neither used nor filled
+  @param patterns: the patterns, in regexeze syntax, to be translated
+  @type patterns: iterable of str
+  @param workers: the number of worker processes to translate with, or None to translate in this process
+  @type workers: int
+  @param chunksize: with workers, the number of patterns sent to a worker at a time (by default, each worker gets about four chunks)
+  @type chunksize: int
+  @param capture: whether every expression is a capturing group; if False, only named expressions are
+  @type capture: bool
+  @param optimize: whether to simplify the translated patterns (see regexeze_optimizer.optimize)
+  @type optimize: bool
+  @return: the translation of each pattern, or the regexeze_errors.Error it raised, in order
+  @rtype: list
+  '''
+  #translations need no required literals
+  return [result if isinstance(result, regexeze_errors.Error) else result[0]
+          for result in _parse_batch(patterns, workers, chunksize, capture, optimize, literals=False)]
+
+def compile_many(patterns, flags=0, workers=None, chunksize=None, capture=True, optimize=False):
+  '''
+  Compile many patterns in one call, faster than calling compile for each of them: the machine is reused and the cache skipped,
+  but every pattern is still parsed (see workers, and build_pack for cold starts)
+  Errors do not stop the batch: the error raised by a pattern takes the place of its compiled pattern, with the index of the pattern in its index attribute
+  The pattern cache is neither used nor filled
+  @param patterns: the patterns, in regexeze syntax, to be compiled
+  @type patterns: iterable of str
+  @param flags: flags from the re module to compile the translated patterns with
+  @type flags: int
+  @param workers: the number of worker processes to translate with, or None to translate in this process (patterns are always compiled in this process)
+  @type workers: int
+  @param chunksize: with workers, the number of patterns sent to a worker at a time (by default, each worker gets about four chunks)
+  @type chunksize: int
+  @param capture: whether every expression is a capturing group; if False, only named expressions are
+  @type capture: bool
+  @param optimize: whether to simplify the translated patterns (see regexeze_optimizer.optimize)
+  @type optimize: bool
+  @return: the compiled pattern for each pattern, or the regexeze_errors.Error it raised, in order
+  @rtype: list
+  '''
+  return [result if isinstance(result, regexeze_errors.Error) else RegexezePattern(result[0], result[1], flags, result[2])
+          for result in _parse_batch(patterns, workers, chunksize, capture, optimize)]
+
+def build_pack(paths, output, flags=0, capture=True, optimize=False):
+  '''
+  Translate pattern files into a pack, from which processes load the rules with load_pack instead of translating the files again
+  Files are translated through the disk cache, if there is one
+  @param paths: pattern files, and directories searched for pattern files (see regexeze_pack.find_sources for the ids of their rules)
+  @type paths: list of str
+  @param output: the name of the pack written
+  @type output: str
+  @param flags: flags from the re module to compile the rules with
+  @type flags: int
+  @param capture: whether every expression is a capturing group; if False, only named expressions are
+  @type capture: bool
+  @param optimize: whether to simplify the translated patterns (see regexeze_optimizer.optimize)
+  @type optimize: bool
+  @return: the number of rules in the pack
+  @rtype: int
+  @raise regexeze_errors.Error: the error raised by the first pattern file with invalid syntax, with the index of its rule in its index attribute
+  and the name of the file in its source attribute
+  @raise regexeze_pack.DuplicateRuleError: two pattern files stand for the same rule
+  '''
+  #imported here, only packs need it
+  import regexeze_pack
+  columns = dict((column, []) for column in regexeze_pack.COLUMNS)
+  for index, (rule_id, source) in enumerate(regexeze_pack.find_sources(paths)):
+    try:
+      translation, namespace, required_literals = _file_translation(source, capture, optimize)
+    except regexeze_errors.Error as error:
+      error.index = index
+      error.source = source
+      raise
+    columns['ids'].append(rule_id)
+    columns['patterns'].append(translation)
+    columns['flags'].append(flags)
+    #most rules define no names, and None loads much faster than an empty dict
+    columns['namespaces'].append(namespace or None)
+    #literals ignoring case match other text than their own
+    columns['required_literals'].append(() if flags & re.IGNORECASE else required_literals)
+    columns['sources'].append(source)
+  regexeze_pack.dump(columns, output, __version__)
+  return len(columns['ids'])
 
-def translate(pattern="", source=""):
+def load_pack(path):
+  '''
+  Load the rules of a pack written by build_pack, in a single read: nothing is parsed, and rules are only compiled when they are looked up
+  @param path: the name of the pack
+  @type path: str
+  @rtype: RulePack
+  @raise regexeze_pack.PackFormatError: the file is not a pack this version can read
+  '''
+  #imported here, only packs need it
+  import regexeze_pack
+  pack = regexeze_pack.load(path)
+  return RulePack(*[pack[column] for column in regexeze_pack.COLUMNS], version=pack['version'])
+
+def translate(pattern="", source="", capture=True, optimize=False):
   '''
   Translate a pattern from regexeze to standard Python re syntax
   @param pattern: the pattern, in regexeze syntax, to be compiled
   @type pattern: str
   @param source: the source of the pattern - filename, stdin, or blank meaning the pattern string
   @type source: str
+  @param capture: whether every expression is a capturing group; if False, only named expressions are (which makes matching faster)
+  @type capture: bool
+  @param optimize: whether to simplify the translated pattern (see regexeze_optimizer.optimize)
+  @type optimize: bool
   @return: the regexeze pattern in standard Python syntax
   @rtype: str
   '''
-  return compile(pattern, source).ret_val
+  return _translation(pattern, source, capture, optimize)[0]
 
-def search(pattern="", target_string="", source=""):
+def search(pattern="", target_string="", source="", flags=0):
   '''
   Search a string for the pattern
   @param pattern: the pattern, in regexeze syntax, to use for searching
@@ -152,11 +967,12 @@ def search(pattern="", target_string="", source=""):
   @rtype: re.MatchObject
   @param source: the source of the pattern - filename, stdin, or blank meaning the pattern string
   @type source: str
+  @param flags: flags from the re module to compile the translated pattern with
+  @type flags: int
   '''
-  regexezeObject = compile(pattern, source)
-  return re.search(regexezeObject.ret_val, target_string)
+  return compile(pattern, source, flags).search(target_string)
 
-def match(pattern="", target_string="", source=""):
+def match(pattern="", target_string="", source="", flags=0):
   '''
   Match a string to the regexeze expression pattern
   @param pattern: the pattern, in regexeze syntax, to use for matching
@@ -167,9 +983,106 @@ def match(pattern="", target_string="", source=""):
   @rtype: re.MatchObject
   @param source: the source of the pattern - filename, stdin, or blank meaning the pattern string
   @type source: str
+  @param flags: flags from the re module to compile the translated pattern with
+  @type flags: int
+  '''
+  return compile(pattern, source, flags).match(target_string)
+
+def scan_file(pattern="", path="", source="", flags=0, capture=True, optimize=False, workers=None,
+              chunk_size=None, overlap=None, separator=None):
+  '''
+  Find every match of the pattern in a file, which is memory mapped rather than read, so files of any size can be searched as a whole
+  (with multiline or any_char_all patterns, say) without loading them into memory
+  @param pattern: the pattern, in regexeze syntax, to search for
+  @type pattern: str
+  @param path: the name of the file to be searched
+  @type path: str
+  @param source: the source of the pattern - filename, stdin, or blank meaning the pattern string
+  @type source: str
+  @param flags: flags from the re module to compile the translated pattern with
+  @type flags: int
+  @param capture: whether every expression is a capturing group; if False, only named expressions are
+  @type capture: bool
+  @param optimize: whether to simplify the translated pattern before compiling it (see regexeze_optimizer.optimize)
+  @type optimize: bool
+  @param workers: the number of worker processes searching ranges of the file in parallel, or None to search in this process
+  @type workers: int
+  @param chunk_size: with workers, the number of bytes in a range, which ends just after a separator, or None for
+  regexeze_grep.DEFAULT_CHUNK_SIZE
+  @type chunk_size: int
+  @param overlap: with workers, the number of bytes searched past the end of a range for the matches starting in it, if no match
+  can be longer (see regexeze_grep.scan_buffer), or None for regexeze_grep.DEFAULT_OVERLAP
+  @type overlap: int
+  @param separator: with workers, the string ranges end with, or None for regexeze_grep.DEFAULT_RECORD_SEPARATOR
+  @type separator: str
+  @return: the position, text and groups of each match, in order, found as the iterator is consumed
+  @rtype: iterator of regexeze_grep.ScanMatch
+  '''
+  #imported here, only searching files needs it
+  import regexeze_grep
+  compiled = compile(pattern, source, flags, capture, optimize)
+  if workers is None:
+    return regexeze_grep.scan(compiled.regex, path, compiled.required_literals)
+  return regexeze_grep.scan_parallel(compiled.regex, path, workers,
+                                     regexeze_grep.DEFAULT_CHUNK_SIZE if chunk_size is None else chunk_size,
+                                     regexeze_grep.DEFAULT_OVERLAP if overlap is None else overlap,
+                                     regexeze_grep.DEFAULT_RECORD_SEPARATOR if separator is None else separator,
+                                     compiled.required_literals)
+
+def purge():
+  '''
+  Clear the pattern cache, like re.purge
+  '''
+  _cache.clear()
+
+def set_cache_size(maxsize):
+  '''
+  Set the maximum number of entries in the pattern cache (0 disables caching)
+  @param maxsize: the maximum number of entries
+  @type maxsize: int
+  '''
+  _cache.resize(maxsize)
+
+def cache_info():
+  '''
+  @return: hits, misses, evictions, maximum size and current size of the pattern cache
+  @rtype: regexeze_cache.CacheInfo
   '''
-  regexezeObject = compile(pattern, source)
-  return re.match(regexezeObject.ret_val, target_string)
+  return _cache.info()
+
+def pattern_info():
+  '''
+  @return: the number of compiled patterns created in this process, of those whose regex was compiled because they were used,
+  and of those never used
+  @rtype: regexeze_cache.UsageInfo
+  '''
+  return _usage.info()
+
+def set_max_nesting_depth(depth):
+  '''
+  Set the number of levels expressions can be nested in the patterns translated from then on
+  Nesting is parsed without recursion, so the limit is only a safeguard against runaway input
+  @param depth: the maximum depth, or None for no limit
+  @type depth: int
+  '''
+  RegexezeObject.max_nesting_depth = depth
+
+def set_disk_cache(path, maxsize=regexeze_cache.DiskCache.DEFAULT_MAXSIZE, max_age=None):
+  '''
+  Keep the translations of pattern files in a directory, shared between processes
+  The cache is also enabled by the REGEXEZE_CACHE_DIR environment variable
+  @param path: the directory of the cache, or None to disable the disk cache
+  @type path: str
+  @param maxsize: the maximum number of entries kept
+  @type maxsize: int
+  @param max_age: the number of seconds an unused entry is kept, or None to keep entries regardless of age
+  @type max_age: float
+  '''
+  global _disk_cache
+  if path is None:
+    _disk_cache = None
+  else:
+    _disk_cache = regexeze_cache.DiskCache(path, __version__, maxsize, max_age)
 
 def translateMain(args):
   '''
@@ -180,15 +1093,12 @@ def translateMain(args):
   pattern = args.pattern
   filename = args.filename
 
-  regexezeObject = RegexezeObject('')
   if pattern:
-    regexezeObject = RegexezeObject(pattern);
-    regexezeObject.parse()
+    print translate(pattern)
   elif filename:
-    regexezeObject.parse(filename)
+    print translate(source=filename)
   else:
-    regexezeObject.parse(sys.stdin)
-  print regexezeObject.ret_val
+    print translate(source=sys.stdin)
 
 def matchMain(args):
   '''
@@ -219,19 +1129,66 @@ def matchMain(args):
   else:
     print "No match"
 
+def grepMain(args):
+  '''
+  Method called when user selects grep mode when running from command line
+  The pattern is compiled once, without capturing unnamed expressions
+  @param args: the arguments accepted
+  @type args: argparse Namespace
+  @return: the exit status, as grep: 0 if something matched, 1 otherwise
+  @rtype: int
+  '''
+  #imported here, only grep needs it
+  import regexeze_grep
+  if args.pattern:
+    pattern = compile(args.pattern, capture=False, optimize=args.optimize)
+  else:
+    pattern = compile(source=args.filename, capture=False, optimize=args.optimize)
+  files = args.files or [regexeze_grep.STDIN_NAME]
+  grep = regexeze_grep.Grep(pattern, args.output, args.format, sys.stdout, args.record_separator,
+                            show_names=len(files) > 1, show_numbers=args.line_number, whole_file=args.whole_file,
+                            workers=args.workers, chunk_size=args.chunk_size, overlap=args.overlap)
+  return 0 if grep.search_files(files) else 1
+
+def buildMain(args):
+  '''
+  Method called when user selects build mode when running from command line
+  @param args: the arguments accepted
+  @type args: argparse Namespace
+  @return: the exit status: 0 if the pack was written, 1 if a pattern file has invalid syntax or two stand for the same rule
+  @rtype: int
+  '''
+  #imported here, only packs need it
+  import regexeze_pack
+  try:
+    count = build_pack(args.paths, args.output, capture=args.capture, optimize=args.optimize)
+  except (regexeze_errors.Error, regexeze_pack.DuplicateRuleError) as error:
+    print >> sys.stderr, '{0}: {1}'.format(error.source, error)
+    return 1
+  print 'Wrote {0} rules to {1}'.format(count, args.output)
+  return 0
+
 #function map from sub parsers to functions
 FUNCTION_MAP = { 'translate' : translateMain,
-                 'match' : matchMain }
+                 'match' : matchMain,
+                 'grep' : grepMain,
+                 'build' : buildMain }
 def main(args):
   '''
   Main method for the module
   @param args: the arguments accepted
   @type args: argparse namespace
+  @return: the exit status of the command (None for success)
+  @rtype: int
   '''
-  FUNCTION_MAP[args.cmd](args)
+  return FUNCTION_MAP[args.cmd](args)
+
+if os.environ.get(DISK_CACHE_VARIABLE):
+  set_disk_cache(os.environ[DISK_CACHE_VARIABLE])
 
 if __name__ == '__main__':
+  import regexeze_argparser
   argparser = regexeze_argparser.RegexezeArgparser()
 
   args = argparser.parse_args()
-  main(args)
+  sys.exit(main(args))
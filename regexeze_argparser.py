@@ -1,4 +1,6 @@
 import argparse
+import regexeze_grep
+import regexeze_pack
 
 class RegexezeSubparser(object):
   '''
@@ -9,6 +11,12 @@ class RegexezeSubparser(object):
   MATCH = 'match'
   MATCH_DESCRIPTION = 'Matches a target string to a pattern. If pattern is supplied, matches pattern. If file is supplied, matches pattern inside file. Otherwise, matches from stdin.'
   MATCH_TARGET_STRING_DESCRIPTION = 'A string for matching.'
+  GREP = 'grep'
+  GREP_DESCRIPTION = 'Searches files, or stdin if no file is supplied, for a pattern, record by record. The pattern is compiled once and must be supplied as a pattern or a file.'
+  BUILD = 'build'
+  BUILD_DESCRIPTION = 'Translates pattern files into a compiled pack, which processes load without translating the files again.'
+  #whether a pattern or a file must be supplied (if not, the pattern is taken from stdin)
+  PATTERN_REQUIRED = False
 
   def __init__(self, title = '', description = ''):
     self.title = title
@@ -28,7 +36,7 @@ class RegexezeSubparser(object):
     '''
     Adds support for taking a pattern from a string and taking a pattern from a file
     '''
-    inputMechanismGroup = self.parser.add_mutually_exclusive_group()
+    inputMechanismGroup = self.parser.add_mutually_exclusive_group(required=self.PATTERN_REQUIRED)
     inputMechanismGroup.add_argument('-p', '--pattern', dest='pattern', type=str, help='A pattern in regexeze.')
     inputMechanismGroup.add_argument('-f', '--filename', dest='filename', type=str, help='A file (or path to file) containing a regexeze expression.')
 
@@ -48,6 +56,74 @@ class TargetStringSubparser(RegexezeSubparser):
     targetStringGroup = self.parser.add_argument_group()
     targetStringGroup.add_argument('-t', '--target-string', dest='target_string', type=str, help=self.target_string_help, required=True)
 
+class GrepSubparser(RegexezeSubparser):
+  '''
+  Subparser for searching streams of records for a pattern, which takes its input from files or stdin
+  '''
+  PATTERN_REQUIRED = True
+
+  def setup(self):
+    super(GrepSubparser, self).setup()
+    self.add_input_and_output_support()
+
+  def add_input_and_output_support(self):
+    '''
+    Adds the files searched and the options for what is written and how
+    '''
+    self.parser.add_argument('files', nargs='*', metavar='file', help='A file to search ({0} for stdin). Stdin is searched if no file is supplied.'.format(regexeze_grep.STDIN_NAME))
+    self.parser.add_argument('-o', '--output', dest='output', choices=regexeze_grep.OUTPUTS, default=regexeze_grep.LINES,
+                             help='What is written: the records that match, every match, the number of records that match in each input, or the named groups of every match (default: %(default)s).')
+    self.parser.add_argument('--format', dest='format', choices=regexeze_grep.FORMATS, default=regexeze_grep.TEXT,
+                             help='How it is written: as plain text, or as one JSON object per line (default: %(default)s).')
+    self.parser.add_argument('-n', '--line-number', dest='line_number', action='store_true', help='Write the number of the record before what is found in it.')
+    self.parser.add_argument('-r', '--record-separator', dest='record_separator', type=self.record_separator, default=regexeze_grep.DEFAULT_RECORD_SEPARATOR,
+                             help='The string ending each record, with Python escapes such as \\0 (default: a new line).')
+    self.parser.add_argument('--whole-file', dest='whole_file', action='store_true',
+                             help='Search each file as a whole, memory mapped, so matches may span records. Matches are written instead of records, numbered by their offset, and counted.')
+    self.parser.add_argument('-j', '--workers', dest='workers', type=int, help='With --whole-file, the number of worker processes searching ranges of each file.')
+    self.parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=regexeze_grep.DEFAULT_CHUNK_SIZE,
+                             help='With --workers, the number of bytes in a range, which ends at a record separator (default: %(default)s).')
+    self.parser.add_argument('--overlap', dest='overlap', type=int, default=regexeze_grep.DEFAULT_OVERLAP,
+                             help='With --workers, the number of bytes searched past the end of a range for the matches starting in it, for patterns whose matches are no longer (default: %(default)s).')
+    self.parser.add_argument('--optimize', dest='optimize', action='store_true', help='Simplify the translated pattern before compiling it.')
+
+  @staticmethod
+  def record_separator(value):
+    '''
+    Reads a record separator given with Python escapes
+    @param value: the separator as given
+    @type value: str
+    @return: the separator, with its escapes decoded
+    @rtype: str
+    @raise argparse.ArgumentTypeError: the separator is empty, or ends in a lone backslash
+    '''
+    try:
+      separator = value.decode('string_escape')
+    except ValueError as error:
+      raise argparse.ArgumentTypeError('invalid record separator {0!r}: {1}'.format(value, error))
+    if not separator:
+      raise argparse.ArgumentTypeError('the record separator must not be empty')
+    return separator
+
+class BuildSubparser(RegexezeSubparser):
+  '''
+  Subparser for building packs, which takes pattern files and directories instead of a pattern
+  '''
+  def setup(self):
+    self.add_sources_and_output_support()
+    self.parser.set_defaults(cmd=self.cmd)
+
+  def add_sources_and_output_support(self):
+    '''
+    Adds the pattern files put in the pack, the pack written and the translation options
+    '''
+    self.parser.add_argument('paths', nargs='+', metavar='path',
+                             help='A pattern file, or a directory searched for pattern files (ending in {0}).'.format(regexeze_pack.SOURCE_SUFFIX))
+    self.parser.add_argument('-o', '--output', dest='output', required=True,
+                             help='The pack written (by convention ending in {0}).'.format(regexeze_pack.PACK_SUFFIX))
+    self.parser.add_argument('--no-capture', dest='capture', action='store_false', help='Only make named expressions capturing groups, which makes matching faster.')
+    self.parser.add_argument('--optimize', dest='optimize', action='store_true', help='Simplify the translated patterns.')
+
 class RegexezeArgparser(object):
   '''
   Main argument parser for the regexeze command line tool
@@ -82,3 +158,11 @@ class RegexezeArgparser(object):
     #match parser
     matchParser = TargetStringSubparser(RegexezeSubparser.MATCH, RegexezeSubparser.MATCH_DESCRIPTION, RegexezeSubparser.MATCH_TARGET_STRING_DESCRIPTION)
     self.add_regexeze_subparser(matchParser)
+
+    #grep parser
+    grepParser = GrepSubparser(RegexezeSubparser.GREP, RegexezeSubparser.GREP_DESCRIPTION)
+    self.add_regexeze_subparser(grepParser)
+
+    #build parser
+    buildParser = BuildSubparser(RegexezeSubparser.BUILD, RegexezeSubparser.BUILD_DESCRIPTION)
+    self.add_regexeze_subparser(buildParser)
@@ -0,0 +1,415 @@
+import re
+
+class Node(object):
+  '''
+  Base class for the nodes of the tree built by the parser machine
+  Nodes only hold what was parsed; writing them out as a regex is left to an emitter (see PythonEmitter)
+  '''
+  __slots__ = ()
+
+  def __eq__(self, other):
+    return type(self) is type(other) and all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+  def __ne__(self, other):
+    return not self == other
+
+  #nodes hold lists, so they are not hashable
+  __hash__ = None
+
+  def __repr__(self):
+    return '{0}({1})'.format(type(self).__name__, ', '.join(repr(getattr(self, slot)) for slot in self.__slots__))
+
+class Literal(Node):
+  '''
+  Text matched as it is
+  @param text: the text
+  @type text: str
+  '''
+  __slots__ = ('text',)
+
+  def __init__(self, text):
+    self.text = text
+
+class Special(Node):
+  '''
+  A character with a special meaning in regex syntax (any character, digit, new line, start of string...)
+  @param symbol: the regex symbol of the character
+  @type symbol: str
+  '''
+  __slots__ = ('symbol',)
+
+  def __init__(self, symbol):
+    self.symbol = symbol
+
+class Range(Node):
+  '''
+  A range of characters in a class
+  @param start: the first character of the range
+  @type start: str
+  @param end: the last character of the range
+  @type end: str
+  '''
+  __slots__ = ('start', 'end')
+
+  def __init__(self, start, end):
+    self.start = start
+    self.end = end
+
+class CharacterClass(Node):
+  '''
+  A class of characters, one of which is matched
+  @param items: the values of the class
+  @type items: list of Literal, Special or Range
+  @param negated: whether the class matches any character except its values
+  @type negated: bool
+  '''
+  __slots__ = ('items', 'negated')
+
+  def __init__(self, items=None, negated=False):
+    self.items = items if items is not None else []
+    self.negated = negated
+
+class Repeat(Node):
+  '''
+  A node repeated a number of times
+  @param node: the repeated node
+  @type node: Node
+  @param low: the least number of repetitions
+  @type low: int
+  @param high: the greatest number of repetitions, or None for no limit
+  @type high: int
+  @param greedy: whether as many repetitions as possible are matched
+  @type greedy: bool
+  @param form: how the repetitions were given: by keyword (for one_or_more), as a count (for 3), or as a range (for 2 up_to 5)
+  @type form: str
+  '''
+  __slots__ = ('node', 'low', 'high', 'greedy', 'form')
+
+  KEYWORD = 'keyword'
+  COUNT = 'count'
+  RANGE = 'range'
+
+  def __init__(self, node, low, high, greedy=True, form=KEYWORD):
+    self.node = node
+    self.low = low
+    self.high = high
+    self.greedy = greedy
+    self.form = form
+
+class Group(Node):
+  '''
+  An expression, as a group
+  @param body: the content of the group
+  @type body: Node
+  @param name: the name of the group, or None
+  @type name: str
+  @param capturing: whether the group captures (named groups always do)
+  @type capturing: bool
+  '''
+  __slots__ = ('body', 'name', 'capturing')
+
+  def __init__(self, body, name=None, capturing=True):
+    self.body = body
+    self.name = name
+    self.capturing = capturing
+
+class Sequence(Node):
+  '''
+  Nodes matched one after the other
+  @param items: the nodes
+  @type items: list of Node
+  '''
+  __slots__ = ('items',)
+
+  def __init__(self, items=None):
+    self.items = items if items is not None else []
+
+class Alternation(Node):
+  '''
+  Alternatives, one of which is matched
+  @param alternatives: the alternatives
+  @type alternatives: list of Sequence
+  '''
+  __slots__ = ('alternatives',)
+
+  def __init__(self, alternatives):
+    self.alternatives = alternatives
+
+class Flags(Node):
+  '''
+  Flags set for the whole pattern
+  @param flags: the regex symbol of each flag, in order
+  @type flags: list of str
+  '''
+  __slots__ = ('flags',)
+
+  def __init__(self, flags=None):
+    self.flags = flags if flags is not None else []
+
+class BackReference(Node):
+  '''
+  A reference to what an earlier named group matched
+  @param name: the name of the group
+  @type name: str
+  '''
+  __slots__ = ('name',)
+
+  def __init__(self, name):
+    self.name = name
+
+class PythonEmitter(object):
+  '''
+  Writes a tree out in the syntax of the Python re module
+  The tree is walked without recursion, so trees of any depth can be written: the nodes and pieces still to be written
+  are kept on a stack, each node appending its pieces to a single list (joined once at the end) or pushing its children
+  @param emitters: the method writing out each type of node
+  @type emitters: dict type -> callable
+  '''
+  #shorthand quantifiers, by (low, high) repetitions
+  QUANTIFIER_SYMBOLS = { (0, None): '*',
+                         (1, None): '+',
+                         (0, 1): '?' }
+  NOT_GREEDY_SYMBOL = '?'
+  ALTERNATION_SYMBOL = '|'
+
+  def __init__(self):
+    self.emitters = { Literal: self.emit_literal,
+                      Special: self.emit_special,
+                      Range: self.emit_range,
+                      CharacterClass: self.emit_class,
+                      Repeat: self.emit_repeat,
+                      Group: self.emit_group,
+                      Sequence: self.emit_sequence,
+                      Alternation: self.emit_alternation,
+                      Flags: self.emit_flags,
+                      BackReference: self.emit_back_reference }
+
+  def emit(self, node):
+    '''
+    @param node: the root of the tree
+    @type node: Node
+    @return: the regex
+    @rtype: str
+    '''
+    pieces = []
+    #nodes and pieces still to be written, the next one last
+    pending = [node]
+    emitters = self.emitters
+    while pending:
+      item = pending.pop()
+      if isinstance(item, basestring):
+        pieces.append(item)
+      else:
+        emitters[type(item)](item, pieces, pending)
+    return ''.join(pieces)
+
+  def emit_literal(self, node, pieces, pending):
+    pieces.append(re.escape(node.text))
+
+  def emit_special(self, node, pieces, pending):
+    pieces.append(node.symbol)
+
+  def emit_range(self, node, pieces, pending):
+    pieces.append(re.escape(node.start) + '-' + re.escape(node.end))
+
+  def emit_class(self, node, pieces, pending):
+    pieces.append('[^' if node.negated else '[')
+    pending.append(']')
+    pending.extend(reversed(node.items))
+
+  def emit_repeat(self, node, pieces, pending):
+    if node.form == Repeat.KEYWORD:
+      quantifier = self.QUANTIFIER_SYMBOLS[node.low, node.high]
+    elif node.form == Repeat.COUNT:
+      quantifier = '{{{0}}}'.format(node.low)
+    elif node.high is None:
+      quantifier = '{{{0},}}'.format(node.low)
+    else:
+      quantifier = '{{{0},{1}}}'.format(node.low, node.high)
+    if not node.greedy:
+      quantifier += self.NOT_GREEDY_SYMBOL
+    pending.append(quantifier)
+    pending.append(node.node)
+
+  def emit_group(self, node, pieces, pending):
+    if node.name is not None:
+      pieces.append('(?P<' + node.name + '>')
+    else:
+      pieces.append('(' if node.capturing else '(?:')
+    pending.append(')')
+    pending.append(node.body)
+
+  def emit_sequence(self, node, pieces, pending):
+    pending.extend(reversed(node.items))
+
+  def emit_alternation(self, node, pieces, pending):
+    for index in xrange(len(node.alternatives) - 1, -1, -1):
+      pending.append(node.alternatives[index])
+      if index:
+        pending.append(self.ALTERNATION_SYMBOL)
+
+  def emit_flags(self, node, pieces, pending):
+    pieces.append('(?' + ''.join(node.flags) + ')')
+
+  def emit_back_reference(self, node, pieces, pending):
+    pieces.append('(?P=' + node.name + ')')
+
+#emitters hold no state between calls, so one is shared
+PYTHON_EMITTER = PythonEmitter()
+
+def emit(node):
+  '''
+  Write a tree out in the syntax of the Python re module
+  @param node: the root of the tree
+  @type node: Node
+  @rtype: str
+  '''
+  return PYTHON_EMITTER.emit(node)
+
+#flag symbols which make literals match other text than their own
+CASELESS_FLAGS = frozenset(['i'])
+
+class LiteralAnalysis(object):
+  '''
+  What a node tells about the text it matches
+  @param exact: the text every match is, if the node only matches that text, or None
+  @type exact: str
+  @param prefix: the text every match starts with
+  @type prefix: str
+  @param suffix: the text every match ends with
+  @type suffix: str
+  @param inner: other text every match contains
+  @type inner: set of str
+  '''
+  __slots__ = ('exact', 'prefix', 'suffix', 'inner')
+
+  def __init__(self, exact=None, prefix='', suffix='', inner=None):
+    self.exact = exact
+    self.prefix = exact if exact is not None else prefix
+    self.suffix = exact if exact is not None else suffix
+    self.inner = inner if inner is not None else set()
+
+  def literals(self):
+    '''
+    @return: all the text every match contains
+    @rtype: set of str
+    '''
+    return set([self.prefix, self.suffix]) | self.inner
+
+def analyze_literals(node):
+  '''
+  @param node: a node of a tree
+  @type node: Node
+  @rtype: LiteralAnalysis
+  '''
+  kind = type(node)
+  if kind is Literal:
+    return LiteralAnalysis(node.text)
+  if kind is Flags:
+    return LiteralAnalysis('')
+  if kind is Group:
+    return analyze_literals(node.body)
+  if kind is Sequence:
+    return analyze_sequence(node.items)
+  if kind is Repeat:
+    body = analyze_literals(node.node)
+    if body.exact is not None and node.low == node.high:
+      return LiteralAnalysis(body.exact * node.low)
+    if node.low >= 1:
+      return LiteralAnalysis(None, body.prefix, body.suffix, body.literals())
+    return LiteralAnalysis()
+  if kind is Alternation:
+    #only text every alternative contains
+    alternatives = [analyze_literals(alternative).literals() for alternative in node.alternatives]
+    inner = set(literal for literal in alternatives[0]
+                if all(any(literal in other for other in others) for others in alternatives[1:]))
+    return LiteralAnalysis(inner=inner)
+  #special characters, classes and group references match text that is not known
+  return LiteralAnalysis()
+
+def analyze_sequence(items):
+  '''
+  @param items: the nodes of a sequence
+  @type items: list of Node
+  @rtype: LiteralAnalysis
+  '''
+  inner = set()
+  #the text matched by the nodes since the last one that does not match known text
+  run = ''
+  prefix = None
+  for item in items:
+    analysis = analyze_literals(item)
+    if analysis.exact is not None:
+      run += analysis.exact
+      continue
+    inner |= analysis.inner
+    inner.add(run + analysis.prefix)
+    if prefix is None:
+      prefix = run + analysis.prefix
+    run = analysis.suffix
+  if prefix is None:
+    return LiteralAnalysis(run)
+  return LiteralAnalysis(None, prefix, run, inner)
+
+def required_literals(node):
+  '''
+  Find text every match of a tree must contain, so that strings without it can be rejected before the regex is run
+  Patterns ignoring case require nothing (as far as this goes), nor do trees too deep to be analyzed
+  @param node: the root of the tree
+  @type node: Node
+  @return: the required text, longest first, without text that is part of other required text
+  @rtype: tuple of str
+  '''
+  try:
+    if any(type(item) is Flags and CASELESS_FLAGS.intersection(item.flags) for item in walk(node)):
+      return ()
+    literals = analyze_literals(node).literals()
+  except RuntimeError:
+    #maximum recursion depth exceeded
+    return ()
+  literals = sorted((literal for literal in literals if literal), key=len, reverse=True)
+  required = []
+  for literal in literals:
+    if not any(literal in longer for longer in required):
+      required.append(literal)
+  return tuple(required)
+
+def missing_literal(buffer, literals, start=0, end=None):
+  '''
+  Tell whether any of the literals every match contains (see required_literals) is missing from a buffer,
+  in which case nothing can match in it: str.find rules it out much faster than the regex engine would
+  @param buffer: the text searched (a string or a memory map)
+  @type buffer: str or mmap.mmap
+  @param literals: the required literals
+  @type literals: tuple of str
+  @param start: the offset the search starts from
+  @type start: int
+  @param end: the offset the search stops at, or None for the end of the buffer
+  @type end: int
+  @rtype: bool
+  '''
+  if end is None:
+    end = len(buffer)
+  for literal in literals:
+    if buffer.find(literal, start, end) == -1:
+      return True
+  return False
+
+def walk(node):
+  '''
+  @return: every node of a tree, walked without recursion
+  @rtype: iterator of Node
+  '''
+  pending = [node]
+  while pending:
+    node = pending.pop()
+    yield node
+    kind = type(node)
+    if kind is Group:
+      pending.append(node.body)
+    elif kind is Repeat:
+      pending.append(node.node)
+    elif kind is Sequence or kind is CharacterClass:
+      pending.extend(node.items)
+    elif kind is Alternation:
+      pending.extend(node.alternatives)
@@ -0,0 +1,567 @@
+'''
+Benchmarks for regexeze
+Run all benchmarks with: python regexeze_benchmark.py
+Or a selection of them with: python regexeze_benchmark.py lexer ...
+'''
+import argparse
+import sys
+import subprocess
+import time
+import os
+import shutil
+import tempfile
+import multiprocessing
+import resource
+from collections import OrderedDict
+import regexeze_lexer
+import regexeze_grep
+import regexeze
+
+#a representative sample of regexeze expressions, used to build large inputs
+SAMPLE_EXPRESSIONS = [ "expr: 'a';",
+                       "expr: any_char of 'abc' or_of 'def';",
+                       "expr: any_char from 'a' to 'c' or_from 'x' to 'z';",
+                       "expr: any_char except whitespace or_except digit for one_or_more;",
+                       "expr: 'ab' for 2 up_to 10 not_greedy;",
+                       "expr: [ expr: 'a' or 'b'; ];",
+                       "expr: \"how are you\" for zero_or_one; #with a comment",
+                       "expr: digit for 3 up_to infinity;",
+                       "set_flags: ignore_case, multiline;",
+                       "expr: start_of_string; expr: new_line; expr: tab;" ]
+
+def build_input(n_expressions):
+  '''
+  Builds a pattern by repeating the sample expressions
+  @param n_expressions: the number of sample expressions in the pattern
+  @type n_expressions: int
+  @return: the pattern, one expression per line
+  @rtype: str
+  '''
+  lines = [SAMPLE_EXPRESSIONS[i % len(SAMPLE_EXPRESSIONS)] for i in xrange(n_expressions)]
+  return '\n'.join(lines) + '\n'
+
+def best_time(function, repeat=5):
+  '''
+  Times a function call
+  @param function: the function to be timed, taking no arguments
+  @type function: callable
+  @param repeat: the number of times the function is timed
+  @type repeat: int
+  @return: the fastest of the timings, in seconds
+  @rtype: float
+  '''
+  timings = []
+  for _ in xrange(repeat):
+    start = time.time()
+    function()
+    timings.append(time.time() - start)
+  return max(min(timings), 1e-9)
+
+def report(benchmark, label, value):
+  print '{0:<12} {1:<36} {2}'.format(benchmark, label, value)
+
+def benchmark_lexer():
+  '''
+  Tokens per second of the regexeze lexer compared to shlex
+  '''
+  text = build_input(20000)
+  for name in [regexeze_lexer.REGEXEZE, regexeze_lexer.SHLEX]:
+    lexer = regexeze_lexer.LEXERS[name]
+    n_tokens = len(list(lexer(text)))
+    seconds = best_time(lambda: list(lexer(text)))
+    report('lexer', name, '{0:,.0f} tokens/sec'.format(n_tokens / seconds))
+
+def benchmark_translate():
+  '''
+  Translation throughput of the parser machine on a large pattern
+  '''
+  text = build_input(20000)
+  def translate():
+    regexezeObject = regexeze.RegexezeObject(text)
+    regexezeObject.parse()
+  seconds = best_time(translate)
+  report('translate', '20000 expressions', '{0:,.0f} expressions/sec'.format(20000 / seconds))
+
+  #the state machine alone, on tokens split up front
+  tokens = list(regexeze_lexer.RegexezeLexer(text))
+  def process_tokens():
+    regexezeObject = regexeze.RegexezeObject()
+    regexezeObject.process_tokens(tokens)
+    regexezeObject.end()
+  seconds = best_time(process_tokens)
+  report('translate', 'state machine only', '{0:,.0f} tokens/sec'.format(len(tokens) / seconds))
+
+def build_patterns(n_patterns):
+  '''
+  Builds distinct patterns, as found in a rule pack
+  @param n_patterns: the number of patterns
+  @type n_patterns: int
+  @rtype: list of str
+  '''
+  return ["{0} expr: 'rule{1}';".format(SAMPLE_EXPRESSIONS[i % len(SAMPLE_EXPRESSIONS)], i) for i in xrange(n_patterns)]
+
+def benchmark_batch():
+  '''
+  Translation of many distinct patterns one by one, compared to translate_many
+  '''
+  patterns = build_patterns(20000)
+  def translate_each():
+    regexeze.purge()
+    for pattern in patterns:
+      regexeze.translate(pattern)
+  each_seconds = best_time(translate_each)
+  report('batch', 'translate', '{0:,.0f} patterns/sec'.format(len(patterns) / each_seconds))
+  seconds = best_time(lambda: regexeze.translate_many(patterns))
+  report('batch', 'translate_many', '{0:,.0f} patterns/sec'.format(len(patterns) / seconds))
+  #a batch saves the cache, the machine and the required literals of each pattern, but every pattern is still parsed and
+  #written out: cold starts over tens of thousands of patterns are cut by workers, and by packs (see benchmark_pack)
+  report('batch', 'translate_many over translate', '{0:.1f}x (each pattern is still parsed: see workers and pack)'.format(each_seconds / seconds))
+  seconds = best_time(lambda: regexeze.compile_many(patterns))
+  report('batch', 'compile_many', '{0:,.0f} patterns/sec'.format(len(patterns) / seconds))
+  workers = multiprocessing.cpu_count()
+  seconds = best_time(lambda: regexeze.translate_many(patterns, workers=workers))
+  report('batch', 'translate_many, {0} workers'.format(workers), '{0:,.0f} patterns/sec'.format(len(patterns) / seconds))
+
+def benchmark_emit():
+  '''
+  Translation time of single patterns with growing numbers of expressions, or of values in one class, which should grow linearly
+  '''
+  for n in [1000, 10000, 100000]:
+    expressions = ' '.join("expr: 'a{0}';".format(i) for i in xrange(n))
+    seconds = best_time(lambda: regexeze.RegexezeObject(expressions).parse(), repeat=3)
+    report('emit', '{0} expressions'.format(n), '{0:,.0f} expressions/sec'.format(n / seconds))
+  for n in [1000, 10000, 100000]:
+    values = "expr: any_char of 'v0' " + ' '.join("or_of 'v{0}'".format(i) for i in xrange(1, n)) + ';'
+    seconds = best_time(lambda: regexeze.RegexezeObject(values).parse(), repeat=3)
+    report('emit', '{0} or_of values'.format(n), '{0:,.0f} values/sec'.format(n / seconds))
+
+#a unit of expressions for the matching benchmark, and text it matches
+MATCH_EXPRESSIONS = [ "expr: alphanumeric for one_or_more;",
+                      "expr: ' ';",
+                      "expr: digit for 2 up_to 4;",
+                      "expr: any_char of '-:/';" ]
+MATCH_TEXT = 'field 2024-'
+
+def benchmark_capture():
+  '''
+  Matching throughput of typical patterns, with every expression captured compared to only named expressions captured
+  '''
+  for n_expressions in [32, 80]:
+    n_units = n_expressions / len(MATCH_EXPRESSIONS)
+    pattern = ' '.join(MATCH_EXPRESSIONS * n_units)
+    lines = [MATCH_TEXT * n_units] * 10000
+    for capture in [True, False]:
+      compiled = regexeze.compile(pattern, capture=capture)
+      def match():
+        for line in lines:
+          compiled.match(line)
+      seconds = best_time(match)
+      label = '{0} expressions, {1}'.format(n_expressions, 'capturing' if capture else 'non-capturing')
+      report('capture', label, '{0:,.0f} matches/sec'.format(len(lines) / seconds))
+
+#a pattern with alternatives sharing prefixes, alternatives of single characters and overlapping class values
+OPTIMIZE_PATTERN = ("expr: [ expr: 'status' or 'stats' or 'state' or 'station'; ]; expr: any_char of ' ' or_of ':' or_of '=';"
+                    "expr: [ expr: 'a' or 'b' or 'c' or 'd' or 'e'; ] for one_or_more;"
+                    "expr: any_char from 'a' to 'k' or_from 'f' to 'z' or_of digit or_of 'q' for 2 up_to 6;")
+OPTIMIZE_TEXT = 'the stats=abcde stationed status: cab4zz 99 states ' * 4
+
+def benchmark_optimize():
+  '''
+  Searching throughput of a pattern, without and with the optimizer
+  '''
+  for capture in [True, False]:
+    for optimize in [False, True]:
+      compiled = regexeze.compile(OPTIMIZE_PATTERN, capture=capture, optimize=optimize)
+      seconds = best_time(lambda: [compiled.findall(OPTIMIZE_TEXT) for _ in xrange(2000)])
+      label = '{0}, {1}'.format('capturing' if capture else 'non-capturing', 'optimized' if optimize else 'not optimized')
+      report('optimize', label, '{0:,.0f} searches/sec'.format(2000 / seconds))
+
+#depths of nesting for the nesting benchmark
+NESTING_DEPTHS = [1, 10, 50, 100, 200, 1000]
+
+def build_nested_pattern(depth, width=20):
+  '''
+  Builds a pattern of nested expressions, as produced by rule generators
+  @param depth: the number of levels of nesting
+  @type depth: int
+  @param width: the number of expressions at the innermost level
+  @type width: int
+  @rtype: str
+  '''
+  innermost = ' '.join("expr: 'a{0}' for one_or_more;".format(i) for i in xrange(width))
+  return "expr: [ " * depth + innermost + " ];" * depth
+
+def benchmark_nesting():
+  '''
+  Parsing throughput of patterns of growing nesting depth, which should stay flat
+  '''
+  for depth in NESTING_DEPTHS:
+    pattern = build_nested_pattern(depth)
+    tokens = list(regexeze_lexer.RegexezeLexer(pattern))
+    def parse():
+      regexezeObject = regexeze.RegexezeObject()
+      regexezeObject.process_tokens(tokens)
+      regexezeObject.end()
+    seconds = best_time(parse)
+    report('nesting', 'depth {0}'.format(depth), '{0:,.0f} tokens/sec'.format(len(tokens) / seconds))
+
+#input sizes for the ingestion benchmark, in bytes
+INGEST_SIZES = [1 << 10, 1 << 20, 10 << 20, 50 << 20]
+
+def format_size(n_bytes):
+  for unit in ['B', 'KB', 'MB']:
+    if n_bytes < 1024 or unit == 'MB':
+      return '{0:g} {1}'.format(n_bytes, unit)
+    n_bytes /= 1024.0
+
+def benchmark_ingest():
+  '''
+  Throughput of parsing pattern files of growing sizes, which should stay flat
+  '''
+  expression_size = len(build_input(len(SAMPLE_EXPRESSIONS))) / float(len(SAMPLE_EXPRESSIONS))
+  for size in INGEST_SIZES:
+    text = build_input(max(1, int(size / expression_size)))
+    descriptor, filename = tempfile.mkstemp(suffix='.rgxz')
+    try:
+      with os.fdopen(descriptor, 'w') as input_file:
+        input_file.write(text)
+      def parse():
+        regexezeObject = regexeze.RegexezeObject()
+        regexezeObject.parse(filename)
+      seconds = best_time(parse, repeat=5 if size < INGEST_SIZES[-2] else 1)
+    finally:
+      os.remove(filename)
+    report('ingest', format_size(size), '{0:,.2f} MB/sec'.format(len(text) / seconds / (1 << 20)))
+
+#a log line for the grep benchmark, and a pattern picking named fields out of it
+GREP_LINE = '2024-05-01 12:00:{0:02d} GET /index.html 200 {1}\n'
+GREP_PATTERN = ("expr: [ name: status; expr: digit for 3; ]; expr: ' '; expr: [ name: size; expr: digit for one_or_more; ];"
+                "expr: end_of_string;")
+
+def benchmark_grep():
+  '''
+  Throughput of the grep subcommand searching a file, for each kind of output
+  '''
+  n_lines = 200000
+  descriptor, filename = tempfile.mkstemp(suffix='.log')
+  try:
+    with os.fdopen(descriptor, 'w') as input_file:
+      input_file.write(''.join(GREP_LINE.format(i % 60, i) for i in xrange(n_lines)))
+    pattern = regexeze.compile(GREP_PATTERN, capture=False)
+    with open(os.devnull, 'w') as output_file:
+      for output in regexeze_grep.OUTPUTS:
+        grep = regexeze_grep.Grep(pattern, output, output_file=output_file)
+        seconds = best_time(lambda: grep.search_files([filename]), repeat=3)
+        report('grep', output, '{0:,.0f} lines/sec'.format(n_lines / seconds))
+  finally:
+    os.remove(filename)
+
+#file sizes for the scanning benchmark, in bytes
+SCAN_SIZES = [1 << 20, 10 << 20, 100 << 20]
+#a block of log text with one multiline record in it, and a pattern finding those records
+SCAN_BLOCK = 'GET /index.html 200 1234\n' * 40 + 'BEGIN\ntrace line\nEND\n'
+SCAN_PATTERN = "set_flags: any_char_all; expr: 'BEGIN'; expr: [ name: body; expr: any_char for zero_or_more not_greedy; ]; expr: 'END';"
+
+def private_memory():
+  '''
+  @return: the resident memory of this process that is not backed by files, in KB, or None where it is not known (outside Linux)
+  @rtype: int
+  '''
+  try:
+    with open('/proc/self/status') as status:
+      for line in status:
+        if line.startswith('RssAnon:'):
+          return int(line.split()[1])
+  except IOError:
+    pass
+  return None
+
+def scan_in_child(filename, read):
+  '''
+  Scan a file in a fresh process, so that the memory taken by the scan can be told apart
+  @param filename: the file to be scanned
+  @type filename: str
+  @param read: whether to read the file into a string and search it, rather than scan it with scan_file
+  @type read: bool
+  @return: the time taken in seconds, and the growth of the peak resident memory and of the private memory (or None), in KB
+  @rtype: tuple (float, int, int)
+  '''
+  pattern = regexeze.compile(SCAN_PATTERN, capture=False)
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  private = private_memory()
+  start = time.time()
+  if read:
+    with open(filename, 'rb') as input_file:
+      text = input_file.read()
+    for _ in pattern.finditer(text):
+      pass
+  else:
+    matches = regexeze.scan_file(SCAN_PATTERN, filename, capture=False)
+    for _ in matches:
+      pass
+  seconds = time.time() - start
+  #measured while the text read is still held
+  private_growth = private_memory() - private if private is not None else None
+  return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak, private_growth
+
+def benchmark_scan():
+  '''
+  Throughput and memory growth of scan_file on files of growing sizes, compared to reading the files
+  The pages of a memory map count as resident while they are searched, but they are backed by the file and can be dropped
+  by the system at any time: the private memory, which can not, is what should stay flat
+  '''
+  for size in SCAN_SIZES:
+    descriptor, filename = tempfile.mkstemp(suffix='.log')
+    try:
+      with os.fdopen(descriptor, 'w') as input_file:
+        block = SCAN_BLOCK * max(1, (1 << 20) / len(SCAN_BLOCK))
+        for _ in xrange(max(1, size / len(block))):
+          input_file.write(block)
+      for read in [False, True]:
+        pool = multiprocessing.Pool(1)
+        try:
+          seconds, peak_growth, private_growth = pool.apply(scan_in_child, (filename, read))
+        finally:
+          pool.terminate()
+          pool.join()
+        label = '{0}, {1}'.format(format_size(size), 'read' if read else 'scan_file')
+        report('scan', label, '{0:,.2f} MB/sec, peak resident +{1:,} KB, private +{2} KB'.format(size / seconds / (1 << 20), peak_growth,
+                                                                                              '?' if private_growth is None else '{0:,}'.format(private_growth)))
+    finally:
+      os.remove(filename)
+
+def benchmark_parallel():
+  '''
+  Throughput of scan_file on a large file, in this process compared to across worker processes
+  '''
+  size = SCAN_SIZES[-1]
+  descriptor, filename = tempfile.mkstemp(suffix='.log')
+  try:
+    with os.fdopen(descriptor, 'w') as input_file:
+      block = SCAN_BLOCK * max(1, (1 << 20) / len(SCAN_BLOCK))
+      for _ in xrange(max(1, size / len(block))):
+        input_file.write(block)
+    seconds = best_time(lambda: list(regexeze.scan_file(SCAN_PATTERN, filename, capture=False)), repeat=3)
+    report('parallel', '{0}, scan_file'.format(format_size(size)), '{0:,.2f} MB/sec'.format(size / seconds / (1 << 20)))
+    for workers in sorted(set([1, 2, multiprocessing.cpu_count()])):
+      seconds = best_time(lambda: list(regexeze.scan_file(SCAN_PATTERN, filename, capture=False, workers=workers)), repeat=3)
+      report('parallel', '{0}, {1} workers'.format(format_size(size), workers), '{0:,.2f} MB/sec'.format(size / seconds / (1 << 20)))
+  finally:
+    os.remove(filename)
+
+#rules of the rule set benchmark, most with a literal prefix, some without
+RULE_FORMATS = [ "expr: 'user{0} logged in from '; expr: digit for one_or_more;",
+                 "expr: 'GET /api/v{0}/'; expr: any_char except whitespace for one_or_more;",
+                 "expr: 'error {0}'; expr: any_char of ':;';",
+                 "expr: digit for 3; expr: ' rule{0}';",
+                 "expr: [ expr: 'warn' or 'fail'; ]; expr: ' {0}';" ]
+#log lines the rules are run against, and what one line in a hundred contains, firing a rule
+RULE_LINE = '2024-05-01 12:{0:02d}:{1:02d} host{2} sshd[{3}]: connection closed by 10.0.{2}.1 port {3}'
+RULE_LINE_FIRING = [' user{0} logged in from 10', ' GET /api/v{0}/items', ' error {0}:', ' 200 rule{0}', ' warn {0}']
+
+def benchmark_rules():
+  '''
+  Throughput of a rule set of 2000 rules on a million log lines, compared to searching for each rule in turn
+  '''
+  n_rules = 2000
+  rules = [(rule_id, RULE_FORMATS[rule_id % len(RULE_FORMATS)].format(rule_id)) for rule_id in xrange(n_rules)]
+  seconds = best_time(lambda: regexeze.RuleSet(rules, optimize=True), repeat=1)
+  report('rules', '{0} rules, building'.format(n_rules), '{0:,.0f} rules/sec'.format(n_rules / seconds))
+  ruleSet = regexeze.RuleSet(rules, optimize=True)
+  #a few rules fire on a line now and then, as in real logs
+  distinct_lines = [RULE_LINE.format(i % 60, i % 59, i % 97, 10000 + i) +
+                    (RULE_LINE_FIRING[i % len(RULE_LINE_FIRING)].format(i % n_rules) if i % 100 == 0 else '') for i in xrange(10000)]
+  n_lines = 1000000
+  def search():
+    for _ in xrange(n_lines / len(distinct_lines)):
+      for line in distinct_lines:
+        ruleSet.search_indices(line)
+  seconds = best_time(search, repeat=1)
+  report('rules', '{0} lines, RuleSet'.format(n_lines), '{0:,.0f} lines/sec'.format(n_lines / seconds))
+  #lines on which merged rules fire (rules with short literals are merged), each telling which of the rules of its shard fire
+  firing_lines = [RULE_LINE.format(i % 60, i % 59, i % 97, 10000 + i) + ' warn {0}'.format(i % len(RULE_FORMATS) * 20 + 4)
+                  for i in xrange(10000)]
+  seconds = best_time(lambda: [ruleSet.search_indices(line) for line in firing_lines], repeat=3)
+  report('rules', '{0} lines firing merged rules'.format(len(firing_lines)), '{0:,.0f} lines/sec'.format(len(firing_lines) / seconds))
+  compiled = regexeze.compile_many([pattern for _, pattern in rules], capture=False)
+  sample = distinct_lines[:200]
+  seconds = best_time(lambda: [[pattern.search(line) for pattern in compiled] for line in sample], repeat=1)
+  report('rules', '{0} lines, each rule in turn'.format(len(sample)), '{0:,.0f} lines/sec'.format(len(sample) / seconds))
+
+#a pattern requiring a literal which one log line in a hundred holds
+PREFILTER_PATTERN = ("expr: [ name: user; expr: alphanumeric for one_or_more; ]; expr: ' failed login from ';"
+                     "expr: [ name: address; expr: any_char of '0123456789.' for one_or_more; ];")
+PREFILTER_LINE_MATCHING = 'sshd[{0}]: root failed login from 10.0.0.{1}'
+
+def benchmark_prefilter():
+  '''
+  Throughput of searching log lines for a pattern requiring a literal, rejecting the lines lacking it with str.find first,
+  compared to running the regex on every line
+  '''
+  compiled = regexeze.compile(PREFILTER_PATTERN, capture=False)
+  lines = [PREFILTER_LINE_MATCHING.format(i, i % 256) if i % 100 == 0 else GREP_LINE.format(i % 60, i) for i in xrange(100000)]
+  search = compiled.search
+  seconds = best_time(lambda: [search(line) for line in lines], repeat=3)
+  report('prefilter', 'required literals {0!r}'.format(compiled.required_literals), '{0:,.0f} lines/sec'.format(len(lines) / seconds))
+  search = compiled.regex.search
+  seconds = best_time(lambda: [search(line) for line in lines], repeat=3)
+  report('prefilter', 'regex on every line', '{0:,.0f} lines/sec'.format(len(lines) / seconds))
+
+def benchmark_pack():
+  '''
+  Loading the rules of 50,000 pattern files from a pack, compared to translating the files
+  '''
+  n_rules = 50000
+  directory = tempfile.mkdtemp()
+  try:
+    sources = os.path.join(directory, 'rules')
+    os.mkdir(sources)
+    for index, pattern in enumerate(build_patterns(n_rules)):
+      with open(os.path.join(sources, 'rule{0}.rgxz'.format(index)), 'w') as pattern_file:
+        pattern_file.write(pattern + '\n')
+    pack = os.path.join(directory, 'rules.rgxp')
+    seconds = best_time(lambda: regexeze.build_pack([sources], pack), repeat=1)
+    report('pack', '{0} rules, building'.format(n_rules), '{0:,.0f} rules/sec, {1}'.format(n_rules / seconds, format_size(os.path.getsize(pack))))
+    seconds = best_time(lambda: regexeze.load_pack(pack))
+    report('pack', '{0} rules, loading'.format(n_rules), '{0:.1f} ms'.format(seconds * 1000))
+    rules = regexeze.load_pack(pack)
+    seconds = best_time(lambda: [rules.pattern(index) for index in xrange(1000)], repeat=1)
+    report('pack', 'first use of a rule', '{0:.1f} us'.format(seconds / 1000 * 1e6))
+    filenames = [os.path.join(sources, name) for name in os.listdir(sources)]
+    seconds = best_time(lambda: [regexeze.translate(source=filename) for filename in filenames], repeat=1)
+    report('pack', '{0} rules, translating the files'.format(n_rules), '{0:.1f} ms'.format(seconds * 1000))
+  finally:
+    shutil.rmtree(directory)
+
+def load_in_child(n_patterns, used):
+  '''
+  Make compiled patterns from translations in a fresh process, as a worker loading a rule pack would, then use some of them
+  @param n_patterns: the number of patterns
+  @type n_patterns: int
+  @param used: the fraction of the patterns used
+  @type used: float
+  @return: the time taken in seconds, the growth of the private memory in KB (or None), and the number of patterns never used
+  @rtype: tuple (float, int, int)
+  '''
+  translations = regexeze.translate_many(build_patterns(n_patterns))
+  private = private_memory()
+  start = time.time()
+  compiled = [regexeze.RegexezePattern(translation) for translation in translations]
+  for pattern in compiled[:int(n_patterns * used)]:
+    pattern.regex
+  seconds = time.time() - start
+  private_growth = private_memory() - private if private is not None else None
+  return seconds, private_growth, regexeze.pattern_info().unused
+
+def benchmark_lazy():
+  '''
+  Startup time and memory of a process compiling 20,000 patterns and using a few of them, compared to using them all
+  (as when every regex was compiled up front)
+  '''
+  n_patterns = 20000
+  for used in [0.05, 1.0]:
+    pool = multiprocessing.Pool(1)
+    try:
+      seconds, private_growth, unused = pool.apply(load_in_child, (n_patterns, used))
+    finally:
+      pool.terminate()
+      pool.join()
+    memory = 'unknown memory' if private_growth is None else format_size(private_growth * 1024) + ' private memory'
+    report('lazy', '{0} patterns, {1:.0%} used'.format(n_patterns, used), '{0:.2f} s, {1}, {2} never used'.format(seconds, memory, unused))
+
+def benchmark_import():
+  '''
+  Time taken by a fresh interpreter to import regexeze, over the time it takes to start at all
+  (Python 2 has no -X importtime, so whole processes are timed, the best of many runs)
+  '''
+  directory = os.path.dirname(os.path.abspath(__file__))
+  def run(statement):
+    return lambda: subprocess.check_call([sys.executable, '-c', statement], cwd=directory)
+  startup = best_time(run('pass'), repeat=20)
+  seconds = best_time(run('import regexeze'), repeat=20)
+  modules = subprocess.check_output([sys.executable, '-c', 'import sys; n = len(sys.modules); import regexeze; print len(sys.modules) - n'],
+                                    cwd=directory)
+  report('import', 'import regexeze', '{0:.1f} ms over a startup of {1:.1f} ms, {2} modules loaded'.format((seconds - startup) * 1000, startup * 1000,
+                                                                                                         int(modules)))
+
+def translate_in_child(n_patterns):
+  '''
+  Translate the patterns of a rule pack in a fresh process, so that the memory taken by the translation can be told apart
+  @param n_patterns: the number of patterns
+  @type n_patterns: int
+  @return: the time taken in seconds, and the growth of the peak resident memory in KB
+  @rtype: tuple (float, int)
+  '''
+  patterns = build_patterns(n_patterns)
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start = time.time()
+  regexeze.translate_many(patterns)
+  seconds = time.time() - start
+  return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak
+
+def benchmark_memory():
+  '''
+  Memory taken by parsers, and peak memory while translating the patterns of a rule pack
+  (Python 2 has no tracemalloc: parsers are measured with sys.getsizeof, translation by the peak resident memory of a fresh process)
+  '''
+  parser = regexeze.RegexezeObject("expr: 'a';")
+  parser.parse()
+  size = sys.getsizeof(parser) + (sys.getsizeof(vars(parser)) if hasattr(parser, '__dict__') and vars(parser) else 0)
+  report('memory', 'parser', format_size(size))
+  states = regexeze.regexeze_states.RegexStateFactory.STATE_DICTIONARY.values()
+  size = sum(sys.getsizeof(state) + (sys.getsizeof(vars(state)) if hasattr(state, '__dict__') else 0) for state in states)
+  report('memory', '{0} states'.format(len(states)), format_size(size))
+  n_patterns = 50000
+  pool = multiprocessing.Pool(1)
+  try:
+    seconds, peak_growth = pool.apply(translate_in_child, (n_patterns,))
+  finally:
+    pool.terminate()
+    pool.join()
+  report('memory', '{0} patterns, translate_many'.format(n_patterns), '{0:.2f} s, {1} peak memory'.format(seconds, format_size(peak_growth * 1024)))
+
+def benchmark_errors():
+  '''
+  Validation of 100,000 patterns with invalid syntax: rejecting them, then writing out the messages of all of them
+  '''
+  patterns = [pattern[:-1] + ' twice;' for pattern in build_patterns(100000)]
+  private = private_memory()
+  start = time.time()
+  errors = regexeze.translate_many(patterns)
+  seconds = time.time() - start
+  memory = 'unknown memory' if private is None else format_size((private_memory() - private) * 1024) + ' held'
+  report('errors', 'rejecting', '{0:,.0f} patterns/sec, {1}'.format(len(patterns) / seconds, memory))
+  seconds = best_time(lambda: [str(error) for error in errors], repeat=1)
+  report('errors', 'writing the messages', '{0:,.0f} errors/sec'.format(len(errors) / seconds))
+
+BENCHMARKS = OrderedDict([ ('lexer', benchmark_lexer),
+                           ('translate', benchmark_translate),
+                           ('batch', benchmark_batch),
+                           ('emit', benchmark_emit),
+                           ('capture', benchmark_capture),
+                           ('optimize', benchmark_optimize),
+                           ('nesting', benchmark_nesting),
+                           ('ingest', benchmark_ingest),
+                           ('grep', benchmark_grep),
+                           ('scan', benchmark_scan),
+                           ('parallel', benchmark_parallel),
+                           ('rules', benchmark_rules),
+                           ('prefilter', benchmark_prefilter),
+                           ('pack', benchmark_pack),
+                           ('lazy', benchmark_lazy),
+                           ('import', benchmark_import),
+                           ('memory', benchmark_memory),
+                           ('errors', benchmark_errors) ])
+
+def main():
+  parser = argparse.ArgumentParser(description='Runs the regexeze benchmarks.')
+  parser.add_argument('benchmarks', nargs='*', help='The benchmarks to run (default: all): ' + ', '.join(BENCHMARKS.keys()))
+  args = parser.parse_args()
+  for name in args.benchmarks:
+    if name not in BENCHMARKS:
+      parser.error('unknown benchmark: ' + name)
+  for name in args.benchmarks or BENCHMARKS.keys():
+    BENCHMARKS[name]()
+
+if __name__ == '__main__':
+  main()
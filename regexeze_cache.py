@@ -0,0 +1,285 @@
+import threading
+import marshal
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+#statistics snapshot returned by PatternCache.info, modelled on functools.lru_cache
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+#statistics snapshot returned by PatternUsage.info
+UsageInfo = namedtuple('UsageInfo', ['created', 'compiled', 'unused'])
+
+class PatternCache(object):
+  '''
+  A bounded, thread-safe least recently used cache for translated and compiled patterns
+  @param maxsize: the maximum number of entries kept before the least recently used one is evicted (0 disables caching)
+  @type maxsize: int
+  @param entries: the cached entries, ordered from least to most recently used
+  @type entries: OrderedDict
+  @param hits: number of lookups that found an entry
+  @type hits: int
+  @param misses: number of lookups that did not find an entry
+  @type misses: int
+  @param evictions: number of entries dropped because the cache was full
+  @type evictions: int
+  '''
+  DEFAULT_MAXSIZE = 512
+
+  def __init__(self, maxsize=DEFAULT_MAXSIZE):
+    self.maxsize = maxsize
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key, default=None):
+    '''
+    Look up an entry, marking it as most recently used
+    @param key: the key of the entry
+    @type key: hashable
+    @param default: the value returned when the key is not cached
+    @return: the cached value, or default
+    '''
+    with self.lock:
+      try:
+        value = self.entries.pop(key)
+      except KeyError:
+        self.misses += 1
+        return default
+      self.entries[key] = value
+      self.hits += 1
+      return value
+
+  def put(self, key, value):
+    '''
+    Store an entry, evicting the least recently used entries if the cache is full
+    @param key: the key of the entry
+    @type key: hashable
+    @param value: the value to be cached
+    '''
+    with self.lock:
+      self.entries.pop(key, None)
+      if self.maxsize <= 0:
+        return
+      self.entries[key] = value
+      self.evict()
+
+  def evict(self):
+    '''
+    Drops least recently used entries until the cache fits in maxsize (caller must hold the lock)
+    '''
+    while len(self.entries) > max(self.maxsize, 0):
+      self.entries.popitem(last=False)
+      self.evictions += 1
+
+  def resize(self, maxsize):
+    '''
+    Change the maximum size of the cache, evicting entries if it shrinks
+    @param maxsize: the new maximum number of entries
+    @type maxsize: int
+    '''
+    with self.lock:
+      self.maxsize = maxsize
+      self.evict()
+
+  def clear(self):
+    '''
+    Drop every entry and reset the statistics
+    '''
+    with self.lock:
+      self.entries.clear()
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+
+  def info(self):
+    '''
+    @return: a snapshot of the cache statistics
+    @rtype: CacheInfo
+    '''
+    with self.lock:
+      return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self.entries))
+
+class PatternUsage(object):
+  '''
+  Thread-safe counts of the compiled patterns created, and of those whose regex was compiled because they were used
+  @param created: number of patterns created
+  @type created: int
+  @param compiled: number of patterns whose regex was compiled
+  @type compiled: int
+  '''
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.created = 0
+    self.compiled = 0
+
+  def add_created(self):
+    with self.lock:
+      self.created += 1
+
+  def add_compiled(self):
+    with self.lock:
+      self.compiled += 1
+
+  def info(self):
+    '''
+    @rtype: UsageInfo
+    '''
+    with self.lock:
+      #threads racing to use a pattern first may both count it
+      return UsageInfo(self.created, self.compiled, max(self.created - self.compiled, 0))
+
+class DiskCache(object):
+  '''
+  A persistent cache of translations, shared between processes, in a directory with one file per entry
+  Entries are keyed by a hash of the pattern text and the version of the translator, so edited files and upgrades miss the cache
+  Entries are written to a temporary file which is then renamed into place, so concurrent writers never leave a partial entry
+  The least recently used entries are pruned beyond maxsize entries, and entries unused for max_age seconds are dropped
+  @param path: the directory holding the entries (created if needed)
+  @type path: str
+  @param version: the version of the translator producing the entries
+  @type version: str
+  @param maxsize: the maximum number of entries kept after pruning
+  @type maxsize: int
+  @param max_age: the number of seconds an entry is kept without being used, or None to keep entries regardless of age
+  @type max_age: float
+  @param puts: number of entries written since the cache was last pruned
+  @type puts: int
+  '''
+  DEFAULT_MAXSIZE = 4096
+  ENTRY_SUFFIX = '.rgxc'
+  TEMPORARY_SUFFIX = '.tmp'
+  #seconds after which a temporary file is left over from a writer that died, rather than being written
+  TEMPORARY_MAX_AGE = 3600
+  #entries written between two prunings
+  PRUNE_INTERVAL = 256
+
+  def __init__(self, path, version, maxsize=DEFAULT_MAXSIZE, max_age=None):
+    self.path = path
+    self.version = version
+    self.maxsize = maxsize
+    self.max_age = max_age
+    self.puts = 0
+    if not os.path.isdir(path):
+      try:
+        os.makedirs(path)
+      except OSError:
+        #another process may have created it in the meantime
+        if not os.path.isdir(path):
+          raise
+    self.prune()
+
+  def key(self, content, *options):
+    '''
+    @param content: the text of a pattern
+    @type content: str
+    @param options: the options the pattern is translated with
+    @return: the key of the entry for content
+    @rtype: str
+    '''
+    #imported here, only the disk cache needs it
+    import hashlib
+    return hashlib.sha1(self.version + repr(options) + '\0' + content).hexdigest()
+
+  def entry_path(self, key):
+    return os.path.join(self.path, key + self.ENTRY_SUFFIX)
+
+  def get(self, key, default=None):
+    '''
+    Look up an entry, marking it as recently used
+    @param key: the key of the entry (see key)
+    @type key: str
+    @param default: the value returned when the key is not cached
+    @return: the cached value, or default
+    '''
+    entry_path = self.entry_path(key)
+    try:
+      with open(entry_path, 'rb') as entry_file:
+        value = marshal.load(entry_file)
+      os.utime(entry_path, None)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+      #missing, pruned meanwhile, or unreadable
+      return default
+    return value
+
+  def put(self, key, value):
+    '''
+    Store an entry, pruning the cache every PRUNE_INTERVAL entries
+    @param key: the key of the entry (see key)
+    @type key: str
+    @param value: the value to be cached, made of str, int, tuple, list and dict only
+    '''
+    #imported here, only writing needs it
+    import tempfile
+    descriptor, temporary_path = tempfile.mkstemp(suffix=self.TEMPORARY_SUFFIX, dir=self.path)
+    try:
+      with os.fdopen(descriptor, 'wb') as entry_file:
+        marshal.dump(value, entry_file)
+    except BaseException:
+      #unmarshallable value, full disk, interrupt...: the entry is not stored, and its temporary file must not outlive it
+      self.remove(temporary_path)
+      raise
+    try:
+      os.rename(temporary_path, self.entry_path(key))
+    except OSError:
+      #on some platforms rename fails if another writer got there first, leaving an identical entry
+      self.remove(temporary_path)
+    self.puts += 1
+    if self.puts >= self.PRUNE_INTERVAL:
+      self.prune()
+
+  def remove(self, path):
+    '''
+    Remove a file of the cache, if another process has not removed it already
+    @param path: the path of the file
+    @type path: str
+    '''
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+  def entries(self, suffix=ENTRY_SUFFIX):
+    '''
+    @param suffix: the suffix of the files listed (TEMPORARY_SUFFIX lists the temporary files of writers)
+    @type suffix: str
+    @return: the path and the time of last use of each entry
+    @rtype: list of tuple (str, float)
+    '''
+    entries = []
+    for name in os.listdir(self.path):
+      if name.endswith(suffix):
+        entry_path = os.path.join(self.path, name)
+        try:
+          entries.append((entry_path, os.path.getmtime(entry_path)))
+        except OSError:
+          pass
+    return entries
+
+  def prune(self):
+    '''
+    Remove the entries older than max_age, then the least recently used entries beyond maxsize, and the temporary files
+    left over by writers that died (older than TEMPORARY_MAX_AGE, so that files still being written are kept)
+    '''
+    self.puts = 0
+    oldest_temporary = time.time() - self.TEMPORARY_MAX_AGE
+    for temporary_path, modified in self.entries(self.TEMPORARY_SUFFIX):
+      if modified < oldest_temporary:
+        self.remove(temporary_path)
+    entries = sorted(self.entries(), key=lambda entry: entry[1], reverse=True)
+    if self.max_age is not None:
+      oldest = time.time() - self.max_age
+      stale = [entry for entry in entries if entry[1] < oldest]
+      entries = [entry for entry in entries if entry[1] >= oldest]
+    else:
+      stale = []
+    for entry_path, _ in stale + entries[max(self.maxsize, 0):]:
+      self.remove(entry_path)
+
+  def clear(self):
+    '''
+    Remove every entry
+    '''
+    for entry_path, _ in self.entries():
+      self.remove(entry_path)
@@ -1,148 +1,265 @@
+import regexeze_lexer
+
 class Error(Exception):
-  '''Base class for exceptions in this module.'''
+  '''
+  Base class for exceptions in this module
+  Errors only take note of where the parser stopped: the offset, line and column of the token are worked out, and the
+  message written, when they are asked for, so that rejecting a pattern costs little more than parsing it
+  @param code: what went wrong, for programs (the message is meant for people)
+  @type code: str
+  @param token: the token the parser stopped at
+  @type token: str
+  @param token_index: the number of tokens of the input before that token
+  @type token_index: int
+  @param arg_string: the input of the parser
+  @type arg_string: str
+  @param lines: whether the input was split into tokens line by line (see regexeze_lexer.RegexezeLineLexer)
+  @type lines: bool
+  @param token_offset: the position of the token in the input, once worked out (see offset), or None
+  @type token_offset: int
+  '''
+  #errors may be made by the hundred thousand when validating patterns: their attributes are slots, so they have no
+  #__dict__ unless other attributes are set on them (index and source are set on errors raised by batches and packs)
+  __slots__ = ('token', 'token_index', 'arg_string', 'lines', 'token_offset', 'index', 'source')
+
+  code = 'invalid_syntax'
+  message = 'Invalid syntax'
+
   def __init__(self, parser):
-    self.msg = 'Invalid syntax'
-    self.msg += '\n' + self.show_error_location(parser)
+    #the parser is not kept (not even in args): it may be reset for the next pattern, and would keep the tree alive
+    Exception.__init__(self)
+    self.token = parser.current_token
+    self.token_index = parser.token_index
+    self.arg_string = parser.arg_string
+    self.lines = isinstance(parser.tokenizer, (regexeze_lexer.RegexezeLineLexer, regexeze_lexer.ShlexLineLexer))
+    self.token_offset = None
 
   def __str__(self):
     return self.msg
 
-  def show_error_location(self, parser):
-    arg_string = parser.arg_string
-    index = parser.arg_string.find(parser.current_token, parser.approximate_location)
-    if index >= 0:
-      return arg_string + '\n' + ' ' * index + '^'
-    else:
-      return arg_string + '\n' + ' ' * len(arg_string) + '^'
+  def __reduce__(self):
+    #errors are rebuilt from their attributes, as they are not made from a parser when unpickled (e.g. sent by a worker process)
+    state = dict(self.__dict__)
+    for error_class in type(self).__mro__:
+      for name in vars(error_class).get('__slots__', ()):
+        if hasattr(self, name):
+          state[name] = getattr(self, name)
+    return restore_error, (type(self), state)
+
+  @property
+  def offset(self):
+    '''
+    @return: the position of the token in the input, or its length for the end of the input
+    @rtype: int
+    '''
+    if self.token_offset is None:
+      self.token_offset = regexeze_lexer.token_offset(self.arg_string, self.token_index, self.lines)
+    return self.token_offset
+
+  @property
+  def line(self):
+    '''
+    @return: the line of the token, counting from 1
+    @rtype: int
+    '''
+    return self.arg_string.count('\n', 0, self.offset) + 1
+
+  @property
+  def column(self):
+    '''
+    @return: the column of the token in its line, counting from 1
+    @rtype: int
+    '''
+    return self.offset - self.arg_string.rfind('\n', 0, self.offset)
+
+  @property
+  def msg(self):
+    return self.describe() + '\n' + self.show_error_location()
+
+  def describe(self):
+    '''
+    @return: what is wrong with the input, without where
+    @rtype: str
+    '''
+    return self.message
+
+  def show_error_location(self):
+    '''
+    @return: the line of the token, and a caret under it
+    @rtype: str
+    '''
+    offset = self.offset
+    start = self.arg_string.rfind('\n', 0, offset) + 1
+    end = self.arg_string.find('\n', offset)
+    line = self.arg_string[start:end] if end >= 0 else self.arg_string[start:]
+    return line + '\n' + ' ' * (offset - start) + '^'
+
+def restore_error(error_class, state):
+  '''
+  Rebuild a pickled error without a parser
+  @param error_class: the class of the error
+  @type error_class: type
+  @param state: the attributes of the error
+  @type state: dict
+  @rtype: Error
+  '''
+  error = error_class.__new__(error_class)
+  for name, value in state.items():
+    setattr(error, name, value)
+  return error
 
 class NewExpressionError(Error):
   '''
   Exception raised when a new expression does not start with expr
   '''
-  def __init__(self, parser):
-    self.msg = 'Each expression must start with expr\n'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'new_expression'
+  message = 'Each expression must start with expr\n'
 
 class NewNestedExpressionError(Error):
   '''
   Exception raised when a new nested expression does not start with expr
   '''
-  def __init__(self, parser):
-    self.msg = 'Each nested expression must start with <expr> or <name>\nIf you were trying to use an open square bracket ([) as an expression, remember to use a valid modifier and end with a semicolon.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'new_nested_expression'
+  message = 'Each nested expression must start with <expr> or <name>\nIf you were trying to use an open square bracket ([) as an expression, remember to use a valid modifier and end with a semicolon.'
 
 class UnclosedBracketError(Error):
   '''
   Exception raised when a nested expression is not finished
   '''
+  code = 'unclosed_bracket'
+  message = 'Each nested expression must end with a closed square bracket\nIf you were trying to use an open square bracket ([) as an expression, remember to use a valid modifier and end with a semicolon.'
+
+class NestingDepthError(Error):
+  '''
+  Exception raised when nested expressions are nested deeper than the parser allows (see RegexezeObject.max_nesting_depth)
+  '''
+  __slots__ = ('max_nesting_depth',)
+
+  code = 'nesting_depth'
+  message = 'Nested expressions can not be nested more than {0} levels deep.\nThe limit can be raised with regexeze.set_max_nesting_depth.'
+
   def __init__(self, parser):
-    self.msg = 'Each nested expression must end with a closed square bracket\nIf you were trying to use an open square bracket ([) as an expression, remember to use a valid modifier and end with a semicolon.'
-    self.msg += '\n' + self.show_error_location(parser)
+    super(NestingDepthError, self).__init__(parser)
+    self.max_nesting_depth = parser.max_nesting_depth
+
+  def describe(self):
+    return self.message.format(self.max_nesting_depth)
 
 class IncompleteExpressionError(Error):
   '''
   Exception raised when a new expression is empty
   '''
-  def __init__(self, parser):
-    self.msg = 'Each expression must end in a semi-colon.\nFor empty input, remember to use quotes.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'incomplete_expression'
+  message = 'Each expression must end in a semi-colon.\nFor empty input, remember to use quotes.'
 
 class IncompleteClassError(Error):
   '''
   Exception raised when an expression ends on the keyword "of" indicating a class
   '''
-  def __init__(self, parser):
-    self.msg = 'Keywords "of" and "except" must be followed by the set of characters to be included in the class.\nEmpty string can not be put into character class.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'incomplete_class'
+  message = 'Keywords "of" and "except" must be followed by the set of characters to be included in the class.\nEmpty string can not be put into character class.'
 
 class IncompleteClassRangeError(Error):
   '''
   Exception raised when an expression ends on the keyword "from" or "to", indicating a range in a class
   '''
-  def __init__(self, parser):
-    self.msg = 'When specifying a range of characters in a character class, you must have both a "from" value and a "to" value.\nFor example: expr: any_char from "a" to "z";'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'incomplete_class_range'
+  message = 'When specifying a range of characters in a character class, you must have both a "from" value and a "to" value.\nFor example: expr: any_char from "a" to "z";'
 
 class InvalidClassRangeError(Error):
   '''
   Exception raised when a class range indicated is somehow invalid
   To be valid, class ranges must be between single characters that are in order
   '''
-  def __init__(self, parser):
-    self.msg = 'Class range must be between single characters, and they must be in order.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'invalid_class_range'
+  message = 'Class range must be between single characters, and they must be in order.'
 
 class IncompleteOrError(Error):
   '''
   Exception raised when expression ends right after or symbol (|)
   '''
-  def __init__(self, parser):
-    self.msg = 'Invalid syntax after or.\nTo make an empty or alternative, remember to put the empty string in quotes and still end with a semicolon.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'incomplete_or'
+  message = 'Invalid syntax after or.\nTo make an empty or alternative, remember to put the empty string in quotes and still end with a semicolon.'
 
 class MultipleOrError(Error):
   '''
   Exception raised when multiple expressions occur at the same nesting level as an or
   '''
-  def __init__(self, parser):
-    self.msg = '''Expressions involving the keyword or cannot be follow or be followed by other expressions.\nTo include or statements in larger expressions, nest them.\nFor example, this will not work: expr: "a" or "b"; expr: "c";\nNether will this: expr: "a"; expr: "b" or "c";\nBut, if you wanted to have either a or b followed by c, you could do this: expr: [ expr: "a" or "b";]; expr: "c";\nThe same logic applies for a followed by b or c.'''
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'multiple_or'
+  message = '''Expressions involving the keyword or cannot be follow or be followed by other expressions.\nTo include or statements in larger expressions, nest them.\nFor example, this will not work: expr: "a" or "b"; expr: "c";\nNether will this: expr: "a"; expr: "b" or "c";\nBut, if you wanted to have either a or b followed by c, you could do this: expr: [ expr: "a" or "b";]; expr: "c";\nThe same logic applies for a followed by b or c.'''
 
 class ColonError(Error):
   '''
   Exception raised when there is a missing colon after group name
   '''
-  def __init__(self, parser):
-    self.msg = 'The keyword <expr> must be followed by a colon. The keyword <name> must also be followed by a colon.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'colon'
+  message = 'The keyword <expr> must be followed by a colon. The keyword <name> must also be followed by a colon.'
 
 class FlagsColonError(Error):
   '''
   Exception raised when set_flags is not followed by colon
   '''
-  def __init__(self, parser):
-    self.msg = 'set_flags must be followed by colon'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'flags_colon'
+  message = 'set_flags must be followed by colon'
 
 class InvalidFlagError(Error):
   '''
   Exception raised when an invalid flag is selected
   '''
-  def __init__(self, parser):
-    self.msg = 'Flags must be valid and listed in a comma-separated list, followed by a semicolon (;).\nValid flags: ignore_case, multiline, locale, any_char_all, unicode.\nFlags may be listed in any order.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'invalid_flag'
+  message = 'Flags must be valid and listed in a comma-separated list, followed by a semicolon (;).\nValid flags: ignore_case, multiline, locale, any_char_all, unicode.\nFlags may be listed in any order.'
 
 class InvalidGroupNameError(Error):
   '''
   Exception raised when aa group is already in the namespace
   '''
-  def __init__(self, parser):
-    self.msg = 'Invalid group name: <' + parser.current_token + '> is already used as a group name, or is an existing regexeze keyword'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'invalid_group_name'
+  message = 'Invalid group name: <{0}> is already used as a group name, or is an existing regexeze keyword'
+
+  def describe(self):
+    return self.message.format(self.token)
 
 class InvalidModifierError(Error):
   '''
   Exception raised when an expr value is followed by something other than a key word or end bracket
   '''
-  def __init__(self, parser):
-    self.msg = '''Invalid modifier for an expression.\nPossible Causes:\n- A missing semi-colon at the end of an expression\n- A misplaced "expr:" after the keyword "or"\n- An empty expression or expression with a special character that is not put in quotes.\n- Incorrect usage of or_of, or_except, and or_from: or_of and or_except are valid after both "of" and "from...to" expressions, but or_except can only follow "except" expressions\n- Modifying an unmodifiable expression, such as start_of_string or end_of_string'''
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'invalid_modifier'
+  message = '''Invalid modifier for an expression.\nPossible Causes:\n- A missing semi-colon at the end of an expression\n- A misplaced "expr:" after the keyword "or"\n- An empty expression or expression with a special character that is not put in quotes.\n- Incorrect usage of or_of, or_except, and or_from: or_of and or_except are valid after both "of" and "from...to" expressions, but or_except can only follow "except" expressions\n- Modifying an unmodifiable expression, such as start_of_string or end_of_string'''
 
 class InvalidRepetitionsError(Error):
   '''
   Exception raised when keyword for is followed by an incorrect token
   '''
-  def __init__(self, parser):
-    self.msg = 'Invalid number of repetitions specified after key word "for"\nValid repetitions include integers or keywords such as zero_or_more or one_or_zero'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'invalid_repetitions'
+  message = 'Invalid number of repetitions specified after key word "for"\nValid repetitions include integers or keywords such as zero_or_more or one_or_zero'
 
 class InvalidRepetitionRangeError(Error):
   '''
   Exception raised when keyword up_to is followed by an incorrect token
   '''
-  def __init__(self, parser):
-    self.msg = 'Invalid number of repetitions specified after key word "up_to"\nMust be followed by an integer greater than or equal to the first number, or else the infinity keyword.'
-    self.msg += '\n' + self.show_error_location(parser)
+  code = 'invalid_repetition_range'
+  message = 'Invalid number of repetitions specified after key word "up_to"\nMust be followed by an integer greater than or equal to the first number, or else the infinity keyword.'
+
+class QuotationError(Error, ValueError):
+  '''
+  Exception raised when a quote or backslash escape is not terminated
+  It is also a ValueError, as the lexer errors it is made from (see regexeze_lexer.LexerError)
+  @param lexer_message: the message of the lexer (the same as shlex's)
+  @type lexer_message: str
+  '''
+  __slots__ = ('lexer_message',)
+
+  code = 'unterminated_quote'
+
+  def __init__(self, parser, lexer_error):
+    Error.__init__(self, parser)
+    self.lexer_message = str(lexer_error)
+    #the lexer knows exactly where the quote is, in the last piece of input it was given
+    self.token_offset = len(self.arg_string) - len(parser.tokenizer.input) + lexer_error.position
+    self.token = self.arg_string[self.token_offset]
+
+  def describe(self):
+    return self.lexer_message
 
 if __name__ == '__main':
   pass
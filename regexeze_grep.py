@@ -0,0 +1,443 @@
+import regexeze_ast
+import sys
+import os
+import json
+import mmap
+from itertools import izip
+from collections import namedtuple
+
+#what is written for each input: the records that match, every match, the number of records that match, or the named groups of every match
+LINES = 'lines'
+MATCHES = 'matches'
+COUNT = 'count'
+GROUPS = 'groups'
+OUTPUTS = [LINES, MATCHES, COUNT, GROUPS]
+
+#how it is written: as plain text (like grep), or as one JSON object per line
+TEXT = 'text'
+JSON = 'json'
+FORMATS = [TEXT, JSON]
+
+DEFAULT_RECORD_SEPARATOR = '\n'
+#name given to stdin in the output
+STDIN_NAME = '-'
+
+#a match found in a whole file, with its text and groups copied out of the file
+ScanMatch = namedtuple('ScanMatch', ['start', 'end', 'match', 'groups', 'named_groups'])
+
+#bytes of a file searched by a worker at a time, and bytes searched past the end of a chunk for the matches starting in it
+DEFAULT_CHUNK_SIZE = 1 << 24
+DEFAULT_OVERLAP = 1 << 16
+
+def max_match_width(regex):
+  '''
+  @param regex: the compiled regular expression
+  @type regex: re.RegexObject
+  @return: the most characters a match of the regular expression can span, or None if there is no such bound, or it is not known
+  (sre_parse does not measure group references and lookarounds)
+  @rtype: int
+  '''
+  #imported here, only searches in windows need it
+  import sre_parse
+  import sre_constants
+  try:
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+  except (sre_constants.error, RuntimeError):
+    return None
+  pending = [parsed]
+  while pending:
+    item = pending.pop()
+    if isinstance(item, sre_parse.SubPattern):
+      for op, av in item.data:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+          return None
+        pending.append(av)
+    elif isinstance(item, (tuple, list)):
+      pending.extend(item)
+  width = parsed.getwidth()[1]
+  return None if width >= sre_constants.MAXREPEAT else width
+
+def scan_buffer(regex, buffer, start=0, end=None, overlap=DEFAULT_OVERLAP, required_literals=()):
+  '''
+  Find the matches of a regular expression in a buffer, one at a time
+  With an end, only matches starting before it are found, exactly as searching the whole buffer would find them.
+  If every match is shorter than overlap bytes, the buffer is searched no further than overlap bytes past the end;
+  otherwise the search for the last match starting before the end may run on up to the next match (or the end of the buffer)
+  @param regex: the compiled regular expression
+  @type regex: re.RegexObject
+  @param buffer: the text searched (a string or a memory map)
+  @type buffer: str or mmap.mmap
+  @param start: the offset of the first match
+  @type start: int
+  @param end: the offset before which matches start, or None for the end of the buffer
+  @type end: int
+  @param overlap: the number of bytes searched past end, if every match is shorter
+  @type overlap: int
+  @param required_literals: text every match contains: the regex is not run if the searched part of the buffer lacks any of it
+  @type required_literals: tuple of str
+  @return: the matches, in order
+  @rtype: iterator of ScanMatch
+  '''
+  size = len(buffer)
+  if end is None or end >= size:
+    end = size + 1
+    window_end = size
+  else:
+    width = max_match_width(regex)
+    #with endpos, $, \Z and \b match at the end of the window, and matches are cut short or missed there: the window must hold
+    #every character a search starting before end looks at, which is two past the longest match ($ also matches before a final
+    #newline)
+    window_end = size if width is None or width >= overlap else min(end + overlap, size)
+  if regexeze_ast.missing_literal(buffer, required_literals, start, window_end):
+    return
+  for match in regex.finditer(buffer, start, window_end):
+    if match.start() >= end:
+      break
+    yield ScanMatch(match.start(), match.end(), match.group(), match.groups(), match.groupdict())
+
+def map_file(path):
+  '''
+  @param path: the name of the file
+  @type path: str
+  @return: a read-only memory map of the file, or None if the file is empty (empty files can not be mapped)
+  @rtype: mmap.mmap
+  '''
+  with open(path, 'rb') as input_file:
+    if os.fstat(input_file.fileno()).st_size == 0:
+      return None
+    return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def scan(regex, path, required_literals=()):
+  '''
+  Find every match of a regular expression in a file, which is memory mapped rather than read:
+  the file is searched as a whole (patterns may span lines) and is never loaded into a Python string
+  The file stays mapped until the matches have all been found or the iterator is closed
+  @param regex: the compiled regular expression
+  @type regex: re.RegexObject
+  @param path: the name of the file
+  @type path: str
+  @param required_literals: text every match contains (see scan_buffer)
+  @type required_literals: tuple of str
+  @return: the matches, in order
+  @rtype: iterator of ScanMatch
+  '''
+  mapped = map_file(path)
+  if mapped is None:
+    for match in scan_buffer(regex, ''):
+      yield match
+    return
+  try:
+    for match in scan_buffer(regex, mapped, required_literals=required_literals):
+      yield match
+  finally:
+    #matches only hold copies, so nothing refers to the map any more
+    mapped.close()
+
+def chunk_ranges(buffer, chunk_size=DEFAULT_CHUNK_SIZE, separator=DEFAULT_RECORD_SEPARATOR):
+  '''
+  Split a buffer into ranges of about chunk_size bytes, each ending just after a separator (or at the end of the buffer)
+  @param buffer: the text to be split (a string or a memory map)
+  @type buffer: str or mmap.mmap
+  @param chunk_size: the least number of bytes in a range, but for the last one
+  @type chunk_size: int
+  @param separator: the string the ranges end with
+  @type separator: str
+  @return: the start and end offsets of each range, in order
+  @rtype: list of tuple (int, int)
+  '''
+  size = len(buffer)
+  ranges = []
+  start = 0
+  while start < size:
+    end = buffer.find(separator, max(start, start + chunk_size - len(separator)))
+    end = size if end == -1 else end + len(separator)
+    ranges.append((start, end))
+    start = end
+  return ranges
+
+def _scan_chunk(chunk):
+  '''
+  Search a range of a file in a worker process
+  @param chunk: the regular expression, the name of the file, the start and end of the range, the overlap, and the required literals
+  @type chunk: tuple (re.RegexObject, str, int, int, int, tuple of str)
+  @return: the fields of the matches, as plain tuples (which are sent back much faster than ScanMatch)
+  @rtype: list of tuple
+  '''
+  regex, path, start, end, overlap, required_literals = chunk
+  mapped = map_file(path)
+  try:
+    return [tuple(match) for match in scan_buffer(regex, mapped, start, end, overlap, required_literals)]
+  finally:
+    mapped.close()
+
+def scan_parallel(regex, path, workers, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, separator=DEFAULT_RECORD_SEPARATOR,
+                  required_literals=()):
+  '''
+  Find every match of a regular expression in a file, as scan, searching ranges of the file across a pool of worker processes
+  Each match is found by the worker searching the range it starts in, which searches on into the next ranges (see scan_buffer),
+  so that the matches are those scan finds, none lost nor found twice
+  @param regex: the compiled regular expression
+  @type regex: re.RegexObject
+  @param path: the name of the file
+  @type path: str
+  @param workers: the number of worker processes
+  @type workers: int
+  @param chunk_size: the number of bytes in a range (see chunk_ranges)
+  @type chunk_size: int
+  @param overlap: the number of bytes searched past the end of a range, if no match can be longer
+  @type overlap: int
+  @param separator: the string ranges end with
+  @type separator: str
+  @param required_literals: text every match contains (see scan_buffer): a file lacking any of it is not handed to the workers,
+  nor is a range lacking it searched
+  @type required_literals: tuple of str
+  @return: the matches, in order
+  @rtype: iterator of ScanMatch
+  '''
+  mapped = map_file(path)
+  if mapped is None:
+    for match in scan_buffer(regex, ''):
+      yield match
+    return
+  try:
+    if regexeze_ast.missing_literal(mapped, required_literals):
+      return
+    ranges = chunk_ranges(mapped, chunk_size, separator)
+    #imported here, only searches across processes need it
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+      #the end of the last match found
+      last_end = 0
+      for (start, end), matches in izip(ranges, pool.imap(_scan_chunk, [(regex, path, start, end, overlap, required_literals) for start, end in ranges])):
+        if matches and matches[0][0] < last_end:
+          #the last match of the previous range ran into this one: search it again from where that match ended, as a single search would
+          matches = scan_buffer(regex, mapped, last_end, end, overlap, required_literals)
+        else:
+          matches = map(ScanMatch._make, matches)
+        for match in matches:
+          last_end = match.end
+          yield match
+    finally:
+      pool.terminate()
+      pool.join()
+  finally:
+    mapped.close()
+
+def read_records(input_file, separator=DEFAULT_RECORD_SEPARATOR, read_size=1 << 16):
+  '''
+  Split a stream into records, reading it in large blocks
+  @param input_file: the stream
+  @type input_file: file
+  @param separator: the string ending each record (not part of the records)
+  @type separator: str
+  @param read_size: the number of bytes read at a time
+  @type read_size: int
+  @return: the records, in order
+  @rtype: iterator of str
+  '''
+  #the start of the record that the last block ended in the middle of, in pieces, and its end,
+  #which may hold the start of a separator longer than one character
+  pieces = []
+  tail = ''
+  tail_size = len(separator) - 1
+  while True:
+    block = input_file.read(read_size)
+    if not block:
+      break
+    if separator not in tail + block:
+      pieces.append(block)
+      tail = (tail + block)[-tail_size:] if tail_size else ''
+      continue
+    pieces.append(block)
+    records = ''.join(pieces).split(separator)
+    pieces = [records.pop()]
+    tail = pieces[0][-tail_size:] if tail_size else ''
+    for record in records:
+      yield record
+  last = ''.join(pieces)
+  if last:
+    yield last
+
+class Grep(object):
+  '''
+  Searches streams of records for a compiled pattern, writing what is found to an output stream
+  Output is gathered and written in batches of write_size lines
+  @param pattern: the compiled pattern
+  @type pattern: regexeze.RegexezePattern
+  @param output: what is written (see OUTPUTS)
+  @type output: str
+  @param format: how it is written (see FORMATS)
+  @type format: str
+  @param output_file: the stream written to
+  @type output_file: file
+  @param separator: the string ending each record
+  @type separator: str
+  @param show_names: whether each line written starts with the name of the input
+  @type show_names: bool
+  @param show_numbers: whether each line written for a record starts with the number of the record (from 1)
+  @type show_numbers: bool
+  @param write_size: the number of lines written at a time
+  @type write_size: int
+  @param whole_file: whether files are searched as a whole (see scan) rather than record by record; what is written for each match
+  is then numbered by its offset in the file, and the number of matches is counted
+  @type whole_file: bool
+  @param workers: searching whole files, the number of worker processes searching ranges of each file (see scan_parallel),
+  or None to search in this process
+  @type workers: int
+  @param chunk_size: with workers, the number of bytes in a range
+  @type chunk_size: int
+  @param overlap: with workers, the number of bytes searched past the end of a range, if no match can be longer
+  @type overlap: int
+  @param batch: the lines waiting to be written
+  @type batch: list of str
+  '''
+  def __init__(self, pattern, output=LINES, format=TEXT, output_file=None, separator=DEFAULT_RECORD_SEPARATOR,
+               show_names=False, show_numbers=False, write_size=1024, whole_file=False, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+               overlap=DEFAULT_OVERLAP):
+    self.pattern = pattern
+    self.output = output
+    self.format = format
+    self.output_file = output_file if output_file is not None else sys.stdout
+    self.separator = separator
+    self.show_names = show_names
+    self.show_numbers = show_numbers
+    self.write_size = write_size
+    self.whole_file = whole_file
+    self.number_field = 'offset' if whole_file else 'record'
+    self.workers = workers
+    self.chunk_size = chunk_size
+    self.overlap = overlap
+    self.batch = []
+    #named groups in the order they appear in the pattern
+    self.group_names = sorted(pattern.groupindex, key=pattern.groupindex.get)
+
+  def search_files(self, filenames):
+    '''
+    Search files in turn, stdin standing for STDIN_NAME
+    @param filenames: the names of the files
+    @type filenames: list of str
+    @return: the number of records (or, searching whole files, of matches) that matched, over all files
+    @rtype: int
+    '''
+    regex = self.pattern.regex
+    literals = self.pattern.required_literals
+    count = 0
+    for filename in filenames:
+      if self.whole_file:
+        if filename == STDIN_NAME:
+          #stdin can not be mapped, so it is read
+          count += self.write_matches(scan_buffer(regex, sys.stdin.read(), required_literals=literals), STDIN_NAME)
+        elif self.workers is not None:
+          count += self.write_matches(scan_parallel(regex, filename, self.workers, self.chunk_size, self.overlap, self.separator, literals), filename)
+        else:
+          count += self.write_matches(scan(regex, filename, literals), filename)
+      elif filename == STDIN_NAME:
+        count += self.search(sys.stdin, STDIN_NAME)
+      else:
+        with open(filename, 'rb') as input_file:
+          count += self.search(input_file, filename)
+    return count
+
+  def search(self, input_file, name=STDIN_NAME):
+    '''
+    Search every record of a stream, writing what is found
+    @param input_file: the stream
+    @type input_file: file
+    @param name: the name of the input, as written in the output
+    @type name: str
+    @return: the number of records that matched
+    @rtype: int
+    '''
+    regex = self.pattern.regex
+    literals = self.pattern.required_literals
+    #records are written whole or counted on their first match, but their matches are written as they are found,
+    #so that matching records are searched once
+    find_all = self.output in (MATCHES, GROUPS)
+    count = 0
+    for number, record in enumerate(read_records(input_file, self.separator), start=1):
+      if literals and regexeze_ast.missing_literal(record, literals):
+        continue
+      if find_all:
+        matched = False
+        for match in regex.finditer(record):
+          matched = True
+          if self.output == MATCHES:
+            self.write(name, number, match=match.group(), start=match.start(), end=match.end())
+          else:
+            self.write(name, number, groups=match.groupdict())
+        count += matched
+        continue
+      if regex.search(record) is None:
+        continue
+      count += 1
+      if self.output == LINES:
+        self.write(name, number, line=record)
+    if self.output == COUNT:
+      self.write(name, None, count=count)
+    self.flush()
+    return count
+
+  def write_matches(self, matches, name):
+    '''
+    Write what is found for each match of a whole input
+    @param matches: the matches
+    @type matches: iterator of ScanMatch
+    @param name: the name of the input, as written in the output
+    @type name: str
+    @return: the number of matches
+    @rtype: int
+    '''
+    count = 0
+    for match in matches:
+      count += 1
+      if self.output == GROUPS:
+        self.write(name, match.start, groups=match.named_groups)
+      elif self.output != COUNT:
+        self.write(name, match.start, match=match.match, start=match.start, end=match.end)
+    if self.output == COUNT:
+      self.write(name, None, count=count)
+    self.flush()
+    return count
+
+  def write(self, name, number, **fields):
+    '''
+    Add a line to the batch, writing the batch if it is full
+    @param name: the name of the input
+    @type name: str
+    @param number: the number of the record (or the offset of the match), or None for a line about the whole input
+    @type number: int
+    @param fields: what was found (one of line, match with start and end, groups, or count)
+    '''
+    if self.format == JSON:
+      if self.show_names:
+        fields['input'] = name
+      if number is not None:
+        fields[self.number_field] = number
+      try:
+        line = json.dumps(fields, sort_keys=True)
+      except UnicodeDecodeError:
+        #input that is not UTF-8 is written byte for byte
+        line = json.dumps(fields, sort_keys=True, encoding='latin-1')
+    else:
+      prefix = []
+      if self.show_names:
+        prefix.append(name)
+      if self.show_numbers and number is not None:
+        prefix.append(str(number))
+      if 'groups' in fields:
+        value = '\t'.join('{0}={1}'.format(group_name, fields['groups'][group_name] or '') for group_name in self.group_names)
+      else:
+        value = str(fields.get('line', fields.get('match', fields.get('count'))))
+      line = ':'.join(prefix + [value])
+    self.batch.append(line)
+    if len(self.batch) >= self.write_size:
+      self.flush()
+
+  def flush(self):
+    '''
+    Write the lines of the batch
+    '''
+    if self.batch:
+      self.output_file.write('\n'.join(self.batch) + '\n')
+      self.batch = []
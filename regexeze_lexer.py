@@ -0,0 +1,170 @@
+import re
+
+class LexerError(ValueError):
+  '''
+  Exception raised by RegexezeLexer for a quote or escape which is not terminated, with the same message as shlex
+  @param message: the message shlex would give
+  @type message: str
+  @param position: the position of the quote or backslash in the input of the lexer
+  @type position: int
+  '''
+  def __init__(self, message, position=None):
+    ValueError.__init__(self, message)
+    self.position = position
+
+class RegexezeLexer(object):
+  '''
+  Single pass lexer for regexeze input, built on one precompiled master regular expression
+  Produces exactly the same tokens (and errors) as shlex.shlex(input, posix=True):
+  - words are runs of word characters, quoted strings and backslash escapes, joined together
+  - every other non-whitespace character (; : [ ] , etc.) is a token of its own
+  - comments run from # to the end of the line
+  @param input: the text to be split into tokens
+  @type input: str
+  '''
+  #the word characters of a posix shlex, including its latin-1 letters
+  WORD_CHARACTERS = ('abcdfeghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_'
+                     '\xdf\xe0\xe1\xe2\xe3\xe4\xe5\xe6\xe7\xe8\xe9\xea\xeb\xec\xed\xee\xef\xf0\xf1\xf2\xf3\xf4\xf5\xf6\xf8\xf9\xfa\xfb\xfc\xfd\xfe\xff'
+                     '\xc0\xc1\xc2\xc3\xc4\xc5\xc6\xc7\xc8\xc9\xca\xcb\xcc\xcd\xce\xcf\xd0\xd1\xd2\xd3\xd4\xd5\xd6\xd8\xd9\xda\xdb\xdc\xdd\xde')
+  WORD_FORMAT = r'''(?:[{0}]+|'[^']*'|"(?:[^"\\]|\\.)*"|\\.)+'''
+  TOKEN_REGEX = re.compile(r'''[ \t\r\n]+|\#[^\n]*\n?|(?P<word>{0})(?P<unterminated>['"\\]?)|(?P<error>['"\\])|(?P<punctuation>.)'''.format(
+                             WORD_FORMAT.format(re.escape(WORD_CHARACTERS))), re.DOTALL)
+  WORD_PIECE_REGEX = re.compile(r'''(?P<single>'[^']*')|(?P<double>"(?:[^"\\]|\\.)*")|\\(?P<escaped>.)|(?P<plain>[^'"\\]+)''', re.DOTALL)
+  DOUBLE_QUOTED_ESCAPE_REGEX = re.compile(r'\\(["\\])')
+  UNCLOSED_DOUBLE_QUOTE_REGEX = re.compile(r'"(?:[^"\\]|\\.)*', re.DOTALL)
+  NO_CLOSING_QUOTATION = 'No closing quotation'
+  NO_ESCAPED_CHARACTER = 'No escaped character'
+
+  def __init__(self, input=""):
+    self.input = input
+
+  def __iter__(self):
+    for word, unterminated, error, punctuation in self.TOKEN_REGEX.findall(self.input):
+      if punctuation:
+        yield punctuation
+      elif unterminated or error:
+        position = self.find_error()
+        raise LexerError(self.describe_error(position), position)
+      elif word:
+        if '"' in word or "'" in word or '\\' in word:
+          word = self.unquote(word)
+        yield word
+
+  def unquote(self, word):
+    '''
+    Strips the quotes and escapes out of a word, as a posix shell would
+    @param word: a word token containing quotes or backslashes
+    @type word: str
+    @return: the value of the word
+    @rtype: str
+    '''
+    pieces = []
+    for piece in self.WORD_PIECE_REGEX.finditer(word):
+      kind = piece.lastgroup
+      if kind == 'single':
+        pieces.append(piece.group()[1:-1])
+      elif kind == 'double':
+        pieces.append(self.DOUBLE_QUOTED_ESCAPE_REGEX.sub(r'\1', piece.group()[1:-1]))
+      else:
+        pieces.append(piece.group(kind))
+    return ''.join(pieces)
+
+  def find_error(self):
+    '''
+    @return: the position of the first quote or escape which is not terminated
+    @rtype: int
+    '''
+    for match in self.TOKEN_REGEX.finditer(self.input):
+      if match.group('unterminated') or match.group('error'):
+        return match.start(match.lastgroup)
+
+  def describe_error(self, position):
+    '''
+    Works out which error shlex would raise for an unterminated quote or escape at position
+    @param position: the position of the quote or backslash that could not be matched
+    @type position: int
+    @rtype: str
+    '''
+    if self.input[position] == '"':
+      end = self.UNCLOSED_DOUBLE_QUOTE_REGEX.match(self.input, position).end()
+      if end < len(self.input):
+        return self.NO_ESCAPED_CHARACTER
+    elif self.input[position] == '\\':
+      return self.NO_ESCAPED_CHARACTER
+    return self.NO_CLOSING_QUOTATION
+
+class RegexezeLineLexer(RegexezeLexer):
+  '''
+  Lexer for many lines of input at once, producing the same tokens (and errors) as lexing each line on its own:
+  quotes and escapes do not carry on past the end of a line
+  @param input: the lines to be split into tokens
+  @type input: str
+  '''
+  #as WORD_FORMAT, but quoted strings stop at line ends, and a backslash escaping a line end also ends the word
+  LINE_WORD_FORMAT = r'''(?:(?:[{0}]+|'[^'\n]*'|"(?:[^"\\\n]|\\[^\n])*"|\\[^\n])+(?:\\\n)?|\\\n)'''
+  TOKEN_REGEX = re.compile(r'''[ \t\r\n]+|\#[^\n]*\n?|(?P<word>{0})(?P<unterminated>(?:(?<!\\\n)['"\\])?)|(?P<error>['"\\])|(?P<punctuation>.)'''.format(
+                             LINE_WORD_FORMAT.format(re.escape(RegexezeLexer.WORD_CHARACTERS))), re.DOTALL)
+
+  def describe_error(self, position):
+    #the error is the one raised by the line on its own
+    start = self.input.rfind('\n', 0, position) + 1
+    end = self.input.find('\n', position) + 1 or len(self.input)
+    return RegexezeLexer(self.input[start:end]).describe_error(position - start)
+
+def ShlexLexer(input=""):
+  '''
+  The original shlex based tokenizer, kept for comparison with RegexezeLexer
+  shlex is only imported when this lexer is asked for, the default lexer does not need it
+  @param input: the text to be split into tokens
+  @type input: str
+  @rtype: shlex.shlex
+  '''
+  import shlex
+  return shlex.shlex(input, posix=True)
+
+class ShlexLineLexer(object):
+  '''
+  Lexer for many lines of input at once with one ShlexLexer per line, for comparison with RegexezeLineLexer
+  @param input: the lines to be split into tokens
+  @type input: str
+  '''
+  LINE_REGEX = re.compile(r'[^\n]*\n|[^\n]+')
+
+  def __init__(self, input=""):
+    self.input = input
+
+  def __iter__(self):
+    for line in self.LINE_REGEX.findall(self.input):
+      for token in ShlexLexer(line):
+        yield token
+
+def token_offset(input, index, lines=False):
+  '''
+  Find where a token is in the input, from the number of tokens before it
+  Every lexer produces the same tokens, so the input is split again by a RegexezeLexer, only as far as the token
+  @param input: the input the token was read from
+  @type input: str
+  @param index: the number of tokens of the input before the token
+  @type index: int
+  @param lines: whether the input was split into tokens line by line
+  @type lines: bool
+  @return: the position of the token, or the length of the input if it has no more tokens than index
+  @rtype: int
+  '''
+  lexer = RegexezeLineLexer if lines else RegexezeLexer
+  #whitespace and comments match without a group
+  for match in lexer.TOKEN_REGEX.finditer(input):
+    if match.lastgroup is not None:
+      if index == 0:
+        return match.start()
+      index -= 1
+  return len(input)
+
+REGEXEZE = 'regexeze'
+SHLEX = 'shlex'
+LEXERS = { REGEXEZE: RegexezeLexer,
+           SHLEX: ShlexLexer }
+#lexers for input read line by line (files and stdin), where tokens do not span lines
+LINE_LEXERS = { REGEXEZE: RegexezeLineLexer,
+                SHLEX: ShlexLineLexer }
+DEFAULT_LEXER = REGEXEZE
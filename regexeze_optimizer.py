@@ -0,0 +1,366 @@
+import re
+import sre_parse
+import sre_constants
+
+#node kinds of the tree the optimizer works on; nodes are tuples, so equal subtrees compare equal
+LITERAL = 'literal'           #(LITERAL, code)
+NOT_LITERAL = 'not_literal'   #(NOT_LITERAL, code)
+ANY = 'any'                   #(ANY,)
+CLASS = 'class'               #(CLASS, negated, items) with items (LITERAL, code), (RANGE, low, high) or (CATEGORY, category)
+RANGE = 'range'
+CATEGORY = 'category'
+AT = 'at'                     #(AT, position)
+REPEAT = 'repeat'             #(REPEAT, min, max, greedy, sequence)
+GROUP = 'group'               #(GROUP, group id or None, sequence)
+BRANCH = 'branch'             #(BRANCH, alternatives) with each alternative a sequence
+GROUP_REF = 'group_ref'       #(GROUP_REF, group id)
+
+#nodes which can be repeated without being wrapped in a group
+ATOMS = frozenset([LITERAL, NOT_LITERAL, ANY, CLASS, GROUP, GROUP_REF])
+
+CATEGORY_SYMBOLS = { sre_constants.CATEGORY_DIGIT: r'\d',
+                     sre_constants.CATEGORY_NOT_DIGIT: r'\D',
+                     sre_constants.CATEGORY_SPACE: r'\s',
+                     sre_constants.CATEGORY_NOT_SPACE: r'\S',
+                     sre_constants.CATEGORY_WORD: r'\w',
+                     sre_constants.CATEGORY_NOT_WORD: r'\W' }
+
+AT_SYMBOLS = { sre_constants.AT_BEGINNING: '^',
+               sre_constants.AT_BEGINNING_STRING: r'\A',
+               sre_constants.AT_END: '$',
+               sre_constants.AT_END_STRING: r'\Z',
+               sre_constants.AT_BOUNDARY: r'\b',
+               sre_constants.AT_NON_BOUNDARY: r'\B' }
+
+FLAG_SYMBOLS = [ (sre_constants.SRE_FLAG_IGNORECASE, 'i'),
+                 (sre_constants.SRE_FLAG_LOCALE, 'L'),
+                 (sre_constants.SRE_FLAG_MULTILINE, 'm'),
+                 (sre_constants.SRE_FLAG_DOTALL, 's'),
+                 (sre_constants.SRE_FLAG_UNICODE, 'u'),
+                 (sre_constants.SRE_FLAG_VERBOSE, 'x') ]
+
+class UnsupportedConstruct(Exception):
+  '''
+  Raised for regex constructs the optimizer does not rewrite (regexeze never produces them)
+  '''
+  pass
+
+def optimize(pattern):
+  '''
+  Rewrite a translated regex into an equivalent, cheaper one:
+  - non-capturing groups are dropped wherever they are not needed, which also merges adjacent literals
+  - alternatives of single characters become character classes
+  - the values and ranges of character classes are deduplicated and merged
+  - prefixes common to all alternatives are factored out
+  Capturing groups are left alone, so group numbers and names do not change
+  Patterns using constructs the optimizer does not know, or nested too deeply for sre_parse, are returned unchanged
+  @param pattern: a regex in standard Python syntax, as produced by the translator
+  @type pattern: str
+  @return: the optimized regex
+  @rtype: str
+  '''
+  try:
+    parsed = sre_parse.parse(pattern)
+    group_names = dict((group_id, name) for name, group_id in parsed.pattern.groupdict.items())
+    sequence = optimize_sequence(convert(parsed))
+    return Emitter(type(pattern), group_names).emit_pattern(sequence, parsed.pattern.flags)
+  except UnsupportedConstruct:
+    return pattern
+  except RuntimeError:
+    #maximum recursion depth exceeded
+    return pattern
+
+def convert(subpattern):
+  '''
+  Convert a pattern parsed by sre_parse into the tree of tuples the optimizer works on
+  @param subpattern: the parsed pattern
+  @type subpattern: sre_parse.SubPattern
+  @return: a sequence of nodes
+  @rtype: tuple
+  '''
+  nodes = []
+  for op, av in subpattern:
+    if op == sre_constants.LITERAL:
+      nodes.append((LITERAL, av))
+    elif op == sre_constants.NOT_LITERAL:
+      nodes.append((NOT_LITERAL, av))
+    elif op == sre_constants.ANY:
+      nodes.append((ANY,))
+    elif op == sre_constants.IN:
+      nodes.append(convert_class(av))
+    elif op == sre_constants.AT:
+      if av not in AT_SYMBOLS:
+        raise UnsupportedConstruct(av)
+      nodes.append((AT, av))
+    elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+      low, high, item = av
+      nodes.append((REPEAT, low, high, op == sre_constants.MAX_REPEAT, convert(item)))
+    elif op == sre_constants.SUBPATTERN:
+      #(group, pattern) up to Python 3.5, (group, add_flags, del_flags, pattern) after
+      if len(av) > 2 and (av[1] or av[2]):
+        raise UnsupportedConstruct(op)
+      nodes.append((GROUP, av[0], convert(av[-1])))
+    elif op == sre_constants.BRANCH:
+      nodes.append((BRANCH, tuple(convert(alternative) for alternative in av[1])))
+    elif op == sre_constants.GROUPREF:
+      nodes.append((GROUP_REF, av))
+    else:
+      raise UnsupportedConstruct(op)
+  return tuple(nodes)
+
+def convert_class(items):
+  negated = False
+  class_items = []
+  for op, av in items:
+    if op == sre_constants.NEGATE:
+      negated = True
+    elif op == sre_constants.LITERAL:
+      class_items.append((LITERAL, av))
+    elif op == sre_constants.RANGE:
+      class_items.append((RANGE, av[0], av[1]))
+    elif op == sre_constants.CATEGORY and av in CATEGORY_SYMBOLS:
+      class_items.append((CATEGORY, av))
+    else:
+      raise UnsupportedConstruct(op)
+  return (CLASS, negated, tuple(class_items))
+
+def optimize_sequence(sequence):
+  '''
+  @param sequence: a sequence of nodes
+  @type sequence: tuple
+  @return: the optimized sequence
+  @rtype: tuple
+  '''
+  nodes = []
+  for node in sequence:
+    kind = node[0]
+    if kind == GROUP:
+      body = optimize_sequence(node[2])
+      if node[1] is None:
+        #the emitter adds back the groups that are needed, around alternatives and repeated sequences
+        nodes.extend(body)
+      else:
+        nodes.append((GROUP, node[1], body))
+    elif kind == REPEAT:
+      nodes.append(node[:4] + (optimize_sequence(node[4]),))
+    elif kind == CLASS:
+      nodes.append(optimize_class(node))
+    elif kind == BRANCH:
+      nodes.extend(optimize_branch(node[1]))
+    else:
+      nodes.append(node)
+  return tuple(nodes)
+
+def optimize_class(node):
+  '''
+  Merge the values and ranges of a class into as few ranges as possible, and drop duplicate categories
+  A class left with a single value becomes a literal
+  '''
+  _, negated, items = node
+  intervals = []
+  categories = []
+  for item in items:
+    if item[0] == LITERAL:
+      intervals.append([item[1], item[1]])
+    elif item[0] == RANGE:
+      intervals.append([item[1], item[2]])
+    elif item not in categories:
+      categories.append(item)
+  intervals.sort()
+  merged = []
+  for interval in intervals:
+    if merged and interval[0] <= merged[-1][1] + 1:
+      merged[-1][1] = max(merged[-1][1], interval[1])
+    else:
+      merged.append(interval)
+  class_items = []
+  for low, high in merged:
+    if low == high:
+      class_items.append((LITERAL, low))
+    elif high == low + 1:
+      class_items.extend([(LITERAL, low), (LITERAL, high)])
+    else:
+      class_items.append((RANGE, low, high))
+  class_items.extend(categories)
+  if len(class_items) == 1 and class_items[0][0] == LITERAL:
+    return (NOT_LITERAL if negated else LITERAL, class_items[0][1])
+  return (CLASS, negated, tuple(class_items))
+
+def is_single_character(sequence):
+  return len(sequence) == 1 and (sequence[0][0] == LITERAL or (sequence[0][0] == CLASS and not sequence[0][1]))
+
+def fixed_width(sequence):
+  '''
+  @param sequence: a sequence of nodes
+  @type sequence: tuple
+  @return: the number of characters every match of the sequence is made of, or None if matches can be of different lengths
+  @rtype: int
+  '''
+  width = 0
+  for node in sequence:
+    kind = node[0]
+    if kind in (LITERAL, NOT_LITERAL, ANY, CLASS):
+      width += 1
+    elif kind == AT:
+      continue
+    elif kind == REPEAT and node[1] == node[2]:
+      body_width = fixed_width(node[4])
+      if body_width is None:
+        return None
+      width += node[1] * body_width
+    elif kind == GROUP:
+      body_width = fixed_width(node[2])
+      if body_width is None:
+        return None
+      width += body_width
+    elif kind == BRANCH:
+      widths = set(fixed_width(alternative) for alternative in node[1])
+      if len(widths) != 1 or None in widths:
+        return None
+      width += widths.pop()
+    else:
+      return None
+  return width
+
+def optimize_branch(alternatives):
+  '''
+  @param alternatives: the alternatives of a branch
+  @type alternatives: tuple of sequences
+  @return: a sequence equivalent to the branch
+  @rtype: tuple
+  '''
+  flattened = []
+  for alternative in alternatives:
+    alternative = optimize_sequence(alternative)
+    #an alternative which is itself only alternatives
+    if len(alternative) == 1 and alternative[0][0] == BRANCH:
+      flattened.extend(alternative[0][1])
+    else:
+      flattened.append(alternative)
+
+  #runs of neighbouring single character alternatives become one class
+  merged = []
+  for alternative in flattened:
+    if merged and is_single_character(alternative) and is_single_character(merged[-1]):
+      previous = merged[-1][0]
+      items = (previous[2] if previous[0] == CLASS else (previous,)) + (alternative[0][2] if alternative[0][0] == CLASS else alternative)
+      merged[-1] = (optimize_class((CLASS, False, items)),)
+    else:
+      merged.append(alternative)
+  if len(merged) == 1:
+    return merged[0]
+
+  #a prefix can only be matched once for several alternatives if it can not match in several ways, giving up characters on backtracking:
+  #it must be of fixed width
+
+  #neighbouring alternatives starting alike are grouped, and what they start with is matched once for all of them
+  runs = []
+  for alternative in merged:
+    if (runs and alternative and runs[-1][-1] and alternative[0] == runs[-1][-1][0] and
+        fixed_width(alternative[:1]) is not None):
+      runs[-1].append(alternative)
+    else:
+      runs.append([alternative])
+  if 1 < len(runs) < len(merged):
+    return ((BRANCH, tuple(run[0] if len(run) == 1 else optimize_branch(tuple(run)) for run in runs)),)
+
+  #a prefix shared by every alternative is matched once, before the alternatives
+  prefix_length = 0
+  shortest = min(len(alternative) for alternative in merged)
+  while (prefix_length < shortest and all(alternative[prefix_length] == merged[0][prefix_length] for alternative in merged) and
+         fixed_width(merged[0][prefix_length:prefix_length + 1]) is not None):
+    prefix_length += 1
+  if prefix_length:
+    return merged[0][:prefix_length] + optimize_branch(tuple(alternative[prefix_length:] for alternative in merged))
+  return ((BRANCH, tuple(merged)),)
+
+class Emitter(object):
+  '''
+  Writes the tree of the optimizer back out as a regex
+  @param string_type: the type of the pattern (str or unicode)
+  @type string_type: type
+  @param group_names: the name of each named group, by group id
+  @type group_names: dict int -> string
+  '''
+  def __init__(self, string_type=str, group_names=None):
+    self.character = unichr if string_type is unicode else chr
+    self.group_names = group_names or {}
+
+  def emit_pattern(self, sequence, flags=0):
+    '''
+    @param sequence: the optimized pattern
+    @type sequence: tuple
+    @param flags: the flags set inside the pattern
+    @type flags: int
+    @rtype: str
+    '''
+    flag_symbols = ''.join(symbol for flag, symbol in FLAG_SYMBOLS if flags & flag)
+    prefix = '(?' + flag_symbols + ')' if flag_symbols else ''
+    return prefix + self.emit_sequence(sequence)
+
+  def emit_sequence(self, sequence, alternatives_allowed=True):
+    '''
+    @param alternatives_allowed: whether a sequence made of a single branch can be written without a group around it
+    @type alternatives_allowed: bool
+    '''
+    if len(sequence) == 1 and sequence[0][0] == BRANCH and alternatives_allowed:
+      return '|'.join(self.emit_sequence(alternative, False) for alternative in sequence[0][1])
+    return ''.join(self.emit_node(node) for node in sequence)
+
+  def emit_atom(self, sequence):
+    if len(sequence) == 1 and sequence[0][0] in ATOMS:
+      return self.emit_node(sequence[0])
+    return '(?:' + self.emit_sequence(sequence) + ')'
+
+  def emit_node(self, node):
+    kind = node[0]
+    if kind == LITERAL:
+      return re.escape(self.character(node[1]))
+    if kind == NOT_LITERAL:
+      return '[^' + re.escape(self.character(node[1])) + ']'
+    if kind == ANY:
+      return '.'
+    if kind == CLASS:
+      return self.emit_class(node)
+    if kind == AT:
+      return AT_SYMBOLS[node[1]]
+    if kind == REPEAT:
+      return self.emit_atom(node[4]) + self.emit_quantifier(node[1], node[2], node[3])
+    if kind == GROUP:
+      if node[1] is None:
+        return '(?:' + self.emit_sequence(node[2]) + ')'
+      if node[1] in self.group_names:
+        return '(?P<' + self.group_names[node[1]] + '>' + self.emit_sequence(node[2]) + ')'
+      return '(' + self.emit_sequence(node[2]) + ')'
+    if kind == GROUP_REF:
+      if node[1] in self.group_names:
+        return '(?P=' + self.group_names[node[1]] + ')'
+      return '(?:\\' + str(node[1]) + ')'
+    #a branch among other nodes
+    return '(?:' + self.emit_sequence((node,)) + ')'
+
+  def emit_class(self, node):
+    _, negated, items = node
+    if len(items) == 1 and items[0][0] == CATEGORY and not negated:
+      return CATEGORY_SYMBOLS[items[0][1]]
+    pieces = ['[^' if negated else '[']
+    for item in items:
+      if item[0] == LITERAL:
+        pieces.append(re.escape(self.character(item[1])))
+      elif item[0] == RANGE:
+        pieces.append(re.escape(self.character(item[1])) + '-' + re.escape(self.character(item[2])))
+      else:
+        pieces.append(CATEGORY_SYMBOLS[item[1]])
+    pieces.append(']')
+    return ''.join(pieces)
+
+  def emit_quantifier(self, low, high, greedy):
+    if high == sre_constants.MAXREPEAT:
+      quantifier = {0: '*', 1: '+'}.get(low, '{{{0},}}'.format(low))
+    elif (low, high) == (0, 1):
+      quantifier = '?'
+    elif low == high:
+      quantifier = '{{{0}}}'.format(low)
+    else:
+      quantifier = '{{{0},{1}}}'.format(low, high)
+    return quantifier if greedy else quantifier + '?'
@@ -0,0 +1,118 @@
+import marshal
+import os
+
+#a pack starts with MAGIC, followed by a single marshalled dict holding the format version, the version of the translator that built it,
+#and one list per column, each holding a value per rule in rule order: loading a pack is one read and one marshal.loads, however many rules it holds
+MAGIC = 'RGXZPACK'
+FORMAT_VERSION = 1
+#the columns of a pack: the id of each rule, its translation, the flags from the re module it is compiled with, the group names it defines
+#(or None), the text every match contains, and the pattern file it was translated from
+COLUMNS = ('ids', 'patterns', 'flags', 'namespaces', 'required_literals', 'sources')
+
+#pattern files looked for in directories, and the suffix of packs
+SOURCE_SUFFIX = '.rgxz'
+PACK_SUFFIX = '.rgxp'
+
+class PackFormatError(ValueError):
+  '''
+  Exception raised when a file is not a pack, or was written in a format this version can not read
+  '''
+
+class DuplicateRuleError(ValueError):
+  '''
+  Exception raised when two pattern files stand for the same rule
+  @param rule: the id of the rule
+  @type rule: str
+  @param source: the second pattern file for the rule
+  @type source: str
+  '''
+  def __init__(self, rule, source):
+    ValueError.__init__(self, 'More than one pattern file for rule {0!r}'.format(rule))
+    self.rule = rule
+    self.source = source
+
+def find_sources(paths):
+  '''
+  List the pattern files making up a pack, with the id of the rule each of them holds
+  A file stands for a rule named after it, without its suffix; a directory for every pattern file under it,
+  named after its path from the directory, with forward slashes
+  @param paths: pattern files and directories
+  @type paths: list of str
+  @return: the id and path of each rule, files of a directory in sorted order
+  @rtype: list of tuple (str, str)
+  @raise DuplicateRuleError: two rules have the same id
+  '''
+  sources = []
+  for path in paths:
+    if not os.path.isdir(path):
+      sources.append((rule_id(os.path.basename(path)), path))
+      continue
+    for directory, directories, filenames in os.walk(path):
+      directories.sort()
+      for filename in sorted(filenames):
+        if filename.endswith(SOURCE_SUFFIX):
+          source = os.path.join(directory, filename)
+          sources.append((rule_id(os.path.relpath(source, path)), source))
+  seen = set()
+  for rule, source in sources:
+    if rule in seen:
+      raise DuplicateRuleError(rule, source)
+    seen.add(rule)
+  return sources
+
+def rule_id(path):
+  '''
+  @return: the id of the rule held by a pattern file, from its relative path
+  @rtype: str
+  '''
+  if path.endswith(SOURCE_SUFFIX):
+    path = path[:-len(SOURCE_SUFFIX)]
+  return path.replace(os.sep, '/')
+
+def dump(columns, path, version):
+  '''
+  Write a pack, to a temporary file which is then renamed into place, so that processes loading it never see a partial pack
+  @param columns: a list of values for each name in COLUMNS, one value per rule
+  @type columns: dict str -> list
+  @param path: the name of the pack
+  @type path: str
+  @param version: the version of the translator that translated the rules
+  @type version: str
+  '''
+  pack = { 'format': FORMAT_VERSION, 'version': version }
+  for column in COLUMNS:
+    pack[column] = list(columns[column])
+  #imported here, only writing needs it
+  import tempfile
+  descriptor, temporary_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+  try:
+    with os.fdopen(descriptor, 'wb') as pack_file:
+      pack_file.write(MAGIC)
+      marshal.dump(pack, pack_file)
+    os.rename(temporary_path, path)
+  except:
+    os.remove(temporary_path)
+    raise
+
+def load(path):
+  '''
+  Read a pack in one go
+  @param path: the name of the pack
+  @type path: str
+  @return: the format version, the version of the translator that built the pack, and the columns
+  @rtype: dict str -> object
+  @raise PackFormatError: the file is not a pack this version can read
+  '''
+  with open(path, 'rb') as pack_file:
+    data = pack_file.read()
+  if not data.startswith(MAGIC):
+    raise PackFormatError('Not a regexeze pack: {0}'.format(path))
+  try:
+    pack = marshal.loads(data[len(MAGIC):])
+  except (EOFError, ValueError, TypeError):
+    raise PackFormatError('Corrupt regexeze pack: {0}'.format(path))
+  if not isinstance(pack, dict) or pack.get('format') != FORMAT_VERSION:
+    raise PackFormatError('Unsupported regexeze pack format: {0}'.format(path))
+  if not all(isinstance(pack.get(column), list) for column in COLUMNS) or len(set(len(pack[column]) for column in COLUMNS)) != 1:
+    raise PackFormatError('Corrupt regexeze pack: {0}'.format(path))
+  return pack
@@ -1,15 +1,25 @@
 import regexeze_errors
-import regexeze
-import re
+import regexeze_ast
 
 class RegexState(object):
   '''
   A state of the RegexezeObject
-  @param auxiliary_character_set: set of special characters that appear in character classes AND plaintext
-  @type auxiliary_character_set: dictionary string -> string
-  @param start_or_end_of_string_character_set: set of characters denoting start and end of string
-  @type start_or_end_of_string_character_set: dictionary string -> string
-  '''
+  A single instance of each state is shared by every parser (see RegexStateFactory.STATE_DICTIONARY), across threads,
+  so states never store data about a parse: anything a state needs to remember is kept on the parser
+  @param transitions: transitions taken on specific tokens (keywords)
+  @type transitions: dictionary string -> string
+  @param class_transitions: transitions taken on any other token, by token class
+  @type class_transitions: dictionary int -> string
+  @param default_transition: transition taken on tokens of a class missing from class_transitions
+  @type default_transition: string
+  @param checks_namespace: whether tokens naming an existing group belong to GROUP_REF_CLASS in this state
+  @type checks_namespace: bool
+  @param state_id: the index of this state in the transition table
+  @type state_id: int
+  '''
+  #every subclass declares __slots__ too, so that no state has a __dict__
+  __slots__ = ('transitions', 'class_transitions', 'default_transition', 'checks_namespace', 'state_id')
+
   END_OF_EXPRESSIONS = 'EndOfExpressions'
   ANY_CHAR = 'AnyChar'
   START_EXPRESSION = 'StartExpression'
@@ -38,11 +48,10 @@ class RegexState(object):
   NEW_NESTED_EXPRESSION = 'NewNestedExpression'
   NAMED_NEW_NESTED_EXPRESSION = 'NamedNewNestedExpression'
   NESTED_EXPRESSION = 'NestedExpression'
-  NESTED_EXPRESSION_DOWN_LEVEL = 'NestedExpressionDownLevel'
-  NESTED_EXPRESSION_UP_LEVEL = 'NestedExpressionUpLevel'
   END_NESTED_EXPRESSION = 'EndNestedExpression'
   NEW_NESTED_EXPRESSION_ERROR_STATE = 'NewNestedExpressionErrorState'
   UNCLOSED_BRACKET_ERROR_STATE = 'UnclosedBracketErrorState'
+  NESTING_DEPTH_ERROR_STATE = 'NestingDepthErrorState'
   OR = 'Or'
   INCOMPLETE_OR_ERROR_STATE = 'IncompleteOrErrorState'
   MULTIPLE_OR_ERROR_STATE = 'MultipleOrErrorState'
@@ -72,20 +81,23 @@ class RegexState(object):
   INVALID_GROUP_NAME_STATE = 'InvalidGroupNameState'
   GROUP_REF_STATE = 'GroupRefState'
 
-  ZERO_OR_MORE_SYMBOL = '*'
-  ZERO_OR_ONE_SYMBOL = '?'
-  NOT_GREEDY_SYMBOL = '?'
-  SET_FLAGS_SYMBOL = '?'
+  #transition resolved at parse time by get_dynamic_transition
+  DYNAMIC = 'Dynamic'
+
+  #token classes, used for transitions on tokens that are not keywords of a state
+  EMPTY_CLASS = 0
+  SINGLE_DIGIT_CLASS = 1
+  DIGITS_CLASS = 2
+  SINGLE_CHARACTER_CLASS = 3
+  AUXILIARY_CHARACTER_CLASS = 4
+  UNMODIFIABLE_AUXILIARY_CHARACTER_CLASS = 5
+  FLAG_CLASS = 6
+  PLAIN_TEXT_CLASS = 7
+  GROUP_REF_CLASS = 8
+  TOKEN_CLASSES = range(9)
+
   ANY_CHAR_SYMBOL = '.'
-  ONE_OR_MORE_SYMBOL = '+'
   END_OF_EXPRESSION_SYMBOL = ';'
-  M_REPETITIONS_FORMAT = '{{{0}}}'
-  GROUP_NAME_FORMAT = '(?P<{0}>'
-  GROUP_REF_FORMAT = '?P={0}'
-  OPEN_CLASS_SYMBOL = '['
-  CLOSE_CLASS_SYMBOL = ']'
-  CLASS_RANGE_SYMBOL = '-'
-  COMPLEMENT_CLASS_SYMBOL = '^'
   START_OF_STRING_SYMBOL = '^'
   END_OF_STRING_SYMBOL = '$'
   NEW_LINE_SYMBOL = '\n'
@@ -149,29 +161,36 @@ class RegexState(object):
   UNICODE_FLAG_TOKEN = 'unicode'
   NAME_TOKEN = 'name'
 
+  #token tables, the same for every state, so they are built once with the class: special characters that appear in character
+  #classes and plaintext, characters denoting the start and end of string, every token that can not be a group name, and flags
+  UNMODIFIABLE_AUXILIARY_CHARACTER_SET = { START_OF_STRING_TOKEN: START_OF_STRING_SYMBOL,
+                                           END_OF_STRING_TOKEN: END_OF_STRING_SYMBOL }
+  AUXILIARY_CHARACTER_SET = { NEW_LINE_TOKEN: NEW_LINE_SYMBOL,
+                              TAB_TOKEN: TAB_SYMBOL,
+                              CARRIAGE_RETURN_TOKEN: CARRIAGE_RETURN_SYMBOL,
+                              PAGE_BREAK_TOKEN: PAGE_BREAK_SYMBOL,
+                              VERTICAL_SPACE_TOKEN: VERTICAL_SPACE_SYMBOL,
+                              DIGIT_TOKEN: DIGIT_SYMBOL,
+                              NON_DIGIT_TOKEN: NON_DIGIT_SYMBOL,
+                              WHITESPACE_TOKEN: WHITESPACE_SYMBOL,
+                              NON_WHITESPACE_TOKEN: NON_WHITESPACE_SYMBOL,
+                              ALPHANUMERIC_TOKEN: ALPHANUMERIC_SYMBOL,
+                              NON_ALPHANUMERIC_TOKEN: NON_ALPHANUMERIC_SYMBOL }
+  FULL_CHAR_SET = dict(UNMODIFIABLE_AUXILIARY_CHARACTER_SET, **AUXILIARY_CHARACTER_SET)
+  FULL_CHAR_SET[ANY_CHAR_TOKEN] = ANY_CHAR_TOKEN
+  FULL_CHAR_SET[NESTED_OPEN_TOKEN] = NESTED_OPEN_TOKEN
+  FLAG_SET = { IGNORE_CASE_FLAG_TOKEN: IGNORE_CASE_FLAG_SYMBOL,
+               LOCALE_DEPENDENT_FLAG_TOKEN: LOCALE_DEPENDENT_FLAG_SYMBOL,
+               MULTILINE_FLAG_TOKEN: MULTILINE_FLAG_SYMBOL,
+               DOT_ALL_FLAG_TOKEN: DOT_ALL_FLAG_SYMBOL,
+               UNICODE_FLAG_TOKEN: UNICODE_FLAG_SYMBOL }
+
   def __init__(self):
     self.transitions = {}
-    self.unmodifiable_auxiliary_character_set = { self.START_OF_STRING_TOKEN: self.START_OF_STRING_SYMBOL,
-                                                  self.END_OF_STRING_TOKEN: self.END_OF_STRING_SYMBOL }
-    self.auxiliary_character_set = { self.NEW_LINE_TOKEN: self.NEW_LINE_SYMBOL,
-                                     self.TAB_TOKEN: self.TAB_SYMBOL,
-                                     self.CARRIAGE_RETURN_TOKEN: self.CARRIAGE_RETURN_SYMBOL,
-                                     self.PAGE_BREAK_TOKEN: self.PAGE_BREAK_SYMBOL,
-                                     self.VERTICAL_SPACE_TOKEN: self.VERTICAL_SPACE_SYMBOL,
-                                     self.DIGIT_TOKEN: self.DIGIT_SYMBOL,
-                                     self.NON_DIGIT_TOKEN: self.NON_DIGIT_SYMBOL,
-                                     self.WHITESPACE_TOKEN: self.WHITESPACE_SYMBOL,
-                                     self.NON_WHITESPACE_TOKEN: self.NON_WHITESPACE_SYMBOL,
-                                     self.ALPHANUMERIC_TOKEN: self.ALPHANUMERIC_SYMBOL,
-                                     self.NON_ALPHANUMERIC_TOKEN: self.NON_ALPHANUMERIC_SYMBOL }
-    self.full_char_set = dict(self.unmodifiable_auxiliary_character_set, **self.auxiliary_character_set)
-    self.full_char_set[self.ANY_CHAR_TOKEN] = self.ANY_CHAR_TOKEN
-    self.full_char_set[self.NESTED_OPEN_TOKEN] = self.NESTED_OPEN_TOKEN
-    self.flag_set = { self.IGNORE_CASE_FLAG_TOKEN: self.IGNORE_CASE_FLAG_SYMBOL,
-                      self.LOCALE_DEPENDENT_FLAG_TOKEN: self.LOCALE_DEPENDENT_FLAG_SYMBOL,
-                      self.MULTILINE_FLAG_TOKEN: self.MULTILINE_FLAG_SYMBOL,
-                      self.DOT_ALL_FLAG_TOKEN: self.DOT_ALL_FLAG_SYMBOL,
-                      self.UNICODE_FLAG_TOKEN: self.UNICODE_FLAG_SYMBOL }
+    self.class_transitions = {}
+    self.default_transition = self.BASE_ERROR_STATE
+    self.checks_namespace = False
+    self.state_id = None
 
   def do_action(self, parser):
     '''
@@ -179,61 +198,63 @@ class RegexState(object):
     '''
     pass
 
-  def get_next(self, token):
+  def get_dynamic_transition(self, token, parser):
     '''
-    Get the next state based on the token
+    For transitions marked DYNAMIC, which depend on what has been parsed so far, go to the proper state
     @param token: the token (taken from the input) to be used for prompting the transition
     @type token: string
-    @return: the next state object
-    @rtype: RegexState
+    @param parser: the parser machine
+    @type parser: regexeze.RegexezeObject
+    @return: a string corresponding to a state
+    @rtype: string
     '''
-    if token in self.transitions:
-      return self.transitions[token]
-    else:
-      return self.get_token_not_found_transition(token)
+    return self.default_transition
 
-  def get_token_not_found_transition(self, token):
+  def get_nested_expression_transition(self, parser):
     '''
-    If a token is not in the list of transitions, go to the proper state
-    @return: a string corresponding to a state
+    @param parser: the parser machine
+    @type parser: regexeze.RegexezeObject
+    @return: the state starting a nested expression, unless expressions are already nested as deep as the parser allows
     @rtype: string
     '''
-    return self.BASE_ERROR_STATE
+    if parser.max_nesting_depth is not None and len(parser.recursive_stack) >= parser.max_nesting_depth:
+      return self.NESTING_DEPTH_ERROR_STATE
+    return self.NESTED_EXPRESSION
 
 class PotentiallyFinalRegexState(RegexState):
   '''
   Generic parent state for any state which could theoretically be followed by a semi-colon (new expression) or end of input
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(PotentiallyFinalRegexState, self).__init__()
     self.transitions[self.END_OF_EXPRESSION_SYMBOL] = self.NEW_EXPRESSION
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_EXPRESSION_ERROR_STATE
+    self.transitions[self.OR_TOKEN] = self.DYNAMIC
+    self.default_transition = self.INVALID_MODIFIER_STATE
 
-  def get_token_not_found_transition(self, token):
-    if token == self.OR_TOKEN and self.n_expressions > 0:
+  def get_dynamic_transition(self, token, parser):
+    if parser.n_expressions > 0:
       return self.MULTIPLE_OR_ERROR_STATE
-    elif token == self.OR_TOKEN:
-      return self.OR
-    return self.INVALID_MODIFIER_STATE
-
-  def do_action(self, parser):
-    self.n_expressions = parser.n_expressions
+    return self.OR
 
 class ModifiablePotentiallyFinalRegexState(PotentiallyFinalRegexState):
   '''
   Generic parent state for potentially final states which can segue into check number of times states
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(ModifiablePotentiallyFinalRegexState, self).__init__()
     self.transitions[self.CHECK_NUMBER_OF_TIMES_TOKEN] = self.CHECK_NUMBER_OF_TIMES
 
-  def do_action(self, parser):
-    super(ModifiablePotentiallyFinalRegexState, self).do_action(parser)
-
 class BaseErrorState(RegexState):
   '''
   State for generic errors (placeholder - ideally, every eventuality will have a specific error)
   '''
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.Error(parser)
 
@@ -242,130 +263,175 @@ class NotGreedyNumberOfRepetitionsState(PotentiallyFinalRegexState):
   State in which a certain number of repetitions have been selected
   (Default not greedy!)
   '''
+  __slots__ = ('low', 'high')
+
   def __init__(self):
     super(NotGreedyNumberOfRepetitionsState, self).__init__()
-    self.symbol = ''
+    self.low = 0
+    self.high = None
     self.transitions[self.GREEDY_TOKEN] = self.SET_GREEDY
     self.transitions[self.NOT_GREEDY_TOKEN] = self.KEEP_NOT_GREEDY
 
   def do_action(self, parser):
     super(NotGreedyNumberOfRepetitionsState, self).do_action(parser)
-    parser.current_modifier = self.symbol + self.NOT_GREEDY_SYMBOL
+    parser.current_repeat = regexeze_ast.Repeat(None, self.low, self.high, greedy=False)
 
 class GreedyNumberOfRepetitionsState(PotentiallyFinalRegexState):
   '''
   State in which a certain number of repetitions have been selected
   (Default greedy!)
   '''
+  __slots__ = ('low', 'high')
+
   def __init__(self):
     super(GreedyNumberOfRepetitionsState, self).__init__()
-    self.symbol = ''
+    self.low = 0
+    self.high = None
     self.transitions[self.NOT_GREEDY_TOKEN] = self.SET_NOT_GREEDY
     self.transitions[self.GREEDY_TOKEN] = self.KEEP_GREEDY
 
   def do_action(self, parser):
     super(GreedyNumberOfRepetitionsState, self).do_action(parser)
-    parser.current_modifier = self.symbol
+    parser.current_repeat = self.new_repeat(parser)
+
+  def new_repeat(self, parser):
+    '''
+    @return: the repetition selected, of an expression yet to be completed
+    @rtype: regexeze_ast.Repeat
+    '''
+    return regexeze_ast.Repeat(None, self.low, self.high)
 
 class EndOfExpressions(RegexState):
-  def __init__(self):
-    pass
+  __slots__ = ()
 
 class NewExpressionErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.NewExpressionError(parser)
 
 class NewNestedExpressionErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.NewNestedExpressionError(parser)
 
 class UnclosedBracketErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.UnclosedBracketError(parser)
 
+class NestingDepthErrorState(RegexState):
+  __slots__ = ()
+
+  def do_action(self, parser):
+    raise regexeze_errors.NestingDepthError(parser)
+
 class IncompleteExpressionErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.IncompleteExpressionError(parser)
 
 class IncompleteClassErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.IncompleteClassError(parser)
 
 class IncompleteClassRangeErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.IncompleteClassRangeError(parser)
 
 class InvalidClassRangeErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.InvalidClassRangeError(parser)
 
 class IncompleteOrErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.IncompleteOrError(parser)
 
 class MultipleOrErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.MultipleOrError(parser)
 
 class ColonErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.ColonError(parser)
 
 class InvalidModifierState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.InvalidModifierError(parser)
 
 class InvalidRepetitionsErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.InvalidRepetitionsError(parser)
 
 class InvalidRepetitionRangeErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.InvalidRepetitionRangeError(parser)
 
 class InvalidFlagState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.InvalidFlagError(parser)
 
 class InvalidGroupNameState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.InvalidGroupNameError(parser)
 
 class FlagsColonErrorState(RegexState):
+  __slots__ = ()
+
   def do_action(self, parser):
     raise regexeze_errors.FlagsColonError(parser)
 
 class StartExpression(RegexState):
+  __slots__ = ()
+
   def __init__(self):
     super(StartExpression, self).__init__()
     self.transitions[self.ANY_CHAR_TOKEN] = self.ANY_CHAR
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_EXPRESSION_ERROR_STATE
     self.transitions[self.NESTED_OPEN_TOKEN] = self.NEW_NESTED_EXPRESSION
-
-  def get_token_not_found_transition(self, token):
-    if token in self.namespace:
-      return self.GROUP_REF_STATE
-    if token in self.unmodifiable_auxiliary_character_set:
-      return self.UNMODIFIABLE_SPECIAL_CHAR_STATE
-    elif token in self.auxiliary_character_set:
-      return self.SPECIAL_CHAR_STATE
-    return self.PLAIN_TEXT
-
-  def do_action(self, parser):
-    parser.child = regexeze.RegexezeObject('')
-    self.namespace = parser.namespace
-    parser.child.namespace.update(parser.namespace)
+    self.class_transitions[self.GROUP_REF_CLASS] = self.GROUP_REF_STATE
+    self.class_transitions[self.UNMODIFIABLE_AUXILIARY_CHARACTER_CLASS] = self.UNMODIFIABLE_SPECIAL_CHAR_STATE
+    self.class_transitions[self.AUXILIARY_CHARACTER_CLASS] = self.SPECIAL_CHAR_STATE
+    self.default_transition = self.PLAIN_TEXT
+    self.checks_namespace = True
 
 class Or(StartExpression):
   '''
   Inserts a pipe between two alternatives
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(Or, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_OR_ERROR_STATE
 
   def do_action(self, parser):
-    parser.add_current_fragment()
+    parser.add_current_expression()
     parser.add_or()
     parser.after_or = True
     super(Or, self).do_action(parser)
@@ -374,17 +440,21 @@ class SetGreedy(PotentiallyFinalRegexState):
   '''
   Tells the number of repetitions to be greedy
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(SetGreedy, self).__init__()
 
   def do_action(self, parser):
     super(SetGreedy, self).do_action(parser)
-    parser.current_modifier = parser.current_modifier[:-1]
+    parser.current_repeat.greedy = True
 
 class KeepGreedy(PotentiallyFinalRegexState):
   '''
   Keeps the number of repetitions greedy when that is the default
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(KeepGreedy, self).__init__()
 
@@ -392,17 +462,21 @@ class SetNotGreedy(PotentiallyFinalRegexState):
   '''
   Tells the number of repetitions not to be greedy
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(SetNotGreedy, self).__init__()
 
   def do_action(self, parser):
     super(SetNotGreedy, self).do_action(parser)
-    parser.current_modifier = parser.current_modifier + self.NOT_GREEDY_SYMBOL
+    parser.current_repeat.greedy = False
 
 class KeepNotGreedy(PotentiallyFinalRegexState):
   '''
   Keeps the number of repetitions not to greedy when that is default
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(KeepNotGreedy, self).__init__()
 
@@ -410,167 +484,168 @@ class ZeroOrMore(GreedyNumberOfRepetitionsState):
   '''
   State in which zero_or_more repetitions have been selected
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(ZeroOrMore, self).__init__()
-    self.symbol = self.ZERO_OR_MORE_SYMBOL
+    self.low = 0
+    self.high = None
 
 class OneOrMore(GreedyNumberOfRepetitionsState):
   '''
   State in which one_or_more repetitions have been selected
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(OneOrMore, self).__init__()
-    self.symbol = self.ONE_OR_MORE_SYMBOL
+    self.low = 1
+    self.high = None
 
 class ZeroOrOne(GreedyNumberOfRepetitionsState):
   '''
   State in which zero_or_one repetitions have been selected
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(ZeroOrOne, self).__init__()
-    self.symbol = self.ZERO_OR_ONE_SYMBOL
+    self.low = 0
+    self.high = 1
 
 class UpTo(RegexState):
   '''
   State triggered by the up_to keyword - in between upper and lower range of {m,n} modifier
-  Strips the {m} modifier of its curly braces for further modification
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(UpTo, self).__init__()
     self.transitions[self.INFINITY_TOKEN] = self.M_UP_TO_INFINITY_REPETITIONS
+    self.class_transitions[self.SINGLE_DIGIT_CLASS] = self.DYNAMIC
+    self.class_transitions[self.DIGITS_CLASS] = self.DYNAMIC
+    self.default_transition = self.INVALID_REPETITION_RANGE_ERROR_STATE
 
-  def get_token_not_found_transition(self, token):
-    if token.isdigit() and self.m_repetitions <= int(token):
+  def get_dynamic_transition(self, token, parser):
+    if parser.m_repetitions <= int(token):
       return self.M_UP_TO_N_REPETITIONS
-    else:
-      return self.INVALID_REPETITION_RANGE_ERROR_STATE
-
-  def do_action(self, parser):
-    self.m_repetitions = parser.m_repetitions
+    return self.INVALID_REPETITION_RANGE_ERROR_STATE
 
 class MUpToNRepetitions(GreedyNumberOfRepetitionsState):
   '''
   State in which between m and n repetitions have been selected
   '''
-  def __init__(self):
-    super(MUpToNRepetitions, self).__init__()
-    self.symbol = self.M_REPETITIONS_FORMAT
+  __slots__ = ()
 
-  def do_action(self, parser):
-    super(MUpToNRepetitions, self).do_action(parser)
-    parser.current_modifier_fragment = parser.current_modifier_fragment + "," + parser.current_token
-    parser.current_modifier = self.symbol.format(parser.current_modifier_fragment)
+  def new_repeat(self, parser):
+    return regexeze_ast.Repeat(None, parser.m_repetitions, int(parser.current_token), form=regexeze_ast.Repeat.RANGE)
 
 class MUpToInfinityRepetitions(GreedyNumberOfRepetitionsState):
   '''
   State in which between m and infinite repetitions have been selected
   '''
-  def __init__(self):
-    super(MUpToInfinityRepetitions, self).__init__()
-    self.symbol = self.M_REPETITIONS_FORMAT
+  __slots__ = ()
 
-  def do_action(self, parser):
-    parser.current_modifier_fragment = parser.current_modifier_fragment + ","
-    parser.current_modifier = self.symbol.format(parser.current_modifier_fragment)
+  def new_repeat(self, parser):
+    return regexeze_ast.Repeat(None, parser.m_repetitions, None, form=regexeze_ast.Repeat.RANGE)
 
 class MRepetitions(GreedyNumberOfRepetitionsState):
   '''
   State in which m repetitions have been selected
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(MRepetitions, self).__init__()
     self.transitions[self.UP_TO_TOKEN] = self.UP_TO
-    self.symbol = self.M_REPETITIONS_FORMAT
 
   def do_action(self, parser):
-    super(MRepetitions, self).do_action(parser)
-    parser.current_modifier_fragment = parser.current_token
-    parser.current_modifier = self.symbol.format(parser.current_modifier_fragment)
     parser.m_repetitions = int(parser.current_token)
+    super(MRepetitions, self).do_action(parser)
+
+  def new_repeat(self, parser):
+    return regexeze_ast.Repeat(None, parser.m_repetitions, parser.m_repetitions, form=regexeze_ast.Repeat.COUNT)
 
 class CheckNumberOfTimes(RegexState):
   '''
   State in which keyword for has been used to indicate number of repetitions
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(CheckNumberOfTimes, self).__init__()
     self.transitions[self.ZERO_OR_MORE_TOKEN] = self.ZERO_OR_MORE
     self.transitions[self.ONE_OR_MORE_TOKEN] = self.ONE_OR_MORE
     self.transitions[self.ZERO_OR_ONE_TOKEN] = self.ZERO_OR_ONE
-
-  def get_token_not_found_transition(self, token):
-    if token.isdigit():
-      return self.M_REPETITIONS
-    return self.INVALID_REPETITIONS_ERROR_STATE
+    self.class_transitions[self.SINGLE_DIGIT_CLASS] = self.M_REPETITIONS
+    self.class_transitions[self.DIGITS_CLASS] = self.M_REPETITIONS
+    self.default_transition = self.INVALID_REPETITIONS_ERROR_STATE
 
 class OrFrom(RegexState):
   '''
   State in which a class has been continued using the keyword or_from, indicating a new range of chars
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(OrFrom, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_ERROR_STATE
-
-  def get_token_not_found_transition(self, token):
-    if len(token) == 1:
-      return self.OPEN_CLASS_RANGE
-    else:
-      return self.INVALID_CLASS_RANGE_ERROR_STATE
-
-  def do_action(self, parser):
-    parser.current_fragment = parser.current_fragment[:-1]
+    self.class_transitions[self.SINGLE_DIGIT_CLASS] = self.OPEN_CLASS_RANGE
+    self.class_transitions[self.SINGLE_CHARACTER_CLASS] = self.OPEN_CLASS_RANGE
+    self.default_transition = self.INVALID_CLASS_RANGE_ERROR_STATE
 
 class OrExcept(RegexState):
   '''
   State in which a complement class has been continued using the keyword or_except
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(OrExcept, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_ERROR_STATE
-
-  def do_action(self, parser):
-    parser.current_fragment = parser.current_fragment[:-1]
-
-  def get_token_not_found_transition(self, token):
-    if token == '':
-      return self.INCOMPLETE_CLASS_ERROR_STATE
-    return self.COMPLEMENT_CLASS_STATE
+    self.class_transitions[self.EMPTY_CLASS] = self.INCOMPLETE_CLASS_ERROR_STATE
+    self.default_transition = self.COMPLEMENT_CLASS_STATE
 
 class OrOf(RegexState):
   '''
   State in which a class has been continued using the keyword or_of
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(OrOf, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_ERROR_STATE
-
-  def do_action(self, parser):
-    parser.current_fragment = parser.current_fragment[:-1]
-
-  def get_token_not_found_transition(self, token):
-    if token == '':
-      return self.INCOMPLETE_CLASS_ERROR_STATE
-    return self.CLASS_STATE
+    self.class_transitions[self.EMPTY_CLASS] = self.INCOMPLETE_CLASS_ERROR_STATE
+    self.default_transition = self.CLASS_STATE
 
 class BaseClassState(ModifiablePotentiallyFinalRegexState):
   '''
   Parent state in which a class or complement class value has been indicated
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(BaseClassState, self).__init__()
 
   def do_action(self, parser):
     super(BaseClassState, self).do_action(parser)
-    if parser.current_token in self.auxiliary_character_set:
-      parser.current_token = self.auxiliary_character_set[parser.current_token]
-    else:  
-      parser.current_token = re.escape(parser.current_token)
-    parser.current_fragment += parser.current_token + parser.CLOSE_CLASS_SYMBOL
+    token = parser.current_token
+    if parser.current_start_range:
+      #the end of a range opened by OpenClassRange
+      item = regexeze_ast.Range(parser.current_start_range, token)
+      parser.current_start_range = ""
+    elif token in self.AUXILIARY_CHARACTER_SET:
+      item = regexeze_ast.Special(self.AUXILIARY_CHARACTER_SET[token])
+    else:
+      item = regexeze_ast.Literal(token)
+    parser.current_class.items.append(item)
 
 class ClassState(BaseClassState):
   '''
   State in which a class value has been indicated (or in which a class range has been ended)
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(ClassState, self).__init__()
     self.transitions[self.OR_OF_TOKEN] = self.OR_OF
@@ -580,6 +655,8 @@ class ComplementClassState(BaseClassState):
   '''
   State in which a complement class value has been indicated
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(ComplementClassState, self).__init__()
     self.transitions[self.OR_EXCEPT_TOKEN] = self.OR_EXCEPT
@@ -588,86 +665,87 @@ class To(RegexState):
   '''
   State in which the keyword "to" has been invoked, indicating the upper limit of a character range in a class
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(To, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_RANGE_ERROR_STATE
+    self.class_transitions[self.SINGLE_DIGIT_CLASS] = self.DYNAMIC
+    self.class_transitions[self.SINGLE_CHARACTER_CLASS] = self.DYNAMIC
+    self.default_transition = self.INVALID_CLASS_RANGE_ERROR_STATE
 
-  def get_token_not_found_transition(self, token):
-    if len(token) == 1 and token >= self.start_range:
+  def get_dynamic_transition(self, token, parser):
+    #the start of the range was stored on the parser by the previous state
+    if token >= parser.current_start_range:
       return self.CLASS_STATE
-    else:
-      return self.INVALID_CLASS_RANGE_ERROR_STATE
-
-  def do_action(self, parser):
-    #Get the start of the range from the current_fragment string
-    self.start_range = parser.current_start_range
+    return self.INVALID_CLASS_RANGE_ERROR_STATE
 
 class OpenClassRange(RegexState):
   '''
   State in which a start of a character range has been indicated
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(OpenClassRange, self).__init__()
     self.transitions[self.TO_TOKEN] = self.TO
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_RANGE_ERROR_STATE
+    self.default_transition = self.INCOMPLETE_CLASS_RANGE_ERROR_STATE
 
   def do_action(self, parser):
     parser.current_start_range = parser.current_token
-    parser.current_fragment += re.escape(parser.current_token) + self.CLASS_RANGE_SYMBOL
-
-  def get_token_not_found_transition(self, token):
-    return self.INCOMPLETE_CLASS_RANGE_ERROR_STATE
 
 class Except(RegexState):
   '''
   State after keyword "except" indicating a complement class
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(Except, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_ERROR_STATE
+    self.class_transitions[self.EMPTY_CLASS] = self.INCOMPLETE_CLASS_ERROR_STATE
+    self.default_transition = self.COMPLEMENT_CLASS_STATE
 
   def do_action(self, parser):
-    parser.current_fragment = parser.OPEN_PARENTHESIS + self.OPEN_CLASS_SYMBOL + self.COMPLEMENT_CLASS_SYMBOL
-
-  def get_token_not_found_transition(self, token):
-    if token == '':
-      return self.INCOMPLETE_CLASS_ERROR_STATE
-    return self.COMPLEMENT_CLASS_STATE
+    parser.current_class = regexeze_ast.CharacterClass(negated=True)
+    parser.set_group(parser.current_class)
 
 class From(RegexState):
   '''
   State after keyword "from" has been invoked indicating a class containing a range between characters
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(From, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_RANGE_ERROR_STATE
-
-  def get_token_not_found_transition(self, token):
-    if len(token) == 1:
-      return self.OPEN_CLASS_RANGE
-    else:
-      return self.INVALID_CLASS_RANGE_ERROR_STATE
+    self.class_transitions[self.SINGLE_DIGIT_CLASS] = self.OPEN_CLASS_RANGE
+    self.class_transitions[self.SINGLE_CHARACTER_CLASS] = self.OPEN_CLASS_RANGE
+    self.default_transition = self.INVALID_CLASS_RANGE_ERROR_STATE
 
   def do_action(self, parser):
-    parser.current_fragment = parser.OPEN_PARENTHESIS + self.OPEN_CLASS_SYMBOL
+    parser.current_class = regexeze_ast.CharacterClass()
+    parser.set_group(parser.current_class)
 
 class OpenClass(RegexState):
   '''
   State after keyword "of" has been invoked to indicate a class
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(OpenClass, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.INCOMPLETE_CLASS_ERROR_STATE
+    self.class_transitions[self.EMPTY_CLASS] = self.INCOMPLETE_CLASS_ERROR_STATE
+    self.default_transition = self.CLASS_STATE
 
   def do_action(self, parser):
-    parser.current_fragment = parser.OPEN_PARENTHESIS + self.OPEN_CLASS_SYMBOL
-
-  def get_token_not_found_transition(self, token):
-    if token == '':
-      return self.INCOMPLETE_CLASS_ERROR_STATE
-    return self.CLASS_STATE
+    parser.current_class = regexeze_ast.CharacterClass()
+    parser.set_group(parser.current_class)
 
 class AnyChar(ModifiablePotentiallyFinalRegexState):
+  __slots__ = ()
 
   def __init__(self):
     super(AnyChar, self).__init__()
@@ -677,53 +755,45 @@ class AnyChar(ModifiablePotentiallyFinalRegexState):
 
   def do_action(self, parser):
     super(AnyChar, self).do_action(parser)
-    parser.current_fragment = parser.OPEN_PARENTHESIS + self.ANY_CHAR_SYMBOL
+    parser.set_group(regexeze_ast.Special(self.ANY_CHAR_SYMBOL))
 
 class GroupRefState(ModifiablePotentiallyFinalRegexState):
   '''
   State in which a reference to an earlier group has been made by name
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(GroupRefState, self).__init__()
 
   def do_action(self, parser):
     super(GroupRefState, self).do_action(parser)
-    parser.current_fragment = parser.OPEN_PARENTHESIS + self.GROUP_REF_FORMAT.format(parser.current_token)
+    parser.current_node = regexeze_ast.BackReference(parser.current_token)
 
 class SpecialCharState(ModifiablePotentiallyFinalRegexState):
   '''
   Parent class for special characters (in place of plaintext, not in character classes)
-  @param symbol: the symbol for the special character
-  @type symbol: str
   '''
-  def __init__(self):
-    super(SpecialCharState, self).__init__()
-    self.symbol = ""
+  __slots__ = ()
 
   def do_action(self, parser):
-    super(SpecialCharState, self).do_action(parser)
-    self.symbol = self.auxiliary_character_set[parser.current_token]
-    parser.current_fragment = parser.OPEN_PARENTHESIS + self.symbol
+    parser.set_group(regexeze_ast.Special(self.AUXILIARY_CHARACTER_SET[parser.current_token]))
 
 class UnmodifiableSpecialCharState(PotentiallyFinalRegexState):
   '''
   State in which the current fragment consists of the a special character that is not modifiable
-  @param symbol: the symbol for the special character
-  @type symbol: str
   '''
-  def __init__(self):
-    super(UnmodifiableSpecialCharState, self).__init__()
-    self.symbol = ""
+  __slots__ = ()
 
   def do_action(self, parser):
-    super(UnmodifiableSpecialCharState, self).do_action(parser)
-    self.symbol = self.unmodifiable_auxiliary_character_set[parser.current_token]
-    parser.current_fragment = parser.OPEN_PARENTHESIS + self.symbol
+    parser.set_group(regexeze_ast.Special(self.UNMODIFIABLE_AUXILIARY_CHARACTER_SET[parser.current_token]))
 
 class PlainText(ModifiablePotentiallyFinalRegexState):
   '''
   State in which the current fragment consists of plain text (no keyword)
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(PlainText, self).__init__()
 
@@ -735,148 +805,144 @@ class EndNestedExpression(ModifiablePotentiallyFinalRegexState):
   '''
   State after a nested expression
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(EndNestedExpression, self).__init__()
 
   def do_action(self, parser):
     super(EndNestedExpression, self).do_action(parser)
-    parser.child.end()
-    parser.current_fragment = parser.OPEN_PARENTHESIS + parser.child.ret_val
-    parser.namespace.update(parser.child.namespace)
+    parser.set_group(parser.nested_tree)
 
 class NestedExpression(RegexState):
   '''
-  State of being in a nested expression (inside square brackets)
-  @param nested_level: the depth of the nesting
-  @type nested_level: int
+  State after the expr keyword of a nested expression (inside square brackets)
+  The expression being parsed is put aside on the stack of the parser (see RegexezeObject.open_nested_expression),
+  and the expressions inside the brackets are parsed as if they were a pattern of their own, starting with the colon of their first expression
+  The closing bracket is found by the parser, which ends the nested expression (see RegexezeObject.close_nested_expression)
   '''
-  def __init__(self, nested_level=0):
+  __slots__ = ()
+
+  def __init__(self):
     super(NestedExpression, self).__init__()
-    self.nested_level = nested_level
+    self.transitions[self.COLON_TOKEN] = self.START_EXPRESSION
+    self.default_transition = self.COLON_ERROR_STATE
 
   def do_action(self, parser):
-    parser.child.process_token(parser.current_token)
-
-  def get_next(self, token):
-    if token == self.END_OF_INPUT_TOKEN:
-      return self.UNCLOSED_BRACKET_ERROR_STATE
-    if token == self.NESTED_CLOSE_TOKEN and self.nested_level == 0:
-      return self.END_NESTED_EXPRESSION
-    elif token == self.NESTED_CLOSE_TOKEN and self.nested_level > 0:
-      return self.NESTED_EXPRESSION_DOWN_LEVEL
-    elif token == self.NESTED_OPEN_TOKEN:
-      return self.NESTED_EXPRESSION_UP_LEVEL
-    return self.NESTED_EXPRESSION
+    parser.open_nested_expression()
 
 class NewNestedExpression(ModifiablePotentiallyFinalRegexState):
   '''
   State of starting an expression nested within current expression (after open square bracket)
   Note that this state can also transition into a typical expression, if the open square bracket is to be treated as regular plain text input (thus, modifiable)
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(NewNestedExpression, self).__init__()
-    self.transitions[self.EXPRESSION_TOKEN] = self.NESTED_EXPRESSION
+    self.transitions[self.EXPRESSION_TOKEN] = self.DYNAMIC
     self.transitions[self.NAME_TOKEN] = self.CHECK_NAME_COLON
     self.transitions[self.NESTED_CLOSE_TOKEN] = self.END_NESTED_EXPRESSION
     self.transitions[self.END_OF_INPUT_TOKEN] = self.UNCLOSED_BRACKET_ERROR_STATE
+    del self.transitions[self.OR_TOKEN]
+    self.default_transition = self.NEW_NESTED_EXPRESSION_ERROR_STATE
 
   def do_action(self, parser):
     super(NewNestedExpression, self).do_action(parser)
     parser.process_current_token_as_plain_text()
-    parser.child.namespace.update(parser.namespace)
+    #until an expression is parsed inside the brackets, the nested expression is empty
+    parser.nested_tree = regexeze_ast.Sequence()
 
-  def get_token_not_found_transition(self, token):
-    return self.NEW_NESTED_EXPRESSION_ERROR_STATE
+  def get_dynamic_transition(self, token, parser):
+    return self.get_nested_expression_transition(parser)
 
 class NamedNewNestedExpression(RegexState):
   '''
   State after which a name has been specified in a nested expression
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(NamedNewNestedExpression, self).__init__()
-    self.transitions[self.EXPRESSION_TOKEN] = self.NESTED_EXPRESSION
+    self.transitions[self.EXPRESSION_TOKEN] = self.DYNAMIC
     self.transitions[self.NESTED_CLOSE_TOKEN] = self.END_NESTED_EXPRESSION
     self.transitions[self.END_OF_INPUT_TOKEN] = self.UNCLOSED_BRACKET_ERROR_STATE
+    self.default_transition = self.NEW_NESTED_EXPRESSION_ERROR_STATE
 
-  def do_action(self, parser):
-    parser.child.namespace.update(parser.namespace)
-
-  def get_token_not_found_transition(self, token):
-    return self.NEW_NESTED_EXPRESSION_ERROR_STATE
+  def get_dynamic_transition(self, token, parser):
+    return self.get_nested_expression_transition(parser)
 
 class CheckColon(RegexState):
+  __slots__ = ()
+
   def __init__(self):
     super(CheckColon, self).__init__()
     self.transitions[self.COLON_TOKEN] = self.START_EXPRESSION
-
-  def get_token_not_found_transition(self, token):
-    return self.COLON_ERROR_STATE
+    self.default_transition = self.COLON_ERROR_STATE
 
 class CheckNameColon(RegexState):
+  __slots__ = ()
+
   def __init__(self):
     super(CheckNameColon, self).__init__()
     self.transitions[self.COLON_TOKEN] = self.CHECK_GROUP_NAME
-
-  def get_token_not_found_transition(self, token):
-    return self.COLON_ERROR_STATE
+    self.default_transition = self.COLON_ERROR_STATE
 
 class GroupNameState(RegexState):
   '''
   State in which a group name has been specified
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(GroupNameState, self).__init__()
     self.transitions[self.END_OF_EXPRESSION_SYMBOL] = self.NAMED_NEW_NESTED_EXPRESSION
-
-  def get_token_not_found_transition(self, token):
-    return self.INCOMPLETE_EXPRESSION_ERROR_STATE
+    self.default_transition = self.INCOMPLETE_EXPRESSION_ERROR_STATE
 
   def do_action(self, parser):
-    parser.OPEN_PARENTHESIS = self.GROUP_NAME_FORMAT.format(parser.current_token)
+    parser.group_name = parser.current_token
     parser.namespace[parser.current_token] = parser.current_token
 
 class CheckGroupName(RegexState):
   '''
   State after name colon, in which parser is checking to see if name specified is valid
-  @param namespace: the namespace of the parser to be checked
-  @type namespace: dict string->string
+  Names already in the namespace of the parser are group references, and so are invalid
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(CheckGroupName, self).__init__()
-
-  def get_token_not_found_transition(self, token):
-    if token in self.namespace or token in self.full_char_set:
-      return self.INVALID_GROUP_NAME_STATE
-    return self.GROUP_NAME_STATE
-
-  def do_action(self, parser):
-    self.namespace = parser.namespace
+    for token in self.FULL_CHAR_SET:
+      self.transitions[token] = self.INVALID_GROUP_NAME_STATE
+    self.class_transitions[self.GROUP_REF_CLASS] = self.INVALID_GROUP_NAME_STATE
+    self.default_transition = self.GROUP_NAME_STATE
+    self.checks_namespace = True
 
 class FlagState(PotentiallyFinalRegexState):
   '''
   State in which a flag is being specified
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(FlagState, self).__init__()
     self.transitions[self.FLAG_CONTINUATION_SYMBOL] = self.SET_FLAGS
-
-  def get_token_not_found_transition(self, token):
-    return self.INVALID_FLAG_STATE
+    del self.transitions[self.OR_TOKEN]
+    self.default_transition = self.INVALID_FLAG_STATE
 
   def do_action(self, parser):
-    parser.current_fragment += self.flag_set[parser.current_token]
+    parser.current_node.flags.append(self.FLAG_SET[parser.current_token])
 
 class SetFlags(RegexState):
   '''
   State in which a flag is being specified
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(SetFlags, self).__init__()
-
-  def get_token_not_found_transition(self, token):
-    if token in self.flag_set:
-      return self.FLAG_STATE
-    return self.INVALID_FLAG_STATE
+    self.class_transitions[self.FLAG_CLASS] = self.FLAG_STATE
+    self.default_transition = self.INVALID_FLAG_STATE
 
 class CheckFlagsColon(RegexState):
   '''
@@ -884,40 +950,39 @@ class CheckFlagsColon(RegexState):
   Set flags expressions don't count as an expression, so undoes the +1 to n_expressions
   Checks for colon
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(CheckFlagsColon, self).__init__()
     self.transitions[self.COLON_TOKEN] = self.SET_FLAGS
-
-  def get_token_not_found_transition(self, token):
-    return self.FLAGS_COLON_ERROR_STATE
+    self.default_transition = self.FLAGS_COLON_ERROR_STATE
 
   def do_action(self, parser):
     parser.n_expressions -= 1
-    parser.current_fragment += parser.OPEN_PARENTHESIS + self.SET_FLAGS_SYMBOL
+    parser.current_node = regexeze_ast.Flags()
 
 class NewExpression(RegexState):
   '''
   State at the very beginning of expression, or after a semi-colon
-  @param after_or: whether this new expression is coming after an or (in which case it should only go to end_of_input)
-  @type after_or: bool
+  An expression can only follow if the parser has not hit an or (see RegexezeObject.after_or)
   '''
+  __slots__ = ()
+
   def __init__(self):
     super(NewExpression, self).__init__()
     self.transitions[self.END_OF_INPUT_TOKEN] = self.END_OF_EXPRESSIONS
     self.transitions[self.SET_FLAGS_TOKEN] = self.CHECK_FLAGS_COLON
-    self.after_or = False
+    self.transitions[self.EXPRESSION_TOKEN] = self.DYNAMIC
+    self.default_transition = self.NEW_EXPRESSION_ERROR_STATE
 
-  def get_token_not_found_transition(self, token):
-    if token == self.EXPRESSION_TOKEN and self.after_or:
+  def get_dynamic_transition(self, token, parser):
+    if parser.after_or:
       return self.MULTIPLE_OR_ERROR_STATE
-    elif token == self.EXPRESSION_TOKEN:
-      return self.CHECK_COLON
-    return self.NEW_EXPRESSION_ERROR_STATE
+    return self.CHECK_COLON
 
   def do_action(self, parser):
     parser.n_expressions += 1
-    parser.add_current_fragment()
-    self.after_or = parser.after_or
+    parser.add_current_expression()
 
 class RegexStateFactory(object):
   '''
@@ -952,6 +1017,8 @@ class RegexStateFactory(object):
                        RegexState.NESTED_EXPRESSION: NestedExpression(),
                        RegexState.NEW_NESTED_EXPRESSION: NewNestedExpression(),
                        RegexState.NEW_NESTED_EXPRESSION_ERROR_STATE: NewNestedExpressionErrorState(),
+                       RegexState.UNCLOSED_BRACKET_ERROR_STATE: UnclosedBracketErrorState(),
+                       RegexState.NESTING_DEPTH_ERROR_STATE: NestingDepthErrorState(),
                        RegexState.OR: Or(),
                        RegexState.INCOMPLETE_OR_ERROR_STATE: IncompleteOrErrorState(),
                        RegexState.MULTIPLE_OR_ERROR_STATE: MultipleOrErrorState(),
@@ -983,41 +1050,112 @@ class RegexStateFactory(object):
                        RegexState.NAMED_NEW_NESTED_EXPRESSION: NamedNewNestedExpression()}
 
   @staticmethod
-  def get_next_state(state, token):
+  def get_next_state(state, token, parser):
      '''
      Hydrates the next state of a regex state
      @param state: the current state
      @type state: RegexState
      @param token: token to use as the key to the next transition
      @type token: string
+     @param parser: the parser machine
+     @type parser: regexeze.RegexezeObject
      @return: the next state
      @rtype: RegexState
      '''
-     if isinstance(state, NestedExpression):
-       return RegexStateFactory.get_next_nested_state(state, token)
-     return RegexStateFactory.STATE_DICTIONARY[state.get_next(token)]
+     return TRANSITION_TABLE.get_next_state(state, token, parser)
+
+class TransitionTable(object):
+  '''
+  The transitions of every state, compiled once into tables indexed by integer state id
+  @param states: the states, indexed by state id
+  @type states: list of RegexState
+  @param state_ids: the id of each state, by name
+  @type state_ids: dict string -> int
+  @param transitions: for each state id, the id of the next state for each keyword token
+  @type transitions: list of dict string -> int
+  @param class_transitions: for each state id, the id of the next state for each token class
+  @type class_transitions: list of list of int
+  @param checks_namespace: for each state id, whether group names form their own token class
+  @type checks_namespace: list of bool
+  @param actions: for each state id, the bound do_action of the state, or None if the state does nothing
+  @type actions: list of callable
+  @param token_classes: the class of each token with a fixed class (special characters and flags)
+  @type token_classes: dict string -> int
+  '''
+  DYNAMIC = -1
+
+  def __init__(self, state_dictionary):
+    self.states = []
+    self.state_ids = {}
+    for name in sorted(state_dictionary):
+      state = state_dictionary[name]
+      state.state_id = len(self.states)
+      self.state_ids[name] = state.state_id
+      self.states.append(state)
+    self.state_ids[RegexState.DYNAMIC] = self.DYNAMIC
+    self.transitions = [self.compile_transitions(state) for state in self.states]
+    self.class_transitions = [self.compile_class_transitions(state) for state in self.states]
+    self.checks_namespace = [state.checks_namespace for state in self.states]
+    #states without an action are not dispatched to at all
+    self.actions = [None if type(state).do_action == RegexState.do_action else state.do_action
+                    for state in self.states]
+
+    self.token_classes = {}
+    for token in RegexState.AUXILIARY_CHARACTER_SET:
+      self.token_classes[token] = RegexState.AUXILIARY_CHARACTER_CLASS
+    for token in RegexState.UNMODIFIABLE_AUXILIARY_CHARACTER_SET:
+      self.token_classes[token] = RegexState.UNMODIFIABLE_AUXILIARY_CHARACTER_CLASS
+    for token in RegexState.FLAG_SET:
+      self.token_classes[token] = RegexState.FLAG_CLASS
+
+  def compile_transitions(self, state):
+    return dict((token, self.state_ids[name]) for token, name in state.transitions.items())
+
+  def compile_class_transitions(self, state):
+    return [self.state_ids[state.class_transitions.get(token_class, state.default_transition)]
+            for token_class in RegexState.TOKEN_CLASSES]
+
+  def classify(self, token):
+    '''
+    @param token: a token which is not a keyword of the current state
+    @type token: string
+    @return: the token class of the token
+    @rtype: int
+    '''
+    token_class = self.token_classes.get(token)
+    if token_class is not None:
+      return token_class
+    if len(token) == 1:
+      if token.isdigit():
+        return RegexState.SINGLE_DIGIT_CLASS
+      return RegexState.SINGLE_CHARACTER_CLASS
+    if not token:
+      return RegexState.EMPTY_CLASS
+    if token.isdigit():
+      return RegexState.DIGITS_CLASS
+    return RegexState.PLAIN_TEXT_CLASS
 
-  @staticmethod
-  def get_next_nested_state(state, token):
-     '''
-     Hydrates the next state for recursive nested expression states
-     @param state: the current state
-     @type state: RegexState
-     @param token: token to use as the key to the next transition
-     @type token: string
-     @return: the next state
-     @rtype: RegexState
-     '''
-     if not isinstance(state, NestedExpression):
-       return BaseErrorState()
-
-     next_key = state.get_next(token)
-     if next_key == RegexState.UNCLOSED_BRACKET_ERROR_STATE:
-       return UnclosedBracketErrorState()
-     if next_key == RegexState.END_NESTED_EXPRESSION:
-       return EndNestedExpression()
-     elif next_key == RegexState.NESTED_EXPRESSION_DOWN_LEVEL:
-       return NestedExpression(state.nested_level-1)
-     elif next_key == RegexState.NESTED_EXPRESSION_UP_LEVEL:
-       return NestedExpression(state.nested_level+1)
-     return NestedExpression(state.nested_level)
+  def get_next_state(self, state, token, parser):
+    '''
+    Look up the next state of the machine
+    @param state: the current state
+    @type state: RegexState
+    @param token: token to use as the key to the next transition
+    @type token: string
+    @param parser: the parser machine
+    @type parser: regexeze.RegexezeObject
+    @return: the next state
+    @rtype: RegexState
+    '''
+    state_id = state.state_id
+    next_id = self.transitions[state_id].get(token)
+    if next_id is None:
+      if self.checks_namespace[state_id] and token in parser.namespace:
+        next_id = self.class_transitions[state_id][RegexState.GROUP_REF_CLASS]
+      else:
+        next_id = self.class_transitions[state_id][self.classify(token)]
+    if next_id == self.DYNAMIC:
+      next_id = self.state_ids[state.get_dynamic_transition(token, parser)]
+    return self.states[next_id]
+
+TRANSITION_TABLE = TransitionTable(RegexStateFactory.STATE_DICTIONARY)
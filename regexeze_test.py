@@ -1,11 +1,26 @@
 import unittest
 import regexeze_errors
 import regexeze_states
+import regexeze_cache
+import regexeze_lexer
+import regexeze_optimizer
+import regexeze_ast
+import regexeze_grep
+import regexeze_pack
 import regexeze
+import regexeze_argparser
 import sys
 import re
 import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import pickle
+import subprocess
 from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
 
 class RegexezeTestCase(unittest.TestCase):
   '''
@@ -42,6 +57,17 @@ class FileInputTestCase(RegexezeTestCase):
     '''
     self.assertRaises(IOError, regexeze.translate, '', 'notarealfile.file')
 
+  def testSmallChunks(self):
+    '''
+    Positive test: files read in many small chunks translate the same, and keep their whole text for error reporting
+    '''
+    regexezeObject = regexeze.RegexezeObject()
+    regexezeObject.CHUNK_SIZE = 8
+    regexezeObject.parse(self.TEST_FILE_NAME)
+    self.assertEquals(regexezeObject.ret_val, self.FILE_TRANSLATION)
+    with open(self.TEST_FILE_NAME) as test_file:
+      self.assertEquals(regexezeObject.arg_string, test_file.read())
+
   def testFileWithErrors(self):
     '''
     Negative test for reading from a file that contains syntax errors
@@ -745,8 +771,8 @@ class test_regex_parser_machine(RegexezeTestCase):
     self.assertTrue(isinstance(self.regexObject.state, regexeze_states.NewExpression))
     self.assertEquals(self.regexObject.arg_string, '', 'arg_string should start empty')
     self.assertEquals(self.regexObject.ret_val, '', 'ret_val should start empty')
-    self.assertEquals(self.regexObject.current_fragment, '', 'current_fragment should start empty')
-    self.assertEquals(self.regexObject.approximate_location, 0, 'approximate location should start at 0')
+    self.assertIsNone(self.regexObject.current_node, 'current_node should start empty')
+    self.assertEquals(self.regexObject.token_index, 0, 'token index should start at 0')
 
   def test_parse(self):
     '''
@@ -797,7 +823,7 @@ class test_regex_parser_machine(RegexezeTestCase):
     #test nested group name that collides with parent
     self.regexObject = regexeze.RegexezeObject('expr: [ name: one; expr: [ name: one; expr: "1"; ];];')
     self.assertRaises(regexeze_errors.InvalidGroupNameError, self.regexObject.parse)
-    self.assertTrue(isinstance(self.regexObject.child.state, regexeze_states.InvalidGroupNameState), 'Namespace should carry from higher nesting level to lower')
+    self.assertTrue(isinstance(self.regexObject.state, regexeze_states.InvalidGroupNameState), 'Namespace should carry from higher nesting level to lower')
 
     #test or with group names
     self.regexObject = regexeze.RegexezeObject("expr: [ name: one; expr: 'a';] or [ name: two;  expr: 'b';];")
@@ -807,7 +833,7 @@ class test_regex_parser_machine(RegexezeTestCase):
     #test invalid group name after or
     self.regexObject = regexeze.RegexezeObject("expr: [ name: one; expr: 'a';] or [ name: two; expr: 'b'; expr: [ name: two; expr: 'b';];];")
     self.assertRaises(regexeze_errors.InvalidGroupNameError, self.regexObject.parse)
-    self.assertTrue(isinstance(self.regexObject.child.state, regexeze_states.InvalidGroupNameState), 'Namespace should carry over after or')
+    self.assertTrue(isinstance(self.regexObject.state, regexeze_states.InvalidGroupNameState), 'Namespace should carry over after or')
 
     self.regexObject = regexeze.RegexezeObject("expr: [ name: one; expr: 'a';] or [ name: one; expr: 'b';];")
     self.assertRaises(regexeze_errors.InvalidGroupNameError, self.regexObject.parse)
@@ -898,7 +924,7 @@ class test_regex_parser_machine(RegexezeTestCase):
     #Or invalid syntax - using expr: after or
     self.regexObject = regexeze.RegexezeObject('''expr: [expr: 'a' for zero_or_one greedy or expr: 'b' for one_or_more;];''')
     self.assertRaises(regexeze_errors.InvalidModifierError, self.regexObject.parse)
-    self.assertTrue(isinstance(self.regexObject.child.state, regexeze_states.InvalidModifierState), 'Using expr after or is treated as an invalid modifier state, because it thinks "expr:" is the input and "b" is the modifier.')
+    self.assertTrue(isinstance(self.regexObject.state, regexeze_states.InvalidModifierState), 'Using expr after or is treated as an invalid modifier state, because it thinks "expr:" is the input and "b" is the modifier.')
 
     #Incomplete or
     self.regexObject = regexeze.RegexezeObject('''expr: 'a' for zero_or_one greedy or''')
@@ -1231,9 +1257,9 @@ class test_regex_parser_machine(RegexezeTestCase):
     '''
     Tests the compile method
     '''
-    #test compiling a simple regexeze object
-    regexezeObject = regexeze.compile("expr: 'a';")
-    self.assertEquals('(a)', regexezeObject.ret_val, "compile should be able to compile a simple regexeze object")
+    #test compiling a simple regexeze pattern
+    regexezePattern = regexeze.compile("expr: 'a';")
+    self.assertEquals('(a)', regexezePattern.pattern, "compile should be able to compile a simple regexeze pattern")
 
   def test_search(self):
     '''
@@ -1255,6 +1281,1208 @@ class test_regex_parser_machine(RegexezeTestCase):
     #test matching with a simple regexeze pattern and string that doesn't match
     self.assertIsNone(regexeze.match("expr: digit for 3;", "12"))
 
+class AstTestCase(RegexezeTestCase):
+  '''
+  Test case for the tree built by the parser machine, and its emission as a regex
+  '''
+  def parse(self, pattern, capture=True):
+    regexezeObject = regexeze.RegexezeObject(pattern, capture=capture)
+    regexezeObject.parse()
+    return regexezeObject.tree
+
+  def testTree(self):
+    '''
+    Positive test: expressions become groups, with their repetitions around them
+    '''
+    tree = self.parse("set_flags: ignore_case; expr: 'a.b' for 2 up_to 5 not_greedy; expr: any_char except digit or_except 'x'; expr: start_of_string;")
+    expected = regexeze_ast.Sequence([ regexeze_ast.Flags(['i']),
+                                       regexeze_ast.Repeat(regexeze_ast.Group(regexeze_ast.Literal('a.b')), 2, 5, False, regexeze_ast.Repeat.RANGE),
+                                       regexeze_ast.Group(regexeze_ast.CharacterClass([regexeze_ast.Special('\\d'), regexeze_ast.Literal('x')], True)),
+                                       regexeze_ast.Group(regexeze_ast.Special('^')) ])
+    self.assertEquals(tree, expected)
+
+  def testNestedTree(self):
+    '''
+    Positive test: nested expressions are groups around the tree of the nested machine, alternatives have a sequence each
+    '''
+    tree = self.parse("expr: [ name: x; expr: any_char from 'a' to 'c' or_of tab; ] for one_or_more; expr: [ expr: x or [ expr: 'b'; expr: 'c'; ]; ];", capture=False)
+    named = regexeze_ast.Group(regexeze_ast.Sequence([regexeze_ast.Group(regexeze_ast.CharacterClass([regexeze_ast.Range('a', 'c'), regexeze_ast.Special('\t')]), capturing=False)]), 'x', False)
+    nested = regexeze_ast.Group(regexeze_ast.Sequence([regexeze_ast.Group(regexeze_ast.Literal('b'), capturing=False),
+                                                       regexeze_ast.Group(regexeze_ast.Literal('c'), capturing=False)]), capturing=False)
+    alternation = regexeze_ast.Alternation([regexeze_ast.Sequence([regexeze_ast.BackReference('x')]), regexeze_ast.Sequence([nested])])
+    expected = regexeze_ast.Sequence([regexeze_ast.Repeat(named, 1, None), regexeze_ast.Group(alternation, capturing=False)])
+    self.assertEquals(tree, expected)
+    self.assertEquals(regexeze_ast.emit(tree), '(?P<x>(?:[a-c\t]))+(?:(?P=x)|(?:(?:b)(?:c)))')
+
+  def testEmit(self):
+    '''
+    Positive test: trees built by hand are emitted like parsed ones, and repetitions keep the form they were given in
+    '''
+    group = regexeze_ast.Group(regexeze_ast.Literal('a+'))
+    self.assertEquals(regexeze_ast.emit(regexeze_ast.Repeat(group, 0, 1)), '(a\\+)?')
+    self.assertEquals(regexeze_ast.emit(regexeze_ast.Repeat(group, 0, 1, form=regexeze_ast.Repeat.RANGE)), '(a\\+){0,1}')
+    self.assertEquals(regexeze_ast.emit(regexeze_ast.Repeat(group, 3, 3, form=regexeze_ast.Repeat.COUNT)), '(a\\+){3}')
+    self.assertEquals(regexeze_ast.emit(regexeze_ast.Repeat(group, 3, None, False, regexeze_ast.Repeat.RANGE)), '(a\\+){3,}?')
+    self.assertEquals(regexeze_ast.emit(regexeze_ast.Sequence()), '')
+
+  def testTreesOfReusedMachine(self):
+    '''
+    Positive test: resetting a machine leaves the tree of its previous input untouched
+    '''
+    regexezeObject = regexeze.RegexezeObject("expr: 'a';")
+    regexezeObject.parse()
+    tree = regexezeObject.tree
+    regexezeObject.reset("expr: 'b';")
+    regexezeObject.parse()
+    self.assertEquals(regexeze_ast.emit(tree), '(a)')
+    self.assertEquals(regexezeObject.ret_val, '(b)')
+
+  def testRequiredLiterals(self):
+    '''
+    Positive test: the text every match contains is found through sequences, groups, repetitions and alternatives
+    '''
+    self.assertEquals(regexeze_ast.required_literals(self.parse("expr: 'GET '; expr: digit; expr: ' HTTP'; expr: '/1.1';")), (' HTTP/1.1', 'GET '))
+    self.assertEquals(regexeze_ast.required_literals(self.parse("expr: 'a' for zero_or_more; expr: 'bb';")), ('bb',))
+    self.assertEquals(regexeze_ast.required_literals(self.parse("expr: [ expr: 'ab' or 'cab'; ] for 2; expr: 'z';")), ('ab', 'z'))
+    self.assertEquals(regexeze_ast.required_literals(self.parse("expr: 'ab' or 'cd';")), ())
+    self.assertEquals(regexeze_ast.required_literals(self.parse("expr: digit for one_or_more;")), ())
+
+  def testNoRequiredLiteralsIgnoringCase(self):
+    '''
+    Negative test: literals ignoring case are not required as they are written
+    '''
+    self.assertEquals(regexeze_ast.required_literals(self.parse("set_flags: ignore_case; expr: 'abc';")), ())
+
+class NonCapturingTestCase(RegexezeTestCase):
+  '''
+  Test case for translating without capturing groups for unnamed expressions
+  '''
+  def testNonCapturing(self):
+    '''
+    Positive test: unnamed expressions become non-capturing groups, in nested expressions too
+    '''
+    self.assertEquals(regexeze.translate("expr: 'a' for 2; expr: any_char of 'bc' or_of 'd'; expr: [ expr: tab; ];", capture=False),
+                      '(?:a){2}(?:[bcd])(?:(?:\t))')
+
+  def testNamedGroupsStillCapture(self):
+    '''
+    Positive test: named expressions still capture, and can be referenced
+    '''
+    translation = regexeze.translate("expr: [ name: x; expr: digit; ]; expr: x for one_or_more;", capture=False)
+    self.assertEquals(translation, '(?P<x>(?:\\d))(?P=x)+')
+    compiled = regexeze.compile("expr: [ name: x; expr: digit; ]; expr: x for one_or_more; expr: [ expr: 'a' or 'b'; ];", capture=False)
+    self.assertEquals(compiled.groups, 1)
+    self.assertEquals(compiled.match('333a').group('x'), '3')
+
+  def testFlagsAndAlternatives(self):
+    '''
+    Positive test: flags and alternatives are unaffected by the mode
+    '''
+    self.assertEquals(regexeze.translate("set_flags: ignore_case; expr: [ expr: 'q' or 'r'; ] for 2 not_greedy;", capture=False),
+                      '(?i)(?:(?:q)|(?:r)){2}?')
+    self.assertEquals(regexeze.translate("expr: 'q' or 'r';"), '(q)|(r)')
+
+  def testCachedSeparately(self):
+    '''
+    Positive test: the same pattern is cached separately with and without capture
+    '''
+    self.assertEquals(regexeze.compile("expr: 'a';").groups, 1)
+    self.assertEquals(regexeze.compile("expr: 'a';", capture=False).groups, 0)
+    self.assertEquals(regexeze.translate_many(["expr: 'a';"], capture=False), ['(?:a)'])
+
+class OptimizerTestCase(RegexezeTestCase):
+  '''
+  Test case for the optimizer of translated patterns
+  '''
+  def testDropsGroupsAndMergesLiterals(self):
+    '''
+    Positive test: non-capturing groups are dropped where they are not needed
+    '''
+    self.assertEquals(regexeze_optimizer.optimize('(?:a){2}(?:bc)(?:\\d)+(?:(?:x)(?:y))*'), 'a{2}bc\\d+(?:xy)*')
+
+  def testAlternatives(self):
+    '''
+    Positive test: single character alternatives become classes, and common prefixes are factored out
+    '''
+    self.assertEquals(regexeze_optimizer.optimize('(?:q)|(?:r)|(?:s)'), '[q-s]')
+    self.assertEquals(regexeze_optimizer.optimize('(?:abc)|(?:abd)'), 'ab[cd]')
+    self.assertEquals(regexeze_optimizer.optimize('x(?:(?:ab)|(?:c)|(?:d))'), 'x(?:ab|[cd])')
+
+  def testNeighbouringAlternatives(self):
+    '''
+    Positive test: neighbouring alternatives starting alike share what they start with, unless it can match in several ways
+    '''
+    self.assertEquals(regexeze_optimizer.optimize('(?:ab)|(?:ac)|(?:d)|(?:ef)|(?:eg)'), 'a[bc]|d|e[fg]')
+    self.assertEquals(regexeze_optimizer.optimize('(?:\\d{3}x1)|(?:\\d{3}x2)|(?:y)'), '\\d{3}x[12]|y')
+    self.assertEquals(regexeze_optimizer.optimize('(?:b*b)|(?:b*\\d)'), 'b*b|b*\\d')
+    for string in ['b1bc1b', 'bbb', 'b1']:
+      self.assertEquals([match.span() for match in re.finditer(regexeze_optimizer.optimize('(?:b*b)|(?:b*\\d(?:a|b))'), string)],
+                        [match.span() for match in re.finditer('(?:b*b)|(?:b*\\d(?:a|b))', string)])
+
+  def testClasses(self):
+    '''
+    Positive test: class values and ranges are deduplicated and merged
+    '''
+    self.assertEquals(regexeze_optimizer.optimize('[abca-z\\d\\d]'), '[a-z\\d]')
+    self.assertEquals(regexeze_optimizer.optimize('[a-cd-fz]'), '[a-fz]')
+    self.assertEquals(regexeze_optimizer.optimize('(?i)[^aa]'), '(?i)[^a]')
+
+  def testCapturingGroupsKept(self):
+    '''
+    Positive test: with capture, group numbers and names are unchanged
+    '''
+    translation = regexeze.translate("expr: 'a' or 'b';")
+    self.assertEquals(regexeze_optimizer.optimize(translation), translation)
+    pattern = "expr: [ name: x; expr: 'abc' or 'abd'; ]; expr: any_char of 'ab' or_of 'a'; expr: x;"
+    original = re.compile(regexeze.translate(pattern))
+    optimized = regexeze.compile(pattern, optimize=True)
+    self.assertEquals((optimized.groups, optimized.groupindex), (original.groups, original.groupindex))
+    self.assertEquals(optimized.pattern, '(?P<x>(abc)|(abd))([ab])(?P=x)')
+
+  def testUnsupportedUnchanged(self):
+    '''
+    Positive test: patterns with constructs the translator never produces are left as they are
+    '''
+    self.assertEquals(regexeze_optimizer.optimize('(?:a)(?=b)'), '(?:a)(?=b)')
+
+  def testSameMatches(self):
+    '''
+    Positive test: optimized patterns match exactly like the original ones
+    '''
+    pattern = "expr: [ expr: 'ab' or 'ac' or 'a'; ] for one_or_more; expr: any_char from 'a' to 'c' or_of 'd' for 2 up_to 3 not_greedy;"
+    original = re.compile(regexeze.translate(pattern, capture=False))
+    optimized = regexeze.compile(pattern, capture=False, optimize=True)
+    self.assertEquals(optimized.pattern, '(?:a(?:[bc]|))+[a-d]{2,3}?')
+    for string in ['abacd', 'aaab', 'acdd', 'ab', 'xabcd']:
+      self.assertEquals([match.span() for match in optimized.finditer(string)], [match.span() for match in original.finditer(string)])
+
+class RuleSetTestCase(RegexezeTestCase):
+  '''
+  Test case for searching for many rules at once
+  '''
+  RULES = [ ('user', "expr: 'user '; expr: alphanumeric for one_or_more;"),
+            ('error', "expr: 'error'; expr: any_char of ':;';"),
+            ('code', "expr: digit for 3; expr: ' code';"),
+            ('status', "expr: [ expr: 'warn' or 'fail'; ]; expr: ' 4';"),
+            ('case', "set_flags: ignore_case; expr: 'Code';"),
+            ('named', "expr: [ name: n; expr: digit; ]; expr: n;") ]
+  STRINGS = ['user bob error: 404 code', 'warn 42', 'fail 4', 'nothing', 'CODE 11', '', 'error;user x']
+
+  def testSearch(self):
+    ruleSet = regexeze.RuleSet(self.RULES)
+    self.assertEquals(len(ruleSet), 6)
+    self.assertEquals(ruleSet.search('user bob error: 404 code 11'), ['user', 'error', 'code', 'case', 'named'])
+    self.assertEquals(ruleSet.search('nothing'), [])
+    for shard_size in [1, 2, regexeze.RuleSet.MAX_SHARD_SIZE]:
+      ruleSet = regexeze.RuleSet(self.RULES, shard_size=shard_size)
+      for string in self.STRINGS:
+        self.assertEquals(ruleSet.search(string), [rule_id for rule_id, pattern in self.RULES if regexeze.search(pattern, string)])
+
+  def testDispatch(self):
+    '''
+    Positive test: rules requiring a long enough literal are looked up by their grams, the others are merged, but for those with flags or groups
+    '''
+    ruleSet = regexeze.RuleSet(self.RULES)
+    self.assertEquals(sorted(index for indices in ruleSet.gram_index.values() for index in indices), [0, 1, 2])
+    self.assertEquals([sorted(shard.indices) for shard in ruleSet.shards], [[3]])
+    self.assertEquals(ruleSet.unmerged, [4, 5])
+    #flags given to the whole set do not keep rules from being merged
+    self.assertEquals([sorted(shard.indices) for shard in regexeze.RuleSet(self.RULES, flags=re.MULTILINE).shards], [[3]])
+
+  def testOverlappingRules(self):
+    '''
+    Positive test: every merged rule that fires is found, those matching where another does or inside its match included,
+    without searching for any rule on its own
+    '''
+    rules = [('ab', "expr: 'ab';"), ('abc', "expr: 'abc';"), ('bcd', "expr: 'bcd';"), ('start', "expr: start_of_string; expr: 'x';"),
+             ('end', "expr: 'd'; expr: end_of_string;"), ('empty', "expr: 'q' for zero_or_one; expr: end_of_string;")]
+    for optimize in [False, True]:
+      ruleSet = regexeze.RuleSet(rules, optimize=optimize)
+      self.assertEquals([sorted(shard.indices) for shard in ruleSet.shards], [range(len(rules))])
+      for string in ['abcd', 'xabcd x', 'bcdab', 'x', '']:
+        self.assertEquals(ruleSet.search(string), [rule_id for rule_id, pattern in rules if regexeze.search(pattern, string)])
+      self.assertEquals([rule.compiled_regex for rule in ruleSet.rules], [None] * len(rules))
+
+  def testOptimize(self):
+    '''
+    Positive test: shards are optimized only if asked
+    '''
+    rules = [('war', "expr: 'war';"), ('wai', "expr: 'wai';")]
+    self.assertEquals(regexeze.RuleSet(rules).shards[0].regex.pattern, '(?:(?:wai))(?P<_rule1>)|(?:(?:war))(?P<_rule0>)')
+    self.assertEquals(regexeze.RuleSet(rules, optimize=True).shards[0].regex.pattern, 'wa(?:i(?P<_rule1>)|r(?P<_rule0>))')
+
+  def testLazyCompilation(self):
+    '''
+    Positive test: rules are compiled on their own only when they are searched for on their own
+    '''
+    ruleSet = regexeze.RuleSet(self.RULES)
+    self.assertEquals([index for index, rule in enumerate(ruleSet.rules) if rule.compiled_regex is not None], [4])
+    ruleSet.search('nothing')
+    self.assertEquals([index for index, rule in enumerate(ruleSet.rules) if rule.compiled_regex is not None], [4, 5])
+
+  def testManyRules(self):
+    '''
+    Positive test: rules are split into shards small enough to compile
+    '''
+    rules = dict((rule_id, "expr: 'r{0}' or 'q{0}';".format(rule_id)) for rule_id in xrange(250))
+    ruleSet = regexeze.RuleSet(rules)
+    self.assertEquals(len(ruleSet.shards), 3)
+    self.assertEquals(ruleSet.search('1r12 2r120'), [1, 12, 120])
+
+  def testInvalidRule(self):
+    '''
+    Negative test: an invalid rule raises its error, with its index
+    '''
+    with self.assertRaises(regexeze_errors.Error) as context:
+      regexeze.RuleSet([('good', "expr: 'a';"), ('bad', "expr: 'a'")])
+    self.assertEquals(context.exception.index, 1)
+
+class TransitionTableTestCase(RegexezeTestCase):
+  '''
+  Test case for the transition table compiled from the states
+  '''
+  def setUp(self):
+    self.table = regexeze_states.TRANSITION_TABLE
+    self.states = regexeze_states.RegexStateFactory.STATE_DICTIONARY
+
+  def testEveryStateCompiled(self):
+    '''
+    Positive test: every state has an id, and its transitions lead to valid ids
+    '''
+    for name, state in self.states.items():
+      self.assertIs(self.table.states[self.table.state_ids[name]], state)
+      for next_id in self.table.transitions[state.state_id].values() + self.table.class_transitions[state.state_id]:
+        self.assertTrue(next_id == self.table.DYNAMIC or 0 <= next_id < len(self.table.states))
+
+  def testClassify(self):
+    '''
+    Positive test: tokens that are not keywords are classified by their content
+    '''
+    self.assertEquals(self.table.classify(''), regexeze_states.RegexState.EMPTY_CLASS)
+    self.assertEquals(self.table.classify('7'), regexeze_states.RegexState.SINGLE_DIGIT_CLASS)
+    self.assertEquals(self.table.classify('42'), regexeze_states.RegexState.DIGITS_CLASS)
+    self.assertEquals(self.table.classify('-'), regexeze_states.RegexState.SINGLE_CHARACTER_CLASS)
+    self.assertEquals(self.table.classify('tab'), regexeze_states.RegexState.AUXILIARY_CHARACTER_CLASS)
+    self.assertEquals(self.table.classify('end_of_string'), regexeze_states.RegexState.UNMODIFIABLE_AUXILIARY_CHARACTER_CLASS)
+    self.assertEquals(self.table.classify('multiline'), regexeze_states.RegexState.FLAG_CLASS)
+    self.assertEquals(self.table.classify('hello'), regexeze_states.RegexState.PLAIN_TEXT_CLASS)
+
+  def testNestedExpressionStack(self):
+    '''
+    Positive test: nested expressions are parsed by the same machine, the expressions containing them being put aside on its stack
+    '''
+    regexezeObject = regexeze.RegexezeObject('expr: [ expr: [ expr: "a";')
+    regexezeObject.process_tokens(regexeze_lexer.RegexezeLexer(regexezeObject.arg_string))
+    self.assertIs(regexezeObject.state, self.states[regexeze_states.RegexState.NEW_EXPRESSION])
+    self.assertEquals(len(regexezeObject.recursive_stack), 2)
+    self.assertRaises(regexeze_errors.UnclosedBracketError, regexezeObject.end)
+
+  def testBracketsInNestedExpression(self):
+    '''
+    Positive test: bracket tokens inside a nested expression, even quoted ones, are counted to find its closing bracket
+    '''
+    regexezeObject = regexeze.RegexezeObject("expr: [ expr: [ expr: 'a'; ] for 2; ]; expr: 'b';")
+    regexezeObject.parse()
+    self.assertEquals(regexezeObject.ret_val, '(((a)){2})(b)')
+    self.assertEquals(regexezeObject.recursive_stack, [])
+    #the quoted bracket closes the nested expression, and errors inside nested expressions point into the whole pattern
+    regexezeObject = regexeze.RegexezeObject("expr: [ expr: ']'; ];")
+    with self.assertRaises(regexeze_errors.IncompleteExpressionError) as context:
+      regexezeObject.parse()
+    self.assertTrue(str(context.exception).endswith("expr: [ expr: ']'; ];\n              ^"))
+    self.assertEquals(context.exception.offset, 14)
+
+class NestingDepthTestCase(RegexezeTestCase):
+  '''
+  Test case for deeply nested expressions, and the limit on their depth
+  '''
+  def setUp(self):
+    self.max_nesting_depth = regexeze.RegexezeObject.max_nesting_depth
+
+  def tearDown(self):
+    regexeze.set_max_nesting_depth(self.max_nesting_depth)
+    regexeze.purge()
+
+  def nestedPattern(self, depth):
+    return "expr: [ " * depth + "expr: 'a';" + " ];" * depth
+
+  def testDeepNesting(self):
+    '''
+    Positive test: nesting is neither parsed nor emitted with recursion, so depth is not limited by the Python stack
+    '''
+    regexeze.set_max_nesting_depth(None)
+    depth = sys.getrecursionlimit() * 5
+    self.assertTrue(regexeze.translate(self.nestedPattern(depth)) == '(' * (depth + 1) + 'a' + ')' * (depth + 1))
+    #too deep for sre_parse, so the optimizer leaves the pattern as it is
+    translation = regexeze.translate(self.nestedPattern(depth), capture=False)
+    self.assertTrue(regexeze.translate(self.nestedPattern(depth), capture=False, optimize=True) == translation)
+
+  def testNestingDepthLimit(self):
+    '''
+    Negative test: expressions nested deeper than the limit raise an error, named nested expressions too
+    '''
+    regexeze.set_max_nesting_depth(3)
+    self.assertEquals(regexeze.translate(self.nestedPattern(3)), '((((a))))')
+    self.assertRaises(regexeze_errors.NestingDepthError, regexeze.translate, self.nestedPattern(4))
+    self.assertRaises(regexeze_errors.NestingDepthError, regexeze.translate, "expr: [ expr: [ expr: [ expr: [ name: x; expr: 'a'; ]; ]; ]; ];")
+    #the limit is on depth, not on the number of nested expressions
+    self.assertEquals(regexeze.translate(' '.join([self.nestedPattern(3)] * 5)), '((((a))))' * 5)
+
+  def testNestingDepthLimitInBatch(self):
+    '''
+    Negative test: in a batch, the error takes the place of the pattern that is nested too deeply
+    '''
+    regexezeObject = regexeze.RegexezeObject(self.nestedPattern(3))
+    regexezeObject.max_nesting_depth = 2
+    self.assertRaises(regexeze_errors.NestingDepthError, regexezeObject.parse)
+    regexeze.set_max_nesting_depth(2)
+    results = regexeze.translate_many([self.nestedPattern(2), self.nestedPattern(3)])
+    self.assertEquals(results[0], '(((a)))')
+    self.assertIsInstance(results[1], regexeze_errors.NestingDepthError)
+    self.assertEquals(results[1].index, 1)
+
+class ThreadSafetyTestCase(RegexezeTestCase):
+  '''
+  Stress test for translating patterns from many threads at once, which share the same state objects
+  '''
+  N_PATTERNS = 2000
+  N_THREADS = 8
+
+  @staticmethod
+  def build_pattern(i):
+    '''
+    Builds the i-th of a family of distinct patterns, exercising the states that depend on earlier tokens
+    (or, ranges, repetition intervals, group names); every seventh pattern is invalid
+    '''
+    low, high = chr(ord('a') + i % 13), chr(ord('n') + i % 13)
+    if i % 7 == 0:
+      low, high = high, low
+    return ("expr: 'w{0}' for {1} up_to {2}; expr: any_char from '{3}' to '{4}' or_of 'xyz';"
+            "expr: [ name: g{0}; expr: digit; ]; expr: g{0} for one_or_more; expr: 'x' or 'y{0}';").format(i, i % 5, i % 5 + i % 3, low, high)
+
+  @staticmethod
+  def translate(pattern):
+    #bypasses the cache, so that every call runs the state machine
+    regexezeObject = regexeze.RegexezeObject(pattern)
+    try:
+      regexezeObject.parse()
+    except regexeze_errors.Error as error:
+      return type(error)
+    return regexezeObject.ret_val
+
+  def testConcurrentTranslation(self):
+    '''
+    Positive test: translations run from a thread pool give the same results as serial ones
+    '''
+    patterns = [self.build_pattern(i) for i in xrange(self.N_PATTERNS)]
+    expected = [self.translate(pattern) for pattern in patterns]
+    check_interval = sys.getcheckinterval()
+    #switch threads as often as possible, to interleave the parses
+    sys.setcheckinterval(1)
+    pool = ThreadPool(self.N_THREADS)
+    try:
+      results = pool.map(self.translate, patterns, chunksize=1)
+    finally:
+      pool.close()
+      pool.join()
+      sys.setcheckinterval(check_interval)
+    self.assertEquals(results, expected)
+    self.assertIn(regexeze_errors.InvalidClassRangeError, expected)
+
+class PatternCacheTestCase(RegexezeTestCase):
+  '''
+  Test case for the LRU pattern cache
+  '''
+  def setUp(self):
+    self.cache = regexeze_cache.PatternCache(maxsize=2)
+
+  def testHitsAndMisses(self):
+    '''
+    Positive test: lookups are counted as hits or misses
+    '''
+    self.assertIsNone(self.cache.get('a'))
+    self.cache.put('a', 1)
+    self.assertEquals(self.cache.get('a'), 1)
+    self.assertEquals(self.cache.info(), regexeze_cache.CacheInfo(1, 1, 0, 2, 1))
+
+  def testEvictsLeastRecentlyUsed(self):
+    '''
+    Positive test: the least recently used entry is evicted when the cache is full
+    '''
+    self.cache.put('a', 1)
+    self.cache.put('b', 2)
+    self.cache.get('a')
+    self.cache.put('c', 3)
+    self.assertIsNone(self.cache.get('b'), 'b was least recently used and should have been evicted')
+    self.assertEquals(self.cache.get('a'), 1)
+    self.assertEquals(self.cache.info().evictions, 1)
+
+  def testResize(self):
+    '''
+    Positive test: shrinking the cache evicts entries, and size 0 disables caching
+    '''
+    self.cache.put('a', 1)
+    self.cache.put('b', 2)
+    self.cache.resize(0)
+    self.cache.put('c', 3)
+    self.assertEquals(self.cache.info().currsize, 0)
+
+class RegexezeCacheTestCase(RegexezeTestCase):
+  '''
+  Test case for the caching done by the regexeze wrapper methods
+  '''
+  def setUp(self):
+    regexeze.purge()
+
+  def tearDown(self):
+    regexeze.set_cache_size(regexeze_cache.PatternCache.DEFAULT_MAXSIZE)
+    regexeze.purge()
+
+  def testRepeatedSearchHitsCache(self):
+    '''
+    Positive test: searching with the same pattern twice only translates it once
+    '''
+    regexeze.search("expr: 'd';", "dog")
+    misses = regexeze.cache_info().misses
+    self.assertIsNotNone(regexeze.search("expr: 'd';", "dog"))
+    self.assertEquals(regexeze.cache_info().misses, misses, 'Second search should be served from the cache')
+
+  def testFlagsAreCachedSeparately(self):
+    '''
+    Positive test: the same pattern compiled with different flags results in different regular expressions
+    '''
+    self.assertIsNone(regexeze.match("expr: 'a';", "A"))
+    self.assertIsNotNone(regexeze.match("expr: 'a';", "A", flags=re.IGNORECASE))
+
+  def testPurge(self):
+    '''
+    Positive test: purge empties the cache
+    '''
+    regexeze.translate("expr: 'a';")
+    regexeze.purge()
+    self.assertEquals(regexeze.cache_info().currsize, 0)
+
+  def testFileSourceNotCached(self):
+    '''
+    Positive test: patterns read from files are not cached, since the file may change
+    '''
+    self.assertEquals(regexeze.translate(source=self.TEST_FILE_NAME), self.FILE_TRANSLATION)
+    self.assertEquals(regexeze.cache_info().currsize, 0)
+
+class BatchTestCase(RegexezeTestCase):
+  '''
+  Test case for translating and compiling many patterns in one call
+  '''
+  PATTERNS = ["expr: 'a' for one_or_more;",
+              "expr: [ name: g; expr: 'b'; ]; expr: [ name: h; expr: 'c'; ];",
+              "expr: 'a' from 1;",
+              "expr: [ name: g; expr: 'd';",
+              "expr: any_char from 'a' to 'z';",
+              "expr: [ name: h; expr: 'e'; ]; expr: h;"]
+
+  def testTranslateMany(self):
+    '''
+    Positive test: the batch gives the same translations as translating one by one, in order
+    '''
+    results = regexeze.translate_many(self.PATTERNS)
+    self.assertEquals(len(results), len(self.PATTERNS))
+    for pattern, result in zip(self.PATTERNS, results):
+      if isinstance(result, regexeze_errors.Error):
+        self.assertRaises(type(result), regexeze.translate, pattern)
+      else:
+        self.assertEquals(result, regexeze.translate(pattern))
+
+  def testErrorsAreCollected(self):
+    '''
+    Negative test: invalid patterns do not stop the batch, and do not affect the next patterns
+    '''
+    results = regexeze.translate_many(self.PATTERNS)
+    self.assertIsInstance(results[2], regexeze_errors.InvalidModifierError)
+    self.assertIsInstance(results[3], regexeze_errors.UnclosedBracketError)
+    self.assertEquals(results[4], '([a-z])')
+    self.assertEquals(results[5], '(?P<h>(e))(?P=h)')
+
+  def testCompileMany(self):
+    '''
+    Positive test: compiled patterns keep their group names, and errors are collected
+    '''
+    results = regexeze.compile_many(self.PATTERNS, flags=re.IGNORECASE)
+    self.assertEquals(results[1].search('xBC').group('h'), 'C')
+    self.assertEquals(results[1].namespace, {'g': 'g', 'h': 'h'})
+    self.assertEquals(results[5].namespace, {'h': 'h'})
+    self.assertIsInstance(results[2], regexeze_errors.Error)
+
+  def testErrorIndex(self):
+    '''
+    Negative test: collected errors know the index of the pattern that raised them
+    '''
+    results = regexeze.translate_many(iter(self.PATTERNS))
+    self.assertEquals([result.index for result in results if isinstance(result, regexeze_errors.Error)], [2, 3])
+
+  def testUnterminatedQuote(self):
+    '''
+    Negative test: a quote left open is collected as the error of its pattern, with where it is, and does not stop the batch
+    '''
+    patterns = ["expr: 'a';", "expr: 'b", "expr: 'c';"]
+    results = regexeze.translate_many(patterns)
+    self.assertEquals((results[0], results[2]), ('(a)', '(c)'))
+    self.assertIsInstance(results[1], regexeze_errors.QuotationError)
+    self.assertEquals((results[1].code, results[1].index, results[1].offset), ('unterminated_quote', 1, 6))
+    self.assertEquals(results[1].describe(), 'No closing quotation')
+    self.assertIsInstance(regexeze.compile_many(patterns)[1], regexeze_errors.QuotationError)
+    self.assertRaises(regexeze_errors.QuotationError, regexeze.RuleSet, enumerate(patterns))
+
+  def testWorkers(self):
+    '''
+    Positive test: translating across worker processes gives the same results, in the same order, as translating in this process
+    '''
+    patterns = self.PATTERNS * 5
+    expected = regexeze.translate_many(patterns)
+    results = regexeze.translate_many(patterns, workers=2, chunksize=4)
+    self.assertEquals(len(results), len(expected))
+    for result, expected_result in zip(results, expected):
+      if isinstance(expected_result, regexeze_errors.Error):
+        self.assertIs(type(result), type(expected_result))
+        self.assertEquals((result.index, str(result)), (expected_result.index, str(expected_result)))
+      else:
+        self.assertEquals(result, expected_result)
+    compiled = regexeze.compile_many(patterns, workers=2)
+    self.assertEquals(compiled[7].search('bc').group('h'), 'c')
+    self.assertEquals(compiled[8].index, 8)
+
+  def testWorkersUnterminatedQuote(self):
+    '''
+    Negative test: a quote left open in a worker process is sent back as the error of its pattern, with its index
+    '''
+    patterns = ["expr: 'a';", "expr: 'b", "expr: 'c';"] * 3
+    results = regexeze.translate_many(patterns, workers=2, chunksize=2)
+    self.assertEquals(results[::3], ['(a)'] * 3)
+    self.assertEquals(results[2::3], ['(c)'] * 3)
+    for index in (1, 4, 7):
+      self.assertIsInstance(results[index], regexeze_errors.QuotationError)
+      self.assertEquals((results[index].index, results[index].offset, str(results[index])),
+                        (index, 6, "No closing quotation\nexpr: 'b\n      ^"))
+
+class DiskCacheTestCase(RegexezeTestCase):
+  '''
+  Test case for the persistent cache of pattern file translations
+  '''
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cache_path = os.path.join(self.directory, 'cache')
+    self.pattern_file_name = os.path.join(self.directory, 'pattern.rgxz')
+    shutil.copy(self.TEST_FILE_NAME, self.pattern_file_name)
+    regexeze.set_disk_cache(self.cache_path)
+
+  def tearDown(self):
+    regexeze.set_disk_cache(None)
+    shutil.rmtree(self.directory)
+
+  def testFileTranslationIsStored(self):
+    '''
+    Positive test: a translated file is stored under the hash of its content, and read back from there
+    '''
+    self.assertEquals(regexeze.translate(source=self.pattern_file_name), self.FILE_TRANSLATION)
+    cache = regexeze_cache.DiskCache(self.cache_path, regexeze.__version__)
+    with open(self.pattern_file_name) as pattern_file:
+      key = cache.key(pattern_file.read(), True, False)
+    self.assertEquals(cache.get(key), (self.FILE_TRANSLATION, {}, ('hello' * 10 + 'how are you',)))
+    cache.put(key, ('(cached)', {}, ()))
+    self.assertEquals(regexeze.translate(source=self.pattern_file_name), '(cached)')
+    self.assertEquals(regexeze.compile(source=self.pattern_file_name).pattern, '(cached)')
+
+  def testChangedFileMissesCache(self):
+    '''
+    Positive test: editing a file, or changing the version of the translator, changes its key
+    '''
+    regexeze.translate(source=self.pattern_file_name)
+    with open(self.pattern_file_name, 'a') as pattern_file:
+      pattern_file.write("expr: 'more';\n")
+    self.assertEquals(regexeze.translate(source=self.pattern_file_name), self.FILE_TRANSLATION + '(more)')
+    cache = regexeze_cache.DiskCache(self.cache_path, regexeze.__version__)
+    self.assertEquals(len(cache.entries()), 2)
+    self.assertNotEquals(cache.key('expr: a;'), regexeze_cache.DiskCache(self.cache_path, 'other').key('expr: a;'))
+
+  def testErrorsNotStored(self):
+    '''
+    Negative test: files with syntax errors raise every time, and are not stored
+    '''
+    for _ in xrange(2):
+      self.assertRaises(regexeze_errors.IncompleteExpressionError, regexeze.translate, '', self.TEST_ERROR_FILE_NAME)
+    self.assertEquals(regexeze_cache.DiskCache(self.cache_path, regexeze.__version__).entries(), [])
+
+  def testPrune(self):
+    '''
+    Positive test: pruning drops stale entries, then the least recently used ones beyond the maximum size
+    '''
+    cache = regexeze_cache.DiskCache(self.cache_path, regexeze.__version__, maxsize=2, max_age=3600)
+    now = time.time()
+    for n, age in enumerate([7200, 30, 20, 10]):
+      key = cache.key(str(n))
+      cache.put(key, str(n))
+      os.utime(cache.entry_path(key), (now - age, now - age))
+    cache.prune()
+    self.assertEquals([cache.get(cache.key(str(n))) for n in xrange(4)], [None, None, '2', '3'])
+
+  def testFailedPutLeavesNoTemporaryFile(self):
+    '''
+    Negative test: a value that can not be stored raises, and leaves no temporary file behind
+    '''
+    cache = regexeze_cache.DiskCache(self.cache_path, regexeze.__version__)
+    self.assertRaises(ValueError, cache.put, cache.key('a'), object())
+    self.assertEquals(os.listdir(self.cache_path), [])
+
+  def testPruneRemovesStaleTemporaryFiles(self):
+    '''
+    Positive test: pruning removes the temporary files left over by dead writers, but not those still being written
+    '''
+    cache = regexeze_cache.DiskCache(self.cache_path, regexeze.__version__)
+    stale_path = os.path.join(self.cache_path, 'stale' + cache.TEMPORARY_SUFFIX)
+    fresh_path = os.path.join(self.cache_path, 'fresh' + cache.TEMPORARY_SUFFIX)
+    for temporary_path in (stale_path, fresh_path):
+      open(temporary_path, 'wb').close()
+    age = time.time() - cache.TEMPORARY_MAX_AGE - 60
+    os.utime(stale_path, (age, age))
+    cache.prune()
+    self.assertEquals(os.listdir(self.cache_path), ['fresh' + cache.TEMPORARY_SUFFIX])
+
+class RegexezePatternTestCase(RegexezeTestCase):
+  '''
+  Test case for the compiled pattern objects returned by regexeze.compile
+  '''
+  def setUp(self):
+    self.compiled = regexeze.compile("expr: [ name: word; expr: alphanumeric for one_or_more; ];")
+
+  def testMatchAndSearch(self):
+    '''
+    Positive test: match and search behave like their re counterparts
+    '''
+    self.assertEquals(self.compiled.match('abc def').group('word'), 'abc')
+    self.assertIsNone(self.compiled.match(' abc'))
+    self.assertEquals(self.compiled.search(' abc').group(0), 'abc')
+
+  def testFullmatch(self):
+    '''
+    Positive and negative test: fullmatch only matches the whole string
+    '''
+    self.assertIsNotNone(self.compiled.fullmatch('abc'))
+    self.assertIsNone(self.compiled.fullmatch('abc def'))
+
+  def testIterationHelpers(self):
+    '''
+    Positive test: finditer, findall, sub and split
+    '''
+    self.assertEquals([m.group(0) for m in self.compiled.finditer('ab cd')], ['ab', 'cd'])
+    self.assertEquals(self.compiled.findall('ab cd'), [('ab', 'b'), ('cd', 'd')])
+    self.assertEquals(self.compiled.sub('x', 'ab cd'), 'x x')
+    self.assertEquals(self.compiled.split('ab,cd'), ['', 'ab', 'b', ',', 'cd', 'd', ''])
+
+  def testNamespaceAndFlags(self):
+    '''
+    Positive test: the pattern records its group names and flags
+    '''
+    self.assertEquals(self.compiled.namespace, {'word': 'word'})
+    self.assertEquals(self.compiled.groupindex, {'word': 1})
+    self.assertEquals(regexeze.compile("expr: 'a';", flags=re.IGNORECASE).flags, re.IGNORECASE)
+
+  def testParserStateDropped(self):
+    '''
+    Positive test: the compiled pattern does not keep the parser alive
+    '''
+    self.assertFalse(hasattr(self.compiled, 'child'))
+    self.assertFalse(hasattr(self.compiled, 'tokenizer'))
+    self.assertFalse(hasattr(self.compiled, '__dict__'))
+
+  def testLazyCompilation(self):
+    '''
+    Positive test: the regex is compiled when the pattern is first used, once for all patterns with the same translation and flags
+    '''
+    first, second = regexeze.compile_many(["expr: 'lazy';", "expr: 'lazy';"])
+    self.assertIsNone(first.compiled_regex)
+    self.assertIsNotNone(first.search('so lazy'))
+    self.assertIs(first.compiled_regex, first.regex)
+    self.assertIsNone(second.compiled_regex)
+    self.assertIs(second.regex, first.regex)
+
+  def testPatternInfo(self):
+    '''
+    Positive test: patterns never used are counted
+    '''
+    before = regexeze.pattern_info()
+    patterns = regexeze.compile_many(["expr: 'a{0}';".format(n) for n in xrange(3)])
+    patterns[0].match('a0')
+    after = regexeze.pattern_info()
+    self.assertEquals((after.created - before.created, after.compiled - before.compiled, after.unused - before.unused), (3, 1, 2))
+
+  def testRequiredLiterals(self):
+    '''
+    Positive and negative test: strings lacking a required literal are rejected without changing what is found
+    '''
+    compiled = regexeze.compile("expr: 'id='; expr: digit for one_or_more;")
+    self.assertEquals(compiled.required_literals, ('id=',))
+    self.assertTrue(compiled.rejects('no ids here'))
+    self.assertTrue(compiled.rejects('id=1', 1))
+    self.assertFalse(compiled.rejects('x id=1', -5, 10))
+    self.assertIsNone(compiled.search('id: 12'))
+    self.assertIsNone(compiled.match('id=12', 1))
+    self.assertEquals(compiled.search('x id=12').group(), 'id=12')
+    self.assertEquals(compiled.findall('id=1 id=2'), [('id=', '1'), ('id=', '2')])
+    self.assertEquals(compiled.findall('id=1', 0, 3), [])
+    self.assertEquals(compiled.split('a,b'), ['a,b'])
+    self.assertEquals(compiled.search(u'\xe9 id=3').group(), u'id=3')
+    self.assertEquals(regexeze.compile("expr: 'id=';", flags=re.IGNORECASE).required_literals, ())
+    self.assertIsNotNone(regexeze.compile("expr: '\xe9';").search(u'\xe9'))
+
+class LexerTestCase(RegexezeTestCase):
+  '''
+  Test case for the regexeze lexer, which must split input exactly like shlex in posix mode
+  '''
+  CORPUS_FILE_NAMES = [__file__.replace('.pyc', '.py'), 'README.md',
+                       RegexezeTestCase.TEST_FILE_NAME, RegexezeTestCase.TEST_ERROR_FILE_NAME]
+
+  def lex(self, lexer, text):
+    '''
+    Helper method for splitting text into tokens, recording a lexing error as the final token
+    @param lexer: the lexer class to use
+    @type lexer: class
+    @param text: the text to split
+    @type text: str
+    @rtype: list
+    '''
+    tokens = []
+    try:
+      for token in lexer(text):
+        tokens.append(token)
+    except ValueError as error:
+      tokens.append(('error', str(error)))
+    return tokens
+
+  def assertParity(self, text):
+    self.assertEquals(self.lex(regexeze_lexer.RegexezeLexer, text), self.lex(regexeze_lexer.ShlexLexer, text),
+                      'Lexers disagree on {0!r}'.format(text))
+
+  def testCorpusParity(self):
+    '''
+    Positive test: both lexers agree on every line, and on the whole text, of the test suite, README and test files
+    '''
+    for filename in self.CORPUS_FILE_NAMES:
+      with open(filename) as corpus:
+        text = corpus.read()
+      self.assertParity(text)
+      for line in text.splitlines(True):
+        self.assertParity(line)
+
+  def testQuotesAndEscapes(self):
+    '''
+    Positive test: quoted strings and escapes are joined to adjacent word characters
+    '''
+    self.assertEquals(list(regexeze_lexer.RegexezeLexer(r'''expr: a"b c"d\ e 'f\g' "h\"i";''')),
+                      ['expr', ':', 'ab cd e', 'f\\g', 'h"i', ';'])
+    self.assertEquals(list(regexeze_lexer.RegexezeLexer('expr: ""; # comment\nexpr: #;')), ['expr', ':', '', ';', 'expr', ':'])
+
+  def testUnterminatedInput(self):
+    '''
+    Negative test: unclosed quotes and trailing escapes raise the same errors as shlex
+    '''
+    for text in ['expr: "a;', "expr: 'a", 'expr: a\\', 'expr: "a\\', 'expr: a"b']:
+      self.assertParity(text)
+      self.assertRaises(ValueError, list, regexeze_lexer.RegexezeLexer(text))
+
+  def testLineLexer(self):
+    '''
+    Positive and negative test: lexing many lines at once gives the same tokens and errors as lexing each line on its own
+    '''
+    texts = ["expr: 'a\\\nb';\n", "expr: a\\\n'b';\n", "expr: 'a\nb';\n", 'expr: "a\\\nb";\n', "expr: a\\\n\\\n"]
+    with open(self.TEST_FILE_NAME) as corpus:
+      texts.append(corpus.read())
+    for text in texts:
+      self.assertEquals(self.lex(regexeze_lexer.RegexezeLineLexer, text), self.lex(regexeze_lexer.ShlexLineLexer, text),
+                        'Line lexers disagree on {0!r}'.format(text))
+    self.assertRaises(ValueError, list, regexeze_lexer.RegexezeLineLexer("expr: 'a\nb';\n"))
+
+  def testSelectableLexer(self):
+    '''
+    Positive test: both lexers give identical translations
+    '''
+    pattern = "expr: [ name: quote; expr: any_char of \"'\" or_of '\"';]; expr: alphanumeric for 0 up_to 10 not_greedy; expr: quote;"
+    translations = []
+    for lexer in [regexeze_lexer.REGEXEZE, regexeze_lexer.SHLEX]:
+      regexezeObject = regexeze.RegexezeObject(pattern, lexer=lexer)
+      regexezeObject.parse()
+      translations.append(regexezeObject.ret_val)
+    self.assertEquals(translations[0], translations[1])
+
+class ErrorTestCase(RegexezeTestCase):
+  '''
+  Test case for syntax errors, which point at the exact token the parser stopped at
+  '''
+  def parseError(self, pattern):
+    '''
+    Helper method for parsing a pattern with invalid syntax
+    @rtype: regexeze_errors.Error
+    '''
+    with self.assertRaises(regexeze_errors.Error) as context:
+      regexeze.translate(pattern)
+    return context.exception
+
+  def testLocation(self):
+    '''
+    Positive test: the offset, line and column of the token are exact, even after quoted strings and comments
+    '''
+    error = self.parseError("expr: \"a ; b\";  #expr: 'c'\n  expr: 'd' twice;")
+    self.assertIsInstance(error, regexeze_errors.InvalidModifierError)
+    self.assertEquals(error.code, 'invalid_modifier')
+    self.assertEquals(error.token, 'twice')
+    self.assertEquals((error.offset, error.line, error.column), (39, 2, 13))
+    self.assertTrue(str(error).startswith('Invalid modifier for an expression.'))
+    self.assertTrue(str(error).endswith("\n  expr: 'd' twice;\n            ^"))
+
+  def testEndOfInput(self):
+    '''
+    Positive test: errors at the end of the input point just past it
+    '''
+    error = self.parseError("expr: 'a'")
+    self.assertEquals(error.code, 'incomplete_expression')
+    self.assertEquals((error.offset, error.line, error.column), (9, 1, 10))
+    self.assertEquals(str(error), error.message + "\nexpr: 'a'\n         ^")
+
+  def testFileInput(self):
+    '''
+    Positive test: errors in files point at their line
+    '''
+    with self.assertRaises(regexeze_errors.IncompleteExpressionError) as context:
+      regexeze.translate(source=self.TEST_ERROR_FILE_NAME)
+    self.assertTrue(context.exception.lines)
+    self.assertEquals((context.exception.line, context.exception.column), (3, 1))
+
+  def testDetails(self):
+    '''
+    Positive test: messages naming the token or the nesting limit are written from the error
+    '''
+    error = self.parseError("expr: [ name: digit; expr: 'a'; ];")
+    self.assertEquals(error.code, 'invalid_group_name')
+    self.assertTrue(str(error).startswith('Invalid group name: <digit>'))
+    self.assertEquals(error.column, 15)
+
+  def testNoParserKept(self):
+    '''
+    Positive test: errors keep neither the parser nor a message until one is asked for, and survive pickling
+    '''
+    results = regexeze.translate_many(["expr: 'a'", "expr: 'b';", "expr: 'c' twice;"])
+    errors = [results[0], results[2]]
+    self.assertEquals([error.args for error in errors], [(), ()])
+    self.assertEquals([error.token_offset for error in errors], [None, None])
+    self.assertEquals([(error.index, error.offset) for error in errors], [(0, 9), (2, 10)])
+    restored = pickle.loads(pickle.dumps(errors[1]))
+    self.assertIsInstance(restored, regexeze_errors.InvalidModifierError)
+    self.assertEquals(str(restored), str(errors[1]))
+
+class GrepTestCase(RegexezeTestCase):
+  '''
+  Test case for searching streams of records (regexeze_grep and the grep subcommand)
+  '''
+  PATTERN = "expr: [ name: number; expr: digit for one_or_more; ]; expr: ' ' for zero_or_one; expr: [ name: word; expr: alphanumeric for zero_or_more; ];"
+  INPUT = 'foo 12 bar\nnothing\nbaz 345\n'
+
+  def setUp(self):
+    self.pattern = regexeze.compile(self.PATTERN, capture=False)
+    self.out = StringIO()
+
+  def grep(self, **options):
+    regexeze_grep.Grep(self.pattern, output_file=self.out, **options).search(StringIO(self.INPUT), 'input')
+    return self.out.getvalue()
+
+  def testReadRecords(self):
+    for read_size in [1, 2, 3, 100]:
+      self.assertEquals(list(regexeze_grep.read_records(StringIO(self.INPUT), read_size=read_size)), ['foo 12 bar', 'nothing', 'baz 345'])
+      self.assertEquals(list(regexeze_grep.read_records(StringIO('a||bc||||d'), '||', read_size)), ['a', 'bc', '', 'd'])
+    self.assertEquals(list(regexeze_grep.read_records(StringIO(''))), [])
+
+  def testLines(self):
+    self.assertEquals(self.grep(), 'foo 12 bar\nbaz 345\n')
+
+  def testMatches(self):
+    self.assertEquals(self.grep(output=regexeze_grep.MATCHES, show_names=True, show_numbers=True), 'input:1:12 bar\ninput:3:345\n')
+
+  def testMatchesCountRecords(self):
+    '''
+    Positive test: records with several matches are written match by match, but counted once
+    '''
+    grep = regexeze_grep.Grep(self.pattern, regexeze_grep.MATCHES, output_file=self.out)
+    self.assertEquals(grep.search(StringIO('1 a 2 b\nnothing\n3\n')), 2)
+    self.assertEquals(self.out.getvalue(), '1 a\n2 b\n3\n')
+
+  def testCount(self):
+    self.assertEquals(self.grep(output=regexeze_grep.COUNT), '2\n')
+
+  def testGroups(self):
+    self.assertEquals(self.grep(output=regexeze_grep.GROUPS), 'number=12\tword=bar\nnumber=345\tword=\n')
+
+  def testJson(self):
+    lines = self.grep(output=regexeze_grep.GROUPS, format=regexeze_grep.JSON).splitlines()
+    self.assertEquals(json.loads(lines[0]), {'record': 1, 'groups': {'number': '12', 'word': 'bar'}})
+    self.assertEquals(len(lines), 2)
+
+  def testBatchedWrites(self):
+    self.assertEquals(self.grep(write_size=1), 'foo 12 bar\nbaz 345\n')
+
+  def testGrepMain(self):
+    directory = tempfile.mkdtemp()
+    try:
+      filename = os.path.join(directory, 'input.txt')
+      with open(filename, 'w') as input_file:
+        input_file.write(self.INPUT)
+      args = regexeze_argparser.RegexezeArgparser().parser.parse_args(['grep', '-p', self.PATTERN, '-o', 'count', filename, filename])
+      saved_stdout = sys.stdout
+      sys.stdout = self.out
+      try:
+        self.assertEquals(regexeze.main(args), 0)
+        args.pattern = "expr: 'zz';"
+        self.assertEquals(regexeze.main(args), 1)
+      finally:
+        sys.stdout = saved_stdout
+      self.assertEquals(self.out.getvalue(), '{0}:2\n{0}:2\n{0}:0\n{0}:0\n'.format(filename))
+    finally:
+      shutil.rmtree(directory)
+
+  def testRecordSeparatorOption(self):
+    '''
+    Positive and negative test: the record separator is given with Python escapes, and may not be empty
+    '''
+    parser = regexeze_argparser.RegexezeArgparser().parser
+    self.assertEquals(parser.parse_args(['grep', '-p', self.PATTERN]).record_separator, '\n')
+    self.assertEquals(parser.parse_args(['grep', '-p', self.PATTERN, '-r', '\\0']).record_separator, '\0')
+    saved_stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+      for separator in ['', '\\x', '\\']:
+        self.assertRaises(SystemExit, parser.parse_args, ['grep', '-p', self.PATTERN, '-r', separator])
+      self.assertIn('the record separator must not be empty', sys.stderr.getvalue())
+    finally:
+      sys.stderr = saved_stderr
+
+class PackTestCase(RegexezeTestCase):
+  '''
+  Test case for building rule packs from pattern files and loading them
+  '''
+  PATTERN = "expr: 'GET '; expr: [ name: path; expr: any_char except ' ' for one_or_more; ];"
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.sources = os.path.join(self.directory, 'rules')
+    os.makedirs(os.path.join(self.sources, 'web'))
+    with open(os.path.join(self.sources, 'web', 'get.rgxz'), 'w') as pattern_file:
+      pattern_file.write(self.PATTERN + '\n')
+    with open(os.path.join(self.sources, 'notes.txt'), 'w') as other_file:
+      other_file.write('not a pattern')
+    self.pack = os.path.join(self.directory, 'rules.rgxp')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testBuildAndLoad(self):
+    '''
+    Positive test: rules are named after their files, and come back from the pack as they were compiled
+    '''
+    self.assertEquals(regexeze.build_pack([self.sources, self.TEST_FILE_NAME], self.pack), 2)
+    rules = regexeze.load_pack(self.pack)
+    self.assertEquals(list(rules), ['web/get', 'test_file'])
+    self.assertEquals(rules.version, regexeze.__version__)
+    self.assertEquals(rules.source('test_file'), self.TEST_FILE_NAME)
+    self.assertEquals(rules['test_file'].pattern, self.FILE_TRANSLATION)
+    compiled = regexeze.compile(self.PATTERN)
+    loaded = rules['web/get']
+    self.assertEquals((loaded.pattern, loaded.namespace, loaded.required_literals), (compiled.pattern, compiled.namespace, compiled.required_literals))
+    self.assertEquals(loaded.search('x GET /index.html y').group('path'), '/index.html')
+    self.assertIn('web/get', rules)
+    self.assertNotIn('web/post', rules)
+    self.assertRaises(KeyError, lambda: rules['web/post'])
+
+  def testLazyCompilation(self):
+    '''
+    Positive test: loading compiles nothing, and rules are compiled once, when first looked up
+    '''
+    regexeze.build_pack([self.sources, self.TEST_FILE_NAME], self.pack, flags=re.IGNORECASE)
+    rules = regexeze.load_pack(self.pack)
+    self.assertEquals(rules.compiled, {})
+    self.assertIs(rules['web/get'], rules['web/get'])
+    self.assertEquals(rules.compiled.keys(), [0])
+    self.assertEquals(rules.unused(), 2)
+    rules['web/get'].search('GET /')
+    self.assertEquals(rules.unused(), 1)
+    self.assertEquals(rules['web/get'].flags, re.IGNORECASE)
+    self.assertEquals(rules['web/get'].required_literals, ())
+
+  def testDuplicateRule(self):
+    '''
+    Negative test: two files for the same rule
+    '''
+    self.assertRaises(regexeze_pack.DuplicateRuleError, regexeze.build_pack, [self.TEST_FILE_NAME, self.TEST_FILE_NAME], self.pack)
+    self.assertFalse(os.path.exists(self.pack))
+
+  def testInvalidRule(self):
+    '''
+    Negative test: the error of a pattern file with invalid syntax tells the file
+    '''
+    try:
+      regexeze.build_pack([self.sources, self.TEST_ERROR_FILE_NAME], self.pack)
+      self.fail('Should raise an error')
+    except regexeze_errors.IncompleteExpressionError as error:
+      self.assertEquals((error.index, error.source), (1, self.TEST_ERROR_FILE_NAME))
+    self.assertFalse(os.path.exists(self.pack))
+
+  def testNotAPack(self):
+    '''
+    Negative test: files which are not packs, or are cut short
+    '''
+    self.assertRaises(regexeze_pack.PackFormatError, regexeze.load_pack, self.TEST_FILE_NAME)
+    regexeze.build_pack([self.sources], self.pack)
+    with open(self.pack, 'rb') as pack_file:
+      data = pack_file.read()
+    with open(self.pack, 'wb') as pack_file:
+      pack_file.write(data[:len(data) // 2])
+    self.assertRaises(regexeze_pack.PackFormatError, regexeze.load_pack, self.pack)
+
+  def testBuildMain(self):
+    args = regexeze_argparser.RegexezeArgparser().parser.parse_args(['build', '--no-capture', '-o', self.pack, self.sources])
+    saved_stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+      self.assertEquals(regexeze.main(args), 0)
+    finally:
+      sys.stdout = saved_stdout
+    self.assertEquals(regexeze.load_pack(self.pack)['web/get'].pattern, regexeze.translate(self.PATTERN, capture=False))
+
+  def testBuildMainErrors(self):
+    '''
+    Negative test: an unterminated quote and two files for the same rule are reported with their file, not raised
+    '''
+    source = os.path.join(self.sources, 'web', 'post.rgxz')
+    with open(source, 'w') as pattern_file:
+      pattern_file.write("expr: 'POST\n")
+    parser = regexeze_argparser.RegexezeArgparser().parser
+    for paths, message in [([self.sources], "{0}: No closing quotation\nexpr: 'POST\n      ^\n".format(source)),
+                           ([self.TEST_FILE_NAME, self.TEST_FILE_NAME], "{0}: More than one pattern file for rule 'test_file'\n".format(self.TEST_FILE_NAME))]:
+      saved_stderr = sys.stderr
+      sys.stderr = StringIO()
+      try:
+        self.assertEquals(regexeze.main(parser.parse_args(['build', '-o', self.pack] + paths)), 1)
+        self.assertEquals(sys.stderr.getvalue(), message)
+      finally:
+        sys.stderr = saved_stderr
+      self.assertFalse(os.path.exists(self.pack))
+
+class ImportTestCase(RegexezeTestCase):
+  '''
+  Test case for the modules loaded by importing regexeze
+  '''
+  #only needed by grep, packs, the optimizer and the disk cache, which import them when used
+  DEFERRED_MODULES = ['json', 'mmap', 'hashlib', 'regexeze_grep', 'regexeze_pack', 'regexeze_optimizer']
+
+  def testImportDefersModules(self):
+    '''
+    Positive test: a fresh interpreter importing regexeze loads none of the deferred modules
+    '''
+    statement = 'import sys, regexeze; print " ".join(name for name in {0!r} if name in sys.modules)'.format(self.DEFERRED_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', statement], cwd=os.path.dirname(os.path.abspath(__file__)))
+    self.assertEquals(output.strip(), '')
+
+class ScanFileTestCase(RegexezeTestCase):
+  '''
+  Test case for searching whole files through memory maps
+  '''
+  PATTERN = "set_flags: any_char_all; expr: 'BEGIN'; expr: [ name: body; expr: any_char for zero_or_more not_greedy; ]; expr: 'END';"
+  TEXT = 'BEGIN\nx\nEND\nfoo\nBEGIN\ny\nEND\n'
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.filename = os.path.join(self.directory, 'input.txt')
+    with open(self.filename, 'w') as input_file:
+      input_file.write(self.TEXT)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testScanFile(self):
+    matches = list(regexeze.scan_file(self.PATTERN, self.filename, capture=False))
+    self.assertEquals(matches, [regexeze_grep.ScanMatch(0, 11, 'BEGIN\nx\nEND', ('\nx\n',), {'body': '\nx\n'}),
+                                regexeze_grep.ScanMatch(16, 27, 'BEGIN\ny\nEND', ('\ny\n',), {'body': '\ny\n'})])
+    self.assertEquals([match.match for match in regexeze.scan_file(self.PATTERN, self.filename)],
+                      [match.group() for match in regexeze.compile(self.PATTERN).finditer(self.TEXT)])
+
+  def testRequiredLiterals(self):
+    self.assertEquals(list(regexeze.scan_file("expr: 'MISSING';", self.filename)), [])
+    self.assertEquals(list(regexeze.scan_file("expr: 'MISSING';", self.filename, workers=1)), [])
+    self.assertEquals(list(regexeze_grep.scan_buffer(re.compile('x'), 'xyz', required_literals=('yz',))), [regexeze_grep.ScanMatch(0, 1, 'x', (), {})])
+    self.assertEquals(list(regexeze_grep.scan_buffer(re.compile('x'), 'xyyz', 0, 1, 2, ('yz',))), [])
+
+  def testLazy(self):
+    matches = regexeze.scan_file(self.PATTERN, self.filename)
+    self.assertEquals(next(matches).start, 0)
+    matches.close()
+
+  def testEmptyFile(self):
+    open(self.filename, 'w').close()
+    self.assertEquals(list(regexeze.scan_file("expr: 'a';", self.filename)), [])
+    self.assertEquals([(match.start, match.end) for match in regexeze.scan_file("expr: 'a' for zero_or_one;", self.filename)], [(0, 0)])
+
+  def testChunkRanges(self):
+    self.assertEquals(regexeze_grep.chunk_ranges(self.TEXT, 5), [(0, 6), (6, 12), (12, 22), (22, 28)])
+    self.assertEquals(regexeze_grep.chunk_ranges(self.TEXT, 1000), [(0, 28)])
+    self.assertEquals(regexeze_grep.chunk_ranges('a||b||c', 1, '||'), [(0, 3), (3, 6), (6, 7)])
+    self.assertEquals(regexeze_grep.chunk_ranges(''), [])
+
+  def testParallel(self):
+    for chunk_size in [1, 5, 12, 1000]:
+      self.assertEquals(list(regexeze.scan_file(self.PATTERN, self.filename, workers=2, chunk_size=chunk_size)),
+                        list(regexeze.scan_file(self.PATTERN, self.filename)))
+
+  def testParallelMatchAcrossRanges(self):
+    #matches run across the ranges, and one of them swallows the start of the next match found in its range
+    pattern = "set_flags: any_char_all; expr: 'B'; expr: any_char for zero_or_more not_greedy; expr: 'E';"
+    with open(self.filename, 'w') as input_file:
+      input_file.write('B\nB\nE\nE\nB\n\nE\n')
+    matches = [(match.start, match.end) for match in regexeze.scan_file(pattern, self.filename)]
+    self.assertEquals(matches, [(0, 5), (8, 12)])
+    self.assertEquals([(match.start, match.end) for match in regexeze.scan_file(pattern, self.filename, workers=2, chunk_size=1)], matches)
+    #matches running further than the overlap past their range are still found
+    self.assertEquals([(match.start, match.end) for match in regexeze.scan_file(pattern, self.filename, workers=2, chunk_size=1, overlap=1)], matches)
+
+  def testParallelMatchLongerThanOverlap(self):
+    '''
+    Positive test: matches longer than the overlap, running across ranges, are found whole, and are not found where the end of
+    the searched window would end them
+    '''
+    with open(self.filename, 'w') as input_file:
+      input_file.write('x\n' + 'B' + 'a' * 40 + '\n' + 'a' * 40 + '\nE\nBa\nx\n')
+    for pattern in [self.PATTERN.replace("'BEGIN'", "'B'").replace("'END'", "'E'"),
+                    "set_flags: any_char_all; expr: 'B'; expr: any_char except 'x' for zero_or_more;",
+                    "expr: 'a' for 1 up_to 30; expr: end_of_string;"]:
+      matches = list(regexeze.scan_file(pattern, self.filename))
+      self.assertEquals(list(regexeze.scan_file(pattern, self.filename, workers=2, chunk_size=10, overlap=4)), matches)
+    #the last pattern matches nowhere in the file, only at the end of a window
+    self.assertEquals(matches, [])
+
+  def testMatchAsLongAsOverlap(self):
+    '''
+    Negative test: a match as long as the overlap is not found where the window would end right after it
+    '''
+    regex = re.compile(r'ab$')
+    buffer = 'xab\nzzzz'
+    self.assertEquals([match.span() for match in regex.finditer(buffer)], [])
+    self.assertEquals([(match.start, match.end) for match in regexeze_grep.scan_buffer(regex, buffer, 0, 2, overlap=2)], [])
+
+  def testMaxMatchWidth(self):
+    self.assertEquals(regexeze_grep.max_match_width(re.compile('ab?c{2,3}')), 5)
+    self.assertEquals(regexeze_grep.max_match_width(re.compile('ab*')), None)
+    self.assertEquals(regexeze_grep.max_match_width(re.compile('(?P<a>a)(?P=a)')), None)
+
+  def testGrepWholeFile(self):
+    out = StringIO()
+    grep = regexeze_grep.Grep(regexeze.compile(self.PATTERN, capture=False), regexeze_grep.GROUPS, output_file=out, show_numbers=True, whole_file=True)
+    self.assertEquals(grep.search_files([self.filename]), 2)
+    self.assertEquals(out.getvalue(), '0:body=\nx\n\n16:body=\ny\n\n')
+
 class RegexezeSubparserTest(RegexezeTestCase):
   '''
   Test case for testing the command line subparsers
@@ -1380,6 +2608,24 @@ class MatchSubparserTest(RegexezeTargetStringSubparserTest):
 
 #list of all test cases
 TEST_CASES = [test_regex_parser_machine,\
+              OptimizerTestCase,\
+              AstTestCase,\
+              NonCapturingTestCase,\
+              RuleSetTestCase,\
+              TransitionTableTestCase,\
+              NestingDepthTestCase,\
+              ThreadSafetyTestCase,\
+              PatternCacheTestCase,\
+              RegexezeCacheTestCase,\
+              BatchTestCase,\
+              DiskCacheTestCase,\
+              RegexezePatternTestCase,\
+              LexerTestCase,\
+              ErrorTestCase,\
+              GrepTestCase,\
+              ScanFileTestCase,\
+              ImportTestCase,\
+              PackTestCase,\
               FileInputTestCase,\
               StdinTestCase,\
               TranslateSubparserTest,\